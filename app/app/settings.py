@@ -154,6 +154,14 @@ REST_FRAMEWORK = {
     "DEFAULT_THROTTLE_RATES": {"anon": "10/minute", "user": "100/minute"},
 }
 
+# Pagination of list endpoints, see common/pagination/paginator.py
+# items of a page when ?limit= is not sent, and the most a page can have
+PAGINATION_DEFAULT_LIMIT = int(os.environ.get("PAGINATION_DEFAULT_LIMIT", 50))
+PAGINATION_MAX_LIMIT = int(os.environ.get("PAGINATION_MAX_LIMIT", 200))
+# lists up to this many items are counted, the total of longer ones is the
+# estimate of the query planner
+PAGINATION_EXACT_TOTAL_MAX = int(os.environ.get("PAGINATION_EXACT_TOTAL_MAX", 1000))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -172,3 +180,67 @@ SIMPLE_JWT = {
 SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True,
 }
+
+# Webcrawler
+ISC_CRAWLER_MAX_WORKERS = int(os.environ.get("ISC_CRAWLER_MAX_WORKERS", 4))
+ISC_CRAWLER_PARSER = os.environ.get("ISC_CRAWLER_PARSER", "single_pass")
+# consecutive known result pages that stop an incremental crawl
+ISC_CRAWLER_KNOWN_PAGES_TO_STOP = int(
+    os.environ.get("ISC_CRAWLER_KNOWN_PAGES_TO_STOP", 2)
+)
+# searches with more result pages are split by price range, 0 disables it
+ISC_CRAWLER_SHARD_PAGES = int(os.environ.get("ISC_CRAWLER_SHARD_PAGES", 10))
+# agencies kept in memory by profile URL in every worker process
+ISC_AGENCY_CACHE_SIZE = int(os.environ.get("ISC_AGENCY_CACHE_SIZE", 1024))
+# fetch, parse and write result pages at the same time, see search/pipeline.py
+ISC_CRAWLER_PIPELINE = os.environ.get("ISC_CRAWLER_PIPELINE", "") == "true"
+# worker processes parsing result pages, 0 parses them in a thread
+ISC_PIPELINE_PARSE_PROCESSES = int(os.environ.get("ISC_PIPELINE_PARSE_PROCESSES", 2))
+# pages waiting between two stages before the previous one is held back
+ISC_PIPELINE_QUEUE_SIZE = int(os.environ.get("ISC_PIPELINE_QUEUE_SIZE", 8))
+# result pages stored per transaction
+ISC_PIPELINE_WRITE_BATCH_PAGES = int(
+    os.environ.get("ISC_PIPELINE_WRITE_BATCH_PAGES", 5)
+)
+# result pages crawled at a time in lazy mode, the next ones are crawled once
+# the user gets near the last results, 0 crawls every page at once
+ISC_CRAWLER_LAZY_PAGES = int(os.environ.get("ISC_CRAWLER_LAZY_PAGES", 0))
+# results left to see that trigger the crawl of the next pages
+ISC_CRAWLER_LAZY_PREFETCH_RESULTS = int(
+    os.environ.get("ISC_CRAWLER_LAZY_PREFETCH_RESULTS", 20)
+)
+
+# Search results reuse
+# results of a finished search of the same filter are copied instead of crawled
+ISC_SEARCH_RESULTS_FRESH_SECONDS = int(
+    os.environ.get("ISC_SEARCH_RESULTS_FRESH_SECONDS", 3600)
+)
+# after that, stale results are copied for this long while the search of the
+# copy is refreshed by an incremental crawl, 0 disables it
+ISC_SEARCH_RESULTS_STALE_SECONDS = int(
+    os.environ.get("ISC_SEARCH_RESULTS_STALE_SECONDS", 0)
+)
+
+# searches of cities whose catalog was crawled within this time are answered
+# from the stored real estates, 0 disables it
+ISC_CATALOG_FRESH_SECONDS = int(os.environ.get("ISC_CATALOG_FRESH_SECONDS", 86400))
+
+# Radar percolator
+# new real estates of a crawl are added to the radars they match, with an index
+# of every radar rebuilt after this time, 0 disables it
+RADAR_PERCOLATOR_REFRESH_SECONDS = int(
+    os.environ.get("RADAR_PERCOLATOR_REFRESH_SECONDS", 60)
+)
+
+# Crawl workers
+# crawl workers started by every crawl_worker command
+ISC_CRAWL_WORKERS = int(os.environ.get("ISC_CRAWL_WORKERS", 2))
+# a running job without heartbeat for this long is claimed by another worker
+ISC_CRAWL_JOB_LEASE_SECONDS = int(os.environ.get("ISC_CRAWL_JOB_LEASE_SECONDS", 120))
+ISC_CRAWL_JOB_HEARTBEAT_SECONDS = int(
+    os.environ.get("ISC_CRAWL_JOB_HEARTBEAT_SECONDS", 30)
+)
+# crawls of a job before it is marked as failed
+ISC_CRAWL_JOB_MAX_ATTEMPTS = int(os.environ.get("ISC_CRAWL_JOB_MAX_ATTEMPTS", 3))
+# wait between claims while the queue is empty
+ISC_CRAWL_JOB_POLL_SECONDS = float(os.environ.get("ISC_CRAWL_JOB_POLL_SECONDS", 2))
@@ -0,0 +1,201 @@
+"""
+Keyset pagination of list endpoints. A page is the rows after the last row of
+the previous page in a fixed ordering, found through an index, so the query of
+a page costs the same no matter how deep in the list it is. The total is
+counted up to PAGINATION_EXACT_TOTAL_MAX and estimated by the query planner
+above that.
+"""
+
+import base64
+import binascii
+import json
+import math
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+from common.errors.errors import DeserializationError
+
+
+def encode_key_value(value: Any) -> Any:
+    # isoformat keeps the microseconds, rows of a page may differ only by them
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def encode_cursor(page: int, key: List[Any]) -> str:
+    data = json.dumps({"page": page, "key": [encode_key_value(v) for v in key]})
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, key_length: int) -> Tuple[int, List[Any]]:
+    """Page number and ordering key of the last row of the previous page"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        page = int(data["page"])
+        key = list(data["key"])
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeError):
+        raise DeserializationError({"cursor": ["Invalid cursor."]})
+
+    if page < 1 or len(key) != key_length:
+        raise DeserializationError({"cursor": ["Invalid cursor."]})
+
+    return page, key
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """Rows the query planner expects the queryset to return"""
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_total(queryset: QuerySet, exact_max: int) -> Tuple[int, bool]:
+    """Total of the queryset and whether it is estimated"""
+    counted = queryset.order_by()[: exact_max + 1].count()
+    if counted <= exact_max:
+        return counted, False
+
+    return max(estimate_count(queryset), counted), True
+
+
+@dataclass
+class Page:
+    items: List[Any]
+    page: int
+    per_page: int
+    # cursor of the next page, None on the last page
+    next_cursor: Optional[str]
+    total: int
+    total_estimated: bool
+
+    def get_meta(self) -> Dict:
+        return {
+            "total": self.total,
+            "page": self.page,
+            "per_page": self.per_page,
+            "total_pages": math.ceil(self.total / self.per_page),
+            "next_cursor": self.next_cursor,
+            "total_estimated": self.total_estimated,
+        }
+
+
+class KeysetPaginator:
+    """
+    Pages of a queryset in the order of the ordering fields, the last one must
+    be unique and none can be null. An index on the filtered fields followed by
+    the ordering fields makes every page a short index range scan.
+    Related objects in select_related and the fields in only are loaded for the
+    rows of the page alone, the total is counted without them.
+    """
+
+    def __init__(
+        self,
+        ordering: Sequence[str],
+        select_related: Sequence[str] = (),
+        only: Sequence[str] = (),
+    ):
+        self.ordering = list(ordering)
+        self.fields = [name.lstrip("-") for name in self.ordering]
+        self.descending = [name.startswith("-") for name in self.ordering]
+        self.select_related = list(select_related)
+        self.only = list(only)
+        if self.only:
+            self.only += [name for name in self.fields if name not in self.only]
+
+    def get_after_condition(self, key: List[Any]) -> Q:
+        """Rows after the row with this ordering key"""
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            lookup = "lt" if self.descending[i] else "gt"
+            field_condition = Q(**{f"{name}__{lookup}": key[i]})
+            for j in range(i):
+                field_condition &= Q(**{self.fields[j]: key[j]})
+            condition |= field_condition
+
+        # the bound on the first field alone starts the index scan at the key
+        first_lookup = "lte" if self.descending[0] else "gte"
+        return Q(**{f"{self.fields[0]}__{first_lookup}": key[0]}) & condition
+
+    def get_limit(self, params: Dict) -> int:
+        return min(
+            params.get("limit") or settings.PAGINATION_DEFAULT_LIMIT,
+            settings.PAGINATION_MAX_LIMIT,
+        )
+
+    def get_position(self, params: Optional[Dict] = None) -> Optional[int]:
+        """
+        Index of the last row of the page requested with the cursor of the
+        query params, None without a cursor. An invalid cursor raises
+        DeserializationError.
+        """
+        params = params or {}
+        cursor = params.get("cursor")
+        if not cursor:
+            return None
+
+        page, _ = decode_cursor(cursor, len(self.fields))
+        return (page + 1) * self.get_limit(params) - 1
+
+    def paginate(self, queryset: QuerySet, params: Optional[Dict] = None) -> Page:
+        """
+        Page of the queryset for the cursor, limit and total query params. An
+        invalid cursor raises DeserializationError.
+        """
+        params = params or {}
+        limit = self.get_limit(params)
+
+        page = 1
+        rows = queryset
+        cursor = params.get("cursor")
+        if cursor:
+            page, key = decode_cursor(cursor, len(self.fields))
+            page += 1
+            try:
+                rows = rows.filter(self.get_after_condition(key))
+            except ValidationError:
+                raise DeserializationError({"cursor": ["Invalid cursor."]})
+
+        if self.select_related:
+            rows = rows.select_related(*self.select_related)
+        if self.only:
+            rows = rows.only(*self.only)
+        items = list(rows.order_by(*self.ordering)[: limit + 1])
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last_key = [getattr(items[-1], name) for name in self.fields]
+            next_cursor = encode_cursor(page, last_key)
+
+        total, total_estimated = 0, False
+        if params.get("total", True):
+            total, total_estimated = count_total(
+                queryset, settings.PAGINATION_EXACT_TOTAL_MAX
+            )
+            # never less than the rows of this page and the ones before it
+            total = max(total, (page - 1) * limit + len(items))
+
+        return Page(
+            items=items,
+            page=page,
+            per_page=limit,
+            next_cursor=next_cursor,
+            total=total,
+            total_estimated=total_estimated,
+        )
@@ -8,6 +8,10 @@ class PaginationMetadataSerializer(serializers.Serializer):
     page = serializers.IntegerField(min_value=0)
     per_page = serializers.IntegerField(min_value=0)
     total_pages = serializers.IntegerField(min_value=0)
+    # cursor of the next page, null on the last page
+    next_cursor = serializers.CharField(allow_null=True)
+    # total is an estimate of the query planner for long lists
+    total_estimated = serializers.BooleanField()
 
 
 class PaginationSerializer(serializers.Serializer):
@@ -15,3 +19,12 @@ class PaginationSerializer(serializers.Serializer):
 
     data = None
     meta = PaginationMetadataSerializer()
+
+
+class PaginationParamsSerializer(serializers.Serializer):
+    """Query params of paginated lists"""
+
+    cursor = serializers.CharField(max_length=500, required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+    # counting the total can be skipped while scrolling through the pages
+    total = serializers.BooleanField(default=True)
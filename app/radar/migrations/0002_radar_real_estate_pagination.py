@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('radar', '0001_initial'),
+        ('real_estate', '0013_realestate_catalog_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='radarrealestate',
+            index=models.Index(fields=['radar', 'preference', 'created_at', 'id'], name='radar_real_estate_page_idx'),
+        ),
+    ]
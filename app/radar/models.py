@@ -39,3 +39,12 @@ class RadarRealEstate(models.Model):
     preference = models.CharField(
         max_length=10, choices=Preference, default=Preference.PENDING
     )
+
+    class Meta:
+        indexes = [
+            # pages of the real estates of a radar by preference
+            models.Index(
+                fields=["radar", "preference", "created_at", "id"],
+                name="radar_real_estate_page_idx",
+            ),
+        ]
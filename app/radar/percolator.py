@@ -0,0 +1,232 @@
+"""
+Reverse matching of real estates against the filters of every radar. Filters
+are compiled once into buckets by city, neighborhood, transaction type and
+property type, a new real estate is only compared with the radars of its own
+buckets.
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from django.conf import settings
+
+from radar.models import Radar, RadarRealEstate
+from real_estate.models import RealEstate
+from search.models import Filter, normalize_place_name, quantity_options
+
+# a mask with every bit set matches any quantity
+ANY_MASK = -1
+
+
+def quantity_mask(quantities: List[int]) -> int:
+    """Bits of the quantity options of a filter, bit 5 is 5 or more"""
+    options = quantity_options(quantities)
+    if options is None:
+        return ANY_MASK
+
+    mask = 0
+    for option in options:
+        mask |= 1 << option
+    return mask
+
+
+def quantity_bit(quantity: int) -> int:
+    return 1 << min(max(quantity, 0), 5)
+
+
+def bucket_keys(filter_obj: Filter) -> List[Tuple[str, str, str, str]]:
+    """
+    City, neighborhood, transaction type and property type of every bucket of
+    the filter. No neighborhoods is the whole city, kept under an empty name,
+    no types are all of them.
+    """
+    cities = {normalize_place_name(name) for name in filter_obj.city}
+    neighborhoods = {
+        normalize_place_name(name) for name in filter_obj.neighborhood
+    } or {""}
+    transaction_types = set(
+        filter_obj.transaction_type or RealEstate.TransactionType.values
+    )
+    property_types = set(filter_obj.property_type or RealEstate.PropertyType.values)
+
+    return [
+        (city, neighborhood, transaction_type, property_type)
+        for city in cities
+        for neighborhood in neighborhoods
+        for transaction_type in transaction_types
+        for property_type in property_types
+    ]
+
+
+class RadarBucket:
+    """
+    Radars of a bucket sorted by minimum price, the radars whose price range
+    starts above the price of a real estate are never looked at.
+    """
+
+    __slots__ = ["min_prices", "rows"]
+
+    def __init__(self, rows: List[tuple]):
+        rows.sort(key=lambda row: row[0])
+        self.min_prices = [row[0] for row in rows]
+        # min price, max price, min area, max area, bedroom mask, suite mask,
+        # garage mask, radar id
+        self.rows = rows
+
+    def match(
+        self,
+        price: float,
+        area: float,
+        bedroom_bit: int,
+        suite_bit: int,
+        garage_bit: int,
+        matches: List[UUID],
+    ) -> None:
+        rows = self.rows
+        for i in range(bisect_right(self.min_prices, price)):
+            row = rows[i]
+            if (
+                price <= row[1]
+                and row[2] <= area <= row[3]
+                and row[4] & bedroom_bit
+                and row[5] & suite_bit
+                and row[6] & garage_bit
+            ):
+                matches.append(row[7])
+
+
+class RadarPercolator:
+    """
+    In memory index of radar filters. Built from (radar id, filter) pairs,
+    read only after that so it can be shared by the threads of a process.
+    """
+
+    def __init__(self, radar_filters: Iterable[Tuple[UUID, Filter]]):
+        rows_by_key: Dict[Tuple[str, str, str, str], List[tuple]] = {}
+        self.radars = 0
+
+        for radar_id, filter_obj in radar_filters:
+            row = (
+                filter_obj.min_price,
+                filter_obj.max_price,
+                filter_obj.min_area,
+                filter_obj.max_area,
+                quantity_mask(filter_obj.bedroom_quantity),
+                quantity_mask(filter_obj.suite_quantity),
+                quantity_mask(filter_obj.garage_slots_quantity),
+                radar_id,
+            )
+            for key in bucket_keys(filter_obj):
+                rows_by_key.setdefault(key, []).append(row)
+
+            self.radars += 1
+
+        self.buckets = {key: RadarBucket(rows) for key, rows in rows_by_key.items()}
+
+    def match(self, real_estate: RealEstate) -> List[UUID]:
+        """Ids of the radars whose filter finds the real estate"""
+        matches = []
+        if not real_estate.available:
+            return matches
+
+        city = normalize_place_name(real_estate.city)
+        neighborhood = normalize_place_name(real_estate.neighborhood)
+        neighborhoods = [""]
+        if neighborhood:
+            neighborhoods.append(neighborhood)
+
+        for neighborhood in neighborhoods:
+            bucket = self.buckets.get(
+                (
+                    city,
+                    neighborhood,
+                    real_estate.transaction_type,
+                    real_estate.property_type,
+                )
+            )
+            if bucket is not None:
+                bucket.match(
+                    real_estate.price,
+                    real_estate.area,
+                    quantity_bit(real_estate.bedroom_quantity),
+                    quantity_bit(real_estate.suite_quantity),
+                    quantity_bit(real_estate.garage_slots_quantity),
+                    matches,
+                )
+
+        return matches
+
+
+# percolator of the radars, built on first use and again once it is too old
+radar_percolator: Optional[RadarPercolator] = None
+radar_percolator_built_at = 0.0
+radar_percolator_lock = threading.Lock()
+
+
+def get_radar_percolator() -> RadarPercolator:
+    """Percolator of every radar, rebuilt every RADAR_PERCOLATOR_REFRESH_SECONDS"""
+    global radar_percolator, radar_percolator_built_at
+
+    with radar_percolator_lock:
+        age = time.monotonic() - radar_percolator_built_at
+        if radar_percolator is None or age > settings.RADAR_PERCOLATOR_REFRESH_SECONDS:
+            radars = Radar.objects.select_related("search__filter").iterator(
+                chunk_size=2000
+            )
+            radar_percolator = RadarPercolator(
+                (radar.id, radar.search.filter) for radar in radars
+            )
+            radar_percolator_built_at = time.monotonic()
+
+        return radar_percolator
+
+
+def clear_radar_percolator() -> None:
+    global radar_percolator
+
+    with radar_percolator_lock:
+        radar_percolator = None
+
+
+def percolate_real_estates(real_estates: List[RealEstate]) -> int:
+    """
+    Add real estates to the radars whose filter finds them, in bulk. Returns
+    how many were added.
+    """
+    if settings.RADAR_PERCOLATOR_REFRESH_SECONDS <= 0 or len(real_estates) == 0:
+        return 0
+
+    percolator = get_radar_percolator()
+    matches = {
+        (radar_id, real_estate.id)
+        for real_estate in real_estates
+        for radar_id in percolator.match(real_estate)
+    }
+    if len(matches) == 0:
+        return 0
+
+    # radars deleted since the percolator was built are skipped, a radar may
+    # have the real estate already, from its search
+    radar_ids = set(
+        Radar.objects.filter(id__in={radar_id for radar_id, _ in matches}).values_list(
+            "id", flat=True
+        )
+    )
+    existing = set(
+        RadarRealEstate.objects.filter(
+            radar_id__in=radar_ids,
+            real_estate_id__in={real_estate_id for _, real_estate_id in matches},
+        ).values_list("radar_id", "real_estate_id")
+    )
+    radar_real_estates = RadarRealEstate.objects.bulk_create(
+        [
+            RadarRealEstate(radar_id=radar_id, real_estate_id=real_estate_id)
+            for radar_id, real_estate_id in matches
+            if radar_id in radar_ids and (radar_id, real_estate_id) not in existing
+        ],
+        batch_size=1000,
+    )
+    return len(radar_real_estates)
@@ -3,7 +3,10 @@ from rest_framework import serializers
 from radar.models import RadarRealEstate
 from real_estate.models import RealEstate
 
-from common.pagination.serializers import PaginationSerializer
+from common.pagination.serializers import (
+    PaginationParamsSerializer,
+    PaginationSerializer,
+)
 from search.serializers import FilterRetrieveSerializer
 
 
@@ -71,7 +74,7 @@ class RadarRealEstateListSerializer(PaginationSerializer):
     data = RadarRealEstateListItemSerializer(many=True)
 
 
-class RadarRealEstateListParamsSerializer(serializers.Serializer):
+class RadarRealEstateListParamsSerializer(PaginationParamsSerializer):
     preference = serializers.ChoiceField(
         choices=RadarRealEstate.Preference, required=False
     )
@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 from datetime import datetime, timezone
 
 from rest_framework import serializers
@@ -7,12 +7,36 @@ from django.db.models.query import QuerySet
 from django.db.models import Q, Count
 
 from common.errors.errors import SerializationError, DeserializationError
+from common.pagination.paginator import KeysetPaginator, Page
 
 from user.models import User
 from radar.models import Radar, RadarRealEstate
 from search.models import Search, SearchResultRealEstate
+from search.services import request_next_pages
 from real_estate.models import RealEstate
 
+radar_paginator = KeysetPaginator(
+    ordering=["-created_at", "-id"], select_related=["search__filter"]
+)
+radar_real_estate_paginator = KeysetPaginator(
+    ordering=["created_at", "id"],
+    select_related=["real_estate"],
+    only=[
+        "real_estate__property_type",
+        "real_estate__transaction_type",
+        "real_estate__city",
+        "real_estate__neighborhood",
+        "real_estate__bedroom_quantity",
+        "real_estate__suite_quantity",
+        "real_estate__garage_slots_quantity",
+        "real_estate__price",
+        "real_estate__cond_price",
+        "real_estate__area",
+        "real_estate__area_total",
+        "real_estate__thumb_url",
+    ],
+)
+
 
 def deserializer_create_radar(
     serializer: serializers.Serializer, data: QueryDict
@@ -140,12 +164,10 @@ def list_radar(user: User) -> QuerySet:
     return radar_queryset
 
 
-def serialize_list_radar(
-    serializer: serializers.Serializer, radars: List[Radar]
-) -> List[Dict]:
-    # convert radar queryset to paginated list
+def serialize_list_radar(serializer: serializers.Serializer, page: Page) -> Dict:
+    # convert a page of radars to paginated list
     radar_list = []
-    for radar in radars:
+    for radar in page.items:
         search_filter = radar.search.filter
 
         filter_dict = {
@@ -169,12 +191,7 @@ def serialize_list_radar(
 
     list_response_dict = {
         "data": radar_list,
-        "meta": {
-            "total": 0,
-            "page": 0,
-            "per_page": 0,
-            "total_pages": 0,
-        },
+        "meta": page.get_meta(),
     }
 
     data_out = serializer(data=list_response_dict)
@@ -259,15 +276,17 @@ def list_real_estate(
         radar=radar, preference=query_preference
     )
 
+    # swiping the last pending real estates crawls the next pages of the search
+    if query_preference == RadarRealEstate.Preference.PENDING:
+        request_next_pages(radar.search_id, real_estate, 0)
+
     return real_estate
 
 
-def serialize_real_estate_list(
-    serializer: serializers.Serializer, radar_real_estates: List[RadarRealEstate]
-) -> Dict:
+def serialize_real_estate_list(serializer: serializers.Serializer, page: Page) -> Dict:
     radar_real_estate_list = []
 
-    for radar_re in radar_real_estates:
+    for radar_re in page.items:
         re_dict = {
             "id": radar_re.id,
             "property_type": radar_re.real_estate.property_type,
@@ -288,12 +307,7 @@ def serialize_real_estate_list(
 
     list_response_dict = {
         "data": radar_real_estate_list,
-        "meta": {
-            "total": 0,
-            "page": 0,
-            "per_page": 0,
-            "total_pages": 0,
-        },
+        "meta": page.get_meta(),
     }
 
     data_out = serializer(data=list_response_dict)
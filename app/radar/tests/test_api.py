@@ -5,7 +5,9 @@ Tests for search API
 from unittest.mock import patch
 from datetime import datetime, timezone
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -14,6 +16,7 @@ from rest_framework import status
 
 from user.factories import UserFactory
 from search.factories import SearchFactory
+from search.models import CrawlJob, Search
 from radar.models import Radar, RadarRealEstate
 from radar.factories import RadarFactory, RadarRealEstateFactory
 from real_estate.factories import RealEstateFactory
@@ -195,6 +198,35 @@ class PrivateApiTest(TestCase):
         self.assertEqual(len(res.data.get("data")), 1)
         self.assertEqual(res.data.get("data", {})[0].get("name"), radar.name)
 
+    def test_list_radar_pages_without_query_per_radar(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse("radar:radar")
+
+        RadarFactory(created_by=self.user)
+        with CaptureQueriesContext(connection) as one_radar:
+            client.get(url)
+
+        radars = [RadarFactory(created_by=self.user) for _ in range(3)]
+        with CaptureQueriesContext(connection) as many_radars:
+            res = client.get(url, {"limit": 2})
+
+        self.assertEqual(len(many_radars), len(one_radar))
+        self.assertEqual(
+            [radar.get("id") for radar in res.data.get("data")],
+            [radars[2].id, radars[1].id],
+        )
+        self.assertEqual(res.data.get("meta").get("total"), 4)
+        self.assertEqual(res.data.get("meta").get("total_pages"), 2)
+
+        res = client.get(
+            url, {"limit": 2, "cursor": res.data.get("meta").get("next_cursor")}
+        )
+
+        self.assertEqual(res.data.get("data")[0].get("id"), radars[0].id)
+        self.assertEqual(res.data.get("meta").get("page"), 2)
+        self.assertIsNone(res.data.get("meta").get("next_cursor"))
+
     def test_list_radar_does_not_return_other_user(self):
         client = APIClient()
         client.force_authenticate(user=self.user)
@@ -442,6 +474,56 @@ class PrivateApiTest(TestCase):
         self.assertEqual(len(data_list), 1)
         self.assertEqual(data_list[0].get("id"), radar_real_estate_dislike.id)
 
+    def test_list_radar_real_estate_pages(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        radar = RadarFactory(created_by=self.user)
+        real_estate = RealEstateFactory()
+        radar_real_estates = [
+            RadarRealEstateFactory(radar=radar, real_estate=real_estate)
+            for _ in range(3)
+        ]
+        url = reverse("radar:radar-real-estate-list", args=[str(radar.id)])
+
+        res = client.get(url, {"limit": 2})
+        next_cursor = res.data.get("meta").get("next_cursor")
+        ids = [item.get("id") for item in res.data.get("data")]
+        res = client.get(url, {"limit": 2, "cursor": next_cursor})
+        ids += [item.get("id") for item in res.data.get("data")]
+
+        self.assertEqual(ids, [obj.id for obj in radar_real_estates])
+        self.assertEqual(res.data.get("meta").get("total"), 3)
+        self.assertIsNone(res.data.get("meta").get("next_cursor"))
+
+        res = client.get(url, {"cursor": "not a cursor"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_radar_real_estate_crawls_next_pages(self):
+        """Swiping the last pending real estates crawls the next pages"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        search = SearchFactory(
+            created_by=self.user, query_status=Search.QueryStatus.PARTIAL, next_page=3
+        )
+        radar = RadarFactory(created_by=self.user, search=search)
+        RadarRealEstateFactory(radar=radar)
+        url = reverse("radar:radar-real-estate-list", args=[str(radar.id)])
+
+        with self.settings(ISC_CRAWLER_LAZY_PREFETCH_RESULTS=0):
+            res = client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(CrawlJob.objects.exists())
+
+        with self.settings(ISC_CRAWLER_LAZY_PREFETCH_RESULTS=1):
+            client.get(url)
+            client.get(url)
+
+        self.assertEqual(CrawlJob.objects.filter(search=search).count(), 1)
+
     def test_retrieve_radar_real_estate_success(self):
         client = APIClient()
         client.force_authenticate(user=self.user)
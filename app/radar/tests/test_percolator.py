@@ -0,0 +1,125 @@
+from django.test import SimpleTestCase, TestCase
+
+from radar import percolator
+from radar.factories import RadarFactory, RadarRealEstateFactory
+from radar.models import RadarRealEstate
+from real_estate.factories import RealEstateFactory
+from real_estate.models import RealEstate
+from search.factories import SearchFactory
+from search.models import Filter
+
+
+def build_filter(**kwargs) -> Filter:
+    filter_dict = {
+        "property_type": [RealEstate.PropertyType.APARTMENT],
+        "transaction_type": [RealEstate.TransactionType.BUY],
+        "city": ["Blumenau"],
+        "neighborhood": ["itoupava-seca", "Centro"],
+        "bedroom_quantity": [2, 3],
+        "suite_quantity": [0],
+        "bathroom_quantity": [1],
+        "garage_slots_quantity": [5],
+        "min_price": 300000,
+        "max_price": 500000,
+        "min_area": 50,
+        "max_area": 90,
+    }
+    filter_dict.update(kwargs)
+    return Filter(**filter_dict)
+
+
+def build_real_estate(**kwargs) -> RealEstate:
+    model_dict = {
+        "property_type": RealEstate.PropertyType.APARTMENT,
+        "transaction_type": RealEstate.TransactionType.BUY,
+        "city": "blumenau",
+        "neighborhood": "Itoupava Seca",
+        "bedroom_quantity": 2,
+        "suite_quantity": 1,
+        "garage_slots_quantity": 6,
+        "price": 400000.0,
+        "area": 70.0,
+        "available": True,
+    }
+    model_dict.update(kwargs)
+    return RealEstate(**model_dict)
+
+
+class TestRadarPercolator(SimpleTestCase):
+
+    def setUp(self):
+        self.percolator = percolator.RadarPercolator(
+            [
+                ("radar", build_filter()),
+                ("whole-city", build_filter(neighborhood=[], bedroom_quantity=[0])),
+                ("house", build_filter(property_type=["house"])),
+                ("other-city", build_filter(city=["Gaspar"])),
+                ("cheap", build_filter(min_price=100000, max_price=350000)),
+            ]
+        )
+
+    def test_real_estate_matches_radars(self):
+        self.assertEqual(self.percolator.radars, 5)
+        self.assertEqual(
+            sorted(self.percolator.match(build_real_estate())), ["radar", "whole-city"]
+        )
+
+    def test_real_estate_out_of_filter(self):
+        cases = {
+            "neighborhood": build_real_estate(neighborhood="Velha"),
+            "bedrooms": build_real_estate(bedroom_quantity=4),
+            "garage slots": build_real_estate(garage_slots_quantity=4),
+            "transaction": build_real_estate(transaction_type="rent"),
+            "area": build_real_estate(area=91.0),
+            "price": build_real_estate(price=500001.0),
+        }
+        for case, real_estate in cases.items():
+            with self.subTest(case):
+                self.assertNotIn("radar", self.percolator.match(real_estate))
+
+        self.assertEqual(
+            self.percolator.match(build_real_estate(neighborhood="Velha")),
+            ["whole-city"],
+        )
+        self.assertEqual(
+            sorted(self.percolator.match(build_real_estate(price=320000.0))),
+            ["cheap", "radar", "whole-city"],
+        )
+        self.assertEqual(self.percolator.match(build_real_estate(available=False)), [])
+
+
+class TestPercolateRealEstates(TestCase):
+
+    def setUp(self):
+        percolator.clear_radar_percolator()
+
+    def tearDown(self):
+        percolator.clear_radar_percolator()
+
+    def test_new_real_estates_are_added_to_matching_radars(self):
+        radar = RadarFactory.create()
+        other_radar = RadarFactory.create(
+            search=SearchFactory.create(filter__city=["Gaspar"])
+        )
+        real_estate = RealEstateFactory.create(price=5000.0, area=76.0)
+        known_real_estate = RealEstateFactory.create(price=5000.0, area=76.0)
+        RadarRealEstateFactory.create(radar=radar, real_estate=known_real_estate)
+
+        with self.settings(RADAR_PERCOLATOR_REFRESH_SECONDS=60):
+            added = percolator.percolate_real_estates([real_estate, known_real_estate])
+
+        self.assertEqual(added, 1)
+        self.assertEqual(RadarRealEstate.objects.filter(radar=radar).count(), 2)
+        self.assertFalse(RadarRealEstate.objects.filter(radar=other_radar).exists())
+
+    def test_deleted_radar_is_skipped(self):
+        radar = RadarFactory.create()
+        real_estate = RealEstateFactory.create(price=5000.0, area=76.0)
+
+        with self.settings(RADAR_PERCOLATOR_REFRESH_SECONDS=60):
+            percolator.get_radar_percolator()
+            radar.delete()
+            added = percolator.percolate_real_estates([real_estate])
+
+        self.assertEqual(added, 0)
+        self.assertFalse(RadarRealEstate.objects.exists())
@@ -22,6 +22,7 @@ from radar.serializers import (
 )
 
 from common.errors.errors import SerializationError, DeserializationError
+from common.pagination.serializers import PaginationParamsSerializer
 
 
 class RadarView(
@@ -76,18 +77,30 @@ class RadarView(
 
         return Response(response, status=status.HTTP_201_CREATED)
 
+    @extend_schema(parameters=[PaginationParamsSerializer])
     def list(self, request: Request) -> Response:
-        # TODO - how to handle pagination?
+        try:
+            query_params = services.deserialize_list_query_params_radar_real_estate(
+                PaginationParamsSerializer, request.query_params
+            )
+        except DeserializationError as e:
+            print(
+                f"Failed to deserialize query param while listing radars. Error: {e.errors}"
+            )
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             radar_queryset = services.list_radar(request.user)
+            page = services.radar_paginator.paginate(radar_queryset, query_params)
+        except DeserializationError as e:
+            print(f"Failed to paginate radars. Error: {e.errors}")
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"Failed to list radars for user {request.user.id}. Error: {e}.")
             return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         try:
-            response = services.serialize_list_radar(
-                RadarListSerializer, radar_queryset
-            )
+            response = services.serialize_list_radar(RadarListSerializer, page)
         except SerializationError as e:
             print(
                 f"Failed to serializer response while listing radars. Error: {e.errors}."
@@ -153,18 +166,23 @@ class RadarRealEstateListView(
             )
             query_params = {}
 
-        # TODO - how to handle pagination
         try:
             real_estate_queryset = services.list_real_estate(
                 request.user, id, query_params
             )
+            page = services.radar_real_estate_paginator.paginate(
+                real_estate_queryset, query_params
+            )
         except services.InvalidRadarIdError as e:
             print(f"Failed to list real estate for radar. Radar ID: {id}. Error: {e}.")
             return Response("", status=status.HTTP_400_BAD_REQUEST)
+        except DeserializationError as e:
+            print(f"Failed to paginate real estate for radar. Error: {e.errors}")
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             response = services.serialize_real_estate_list(
-                RadarRealEstateListSerializer, real_estate_queryset
+                RadarRealEstateListSerializer, page
             )
         except SerializationError as e:
             print(
@@ -8,7 +8,7 @@ class RealEstateFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = RealEstate
 
-    reference_code = "A123"
+    reference_code = factory.Sequence(lambda n: f"A{n:03d}")
     property_type = RealEstate.PropertyType.APARTMENT
     transaction_type = RealEstate.TransactionType.BUY
     city = "Blumenau"
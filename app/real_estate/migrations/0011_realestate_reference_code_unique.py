@@ -0,0 +1,163 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:56
+
+from django.db import migrations, models, transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# duplicated reference codes merged per transaction, so the live table is
+# only locked for a short time
+BATCH_SIZE = 500
+
+
+def merge_radar_real_estates(RadarRealEstate, RadarRealEstateReview, real_estate_ids):
+    """Radars that had more than one duplicate keep a single radar real estate"""
+    duplicate_pairs = (
+        RadarRealEstate.objects.filter(real_estate_id__in=real_estate_ids)
+        .values('radar_id', 'real_estate_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+
+    merged = 0
+    for pair in duplicate_pairs:
+        # an assessed real estate wins over a pending one, then the oldest
+        radar_real_estates = list(
+            RadarRealEstate.objects.filter(
+                radar_id=pair['radar_id'], real_estate_id=pair['real_estate_id']
+            )
+            .annotate(
+                pending=Case(
+                    When(preference='pending', then=Value(1)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by('pending', 'created_at', 'id')
+            .values_list('id', flat=True)
+        )
+        survivor_id, duplicate_ids = radar_real_estates[0], radar_real_estates[1:]
+        RadarRealEstateReview.objects.filter(
+            radar_real_estate_id__in=duplicate_ids
+        ).update(radar_real_estate_id=survivor_id)
+        RadarRealEstate.objects.filter(id__in=duplicate_ids).delete()
+        merged += len(duplicate_ids)
+
+    return merged
+
+
+def merge_search_results(SearchResultRealEstate, real_estate_ids):
+    """Searches that had more than one duplicate keep a single result"""
+    duplicate_pairs = (
+        SearchResultRealEstate.objects.filter(real_estate_id__in=real_estate_ids)
+        .values('search_id', 'real_estate_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+
+    merged = 0
+    for pair in duplicate_pairs:
+        search_results = list(
+            SearchResultRealEstate.objects.filter(
+                search_id=pair['search_id'], real_estate_id=pair['real_estate_id']
+            )
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        SearchResultRealEstate.objects.filter(id__in=search_results[1:]).delete()
+        merged += len(search_results) - 1
+
+    return merged
+
+
+def merge_duplicate_real_estates(apps, schema_editor):
+    RealEstate = apps.get_model('real_estate', 'RealEstate')
+    SearchResultRealEstate = apps.get_model('search', 'SearchResultRealEstate')
+    RadarRealEstate = apps.get_model('radar', 'RadarRealEstate')
+    RadarRealEstateReview = apps.get_model(
+        'real_estate_review', 'RadarRealEstateReview'
+    )
+
+    duplicate_codes = list(
+        RealEstate.objects.values('reference_code')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('reference_code')
+        .values_list('reference_code', flat=True)
+    )
+    if len(duplicate_codes) == 0:
+        return
+
+    real_estates_merged = 0
+    search_results_moved = 0
+    radar_real_estates_moved = 0
+    links_merged = 0
+    for start in range(0, len(duplicate_codes), BATCH_SIZE):
+        batch_codes = duplicate_codes[start : start + BATCH_SIZE]
+
+        with transaction.atomic():
+            # the oldest real estate of each code survives
+            duplicate_ids_by_survivor = {}
+            survivor_by_code = {}
+            for real_estate_id, reference_code in (
+                RealEstate.objects.filter(reference_code__in=batch_codes)
+                .order_by('reference_code', 'created_at', 'id')
+                .values_list('id', 'reference_code')
+            ):
+                if reference_code not in survivor_by_code:
+                    survivor_by_code[reference_code] = real_estate_id
+                    duplicate_ids_by_survivor[real_estate_id] = []
+                else:
+                    survivor_id = survivor_by_code[reference_code]
+                    duplicate_ids_by_survivor[survivor_id].append(real_estate_id)
+
+            for survivor_id, duplicate_ids in duplicate_ids_by_survivor.items():
+                search_results_moved += SearchResultRealEstate.objects.filter(
+                    real_estate_id__in=duplicate_ids
+                ).update(real_estate_id=survivor_id)
+                radar_real_estates_moved += RadarRealEstate.objects.filter(
+                    real_estate_id__in=duplicate_ids
+                ).update(real_estate_id=survivor_id)
+                RealEstate.objects.filter(id__in=duplicate_ids).delete()
+                real_estates_merged += len(duplicate_ids)
+
+            survivor_ids = list(duplicate_ids_by_survivor)
+            links_merged += merge_search_results(SearchResultRealEstate, survivor_ids)
+            links_merged += merge_radar_real_estates(
+                RadarRealEstate, RadarRealEstateReview, survivor_ids
+            )
+
+        print(
+            f'\n  Merged reference codes {start + len(batch_codes)} '
+            f'of {len(duplicate_codes)}',
+            end='',
+        )
+
+    print(
+        f'\n  Merged {real_estates_merged} duplicated real estates of '
+        f'{len(duplicate_codes)} reference codes, moved {search_results_moved} '
+        f'search results and {radar_real_estates_moved} radar real estates, '
+        f'removed {links_merged} repeated links'
+    )
+
+
+class Migration(migrations.Migration):
+
+    # every batch of merged duplicates is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('real_estate', '0010_remove_realestate_images_url_realestate_thumb_url'),
+        ('radar', '0001_initial'),
+        ('real_estate_review', '0002_alter_radarrealestatereview_bad_tags_and_more'),
+        ('search', '0005_searchcrawlcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_real_estates, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='realestate',
+            name='reference_code',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
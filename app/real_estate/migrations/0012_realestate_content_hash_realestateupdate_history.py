@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:58
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('real_estate', '0011_realestate_reference_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='realestate',
+            name='content_hash',
+            field=models.CharField(db_default='', default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='realestateupdate',
+            name='new_available',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name='realestateupdate',
+            name='new_price',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='realestateupdate',
+            name='old_available',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name='realestateupdate',
+            name='old_price',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='realestateupdate',
+            name='real_estate',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='real_estate.realestate'),
+        ),
+        migrations.AddIndex(
+            model_name='realestateupdate',
+            index=models.Index(fields=['real_estate', 'created_at'], name='real_estate_real_es_b08756_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='realestateupdate',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='real_estate_created_1de208_brin'),
+        ),
+    ]
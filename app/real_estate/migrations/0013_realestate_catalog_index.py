@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('real_estate', '0012_realestate_content_hash_realestateupdate_history'),
+        ('real_estate_agency', '0003_agency_profile_url_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='realestate',
+            index=models.Index(fields=['city', 'transaction_type', 'property_type', 'price'], name='real_estate_catalog_idx'),
+        ),
+    ]
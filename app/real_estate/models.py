@@ -1,7 +1,10 @@
+import hashlib
+import json
 import uuid
 
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
 
 from real_estate_agency.models import Agency
 
@@ -31,7 +34,7 @@ class RealEstate(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    reference_code = models.CharField(max_length=50)
+    reference_code = models.CharField(max_length=50, unique=True)
     property_type = models.CharField(
         max_length=15, choices=PropertyType, default=PropertyType.APARTMENT
     )
@@ -58,6 +61,39 @@ class RealEstate(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
     url = models.CharField(max_length=250)
+    # hash of the fields shown in the result pages, a listing crawled again
+    # with the same hash is not written
+    content_hash = models.CharField(max_length=64, default="", db_default="")
+
+    # fields filled by the crawler from the result pages
+    content_fields = [
+        "property_type",
+        "transaction_type",
+        "city",
+        "neighborhood",
+        "bedroom_quantity",
+        "suite_quantity",
+        "garage_slots_quantity",
+        "price",
+        "area",
+        "area_total",
+        "available",
+        "thumb_url",
+        "url",
+    ]
+
+    def get_content_hash(self) -> str:
+        content = [getattr(self, field) for field in self.content_fields]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    class Meta:
+        indexes = [
+            # searches answered from the catalog of a city
+            models.Index(
+                fields=["city", "transaction_type", "property_type", "price"],
+                name="real_estate_catalog_idx",
+            ),
+        ]
 
 
 class RealEstateUpdate(models.Model):
@@ -70,5 +106,20 @@ class RealEstateUpdate(models.Model):
         AVAILABILITY = "availability", "availability"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # rows written before the link to the real estate have none
+    real_estate = models.ForeignKey(RealEstate, on_delete=models.CASCADE, null=True)
     update = ArrayField(models.CharField(max_length=15, choices=Update))
     created_at = models.DateTimeField(auto_now_add=True)
+    old_price = models.FloatField(null=True)
+    new_price = models.FloatField(null=True)
+    old_available = models.BooleanField(null=True)
+    new_available = models.BooleanField(null=True)
+
+    class Meta:
+        indexes = [
+            # history of a real estate
+            models.Index(fields=["real_estate", "created_at"]),
+            # rows are appended in time order, so a BRIN index is enough for
+            # time range scans over the whole table
+            BrinIndex(fields=["created_at"]),
+        ]
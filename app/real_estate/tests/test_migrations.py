@@ -0,0 +1,161 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class TestMergeDuplicatesMigration(TransactionTestCase):
+    """Duplicates stored before the unique constraints are merged"""
+
+    migrate_from = [
+        ("real_estate", "0010_remove_realestate_images_url_realestate_thumb_url"),
+        ("real_estate_agency", "0002_agency_profile_url"),
+    ]
+    migrate_to = [
+        ("real_estate", "0011_realestate_reference_code_unique"),
+        ("real_estate_agency", "0003_agency_profile_url_unique"),
+    ]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = self.get_applied_apps()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def get_applied_apps(self):
+        """Models of every app as they are in the applied migrations"""
+        executor = MigrationExecutor(connection)
+        return executor.loader.project_state(
+            list(executor.loader.applied_migrations)
+        ).apps
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        return self.get_applied_apps()
+
+    def create_agency(self, profile_url: str):
+        Agency = self.apps.get_model("real_estate_agency", "Agency")
+        return Agency.objects.create(
+            name="agency",
+            creci="",
+            city="",
+            address_street="",
+            address_number="",
+            contact_number_1="",
+            contact_number_2="",
+            contact_whatsapp="",
+            logo_url="",
+            profile_url=profile_url,
+        )
+
+    def create_real_estate(self, reference_code: str, agency):
+        RealEstate = self.apps.get_model("real_estate", "RealEstate")
+        return RealEstate.objects.create(
+            reference_code=reference_code,
+            city="Blumenau",
+            neighborhood="Centro",
+            bedroom_quantity=1,
+            suite_quantity=0,
+            bathroom_quantity=1,
+            garage_slots_quantity=0,
+            price=1.0,
+            area=1.0,
+            area_total=1.0,
+            available=True,
+            agency=agency,
+            cond_price=0.0,
+            description="",
+            url="",
+        )
+
+    def test_duplicates_are_merged(self):
+        User = self.apps.get_model("user", "User")
+        Filter = self.apps.get_model("search", "Filter")
+        Search = self.apps.get_model("search", "Search")
+        SearchResultRealEstate = self.apps.get_model("search", "SearchResultRealEstate")
+        Radar = self.apps.get_model("radar", "Radar")
+        RadarRealEstate = self.apps.get_model("radar", "RadarRealEstate")
+        RadarRealEstateReview = self.apps.get_model(
+            "real_estate_review", "RadarRealEstateReview"
+        )
+
+        agency = self.create_agency("https://agency")
+        agency_duplicate = self.create_agency("https://agency")
+        real_estate = self.create_real_estate("A1", agency)
+        real_estate_duplicate = self.create_real_estate("A1", agency_duplicate)
+        other_real_estate = self.create_real_estate("A2", agency_duplicate)
+        another_real_estate = self.create_real_estate("A3", agency_duplicate)
+
+        user = User.objects.create(email="user@test.com")
+        filter_obj = Filter.objects.create(
+            city=["blumenau"],
+            neighborhood=[],
+            bedroom_quantity=[],
+            suite_quantity=[],
+            bathroom_quantity=[],
+            garage_slots_quantity=[],
+            min_price=0,
+            max_price=1,
+            min_area=0,
+            max_area=1,
+        )
+        search = Search.objects.create(filter=filter_obj)
+        other_search = Search.objects.create(filter=filter_obj)
+        SearchResultRealEstate.objects.create(search=search, real_estate=real_estate)
+        SearchResultRealEstate.objects.create(
+            search=search, real_estate=real_estate_duplicate
+        )
+        SearchResultRealEstate.objects.create(
+            search=other_search, real_estate=real_estate_duplicate
+        )
+
+        radar = Radar.objects.create(created_by=user, search=search)
+        RadarRealEstate.objects.create(radar=radar, real_estate=real_estate)
+        liked = RadarRealEstate.objects.create(
+            radar=radar, real_estate=real_estate_duplicate, preference="like"
+        )
+        RadarRealEstateReview.objects.create(
+            created_by=user, radar_real_estate=liked, rating=5
+        )
+
+        apps = self.migrate()
+
+        RealEstate = apps.get_model("real_estate", "RealEstate")
+        Agency = apps.get_model("real_estate_agency", "Agency")
+        SearchResultRealEstate = apps.get_model("search", "SearchResultRealEstate")
+        RadarRealEstate = apps.get_model("radar", "RadarRealEstate")
+        RadarRealEstateReview = apps.get_model(
+            "real_estate_review", "RadarRealEstateReview"
+        )
+
+        self.assertEqual(
+            list(RealEstate.objects.order_by("reference_code").values_list("id")),
+            [(real_estate.id,), (other_real_estate.id,), (another_real_estate.id,)],
+        )
+        # the duplicate agency still has more real estates once the duplicated
+        # real estates are merged
+        self.assertEqual(
+            list(Agency.objects.values_list("id")), [(agency_duplicate.id,)]
+        )
+        self.assertEqual(
+            RealEstate.objects.filter(agency_id=agency_duplicate.id).count(), 3
+        )
+
+        self.assertEqual(
+            sorted(
+                SearchResultRealEstate.objects.values_list(
+                    "search_id", "real_estate_id"
+                )
+            ),
+            sorted([(search.id, real_estate.id), (other_search.id, real_estate.id)]),
+        )
+
+        radar_real_estate = RadarRealEstate.objects.get()
+        self.assertEqual(radar_real_estate.id, liked.id)
+        self.assertEqual(radar_real_estate.real_estate_id, real_estate.id)
+        self.assertEqual(
+            RadarRealEstateReview.objects.get().radar_real_estate_id, liked.id
+        )
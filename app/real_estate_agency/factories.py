@@ -16,4 +16,4 @@ class AgencyFactory(factory.django.DjangoModelFactory):
     contact_number_2 = "2222222"
     contact_whatsapp = "3333333"
     logo_url = "https://niceimobiliaria.com/logo.png"
-    profile_url = "https://niceimobiliaria.com"
+    profile_url = factory.Sequence(lambda n: f"https://niceimobiliaria.com/{n}")
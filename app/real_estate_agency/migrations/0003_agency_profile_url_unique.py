@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:56
+
+from django.db import migrations, models, transaction
+from django.db.models import Count
+
+# duplicated profile urls merged per transaction, so the live table is only
+# locked for a short time
+BATCH_SIZE = 500
+
+
+def merge_duplicate_agencies(apps, schema_editor):
+    Agency = apps.get_model('real_estate_agency', 'Agency')
+    RealEstate = apps.get_model('real_estate', 'RealEstate')
+
+    duplicate_urls = list(
+        Agency.objects.values('profile_url')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('profile_url')
+        .values_list('profile_url', flat=True)
+    )
+    if len(duplicate_urls) == 0:
+        return
+
+    agencies_merged = 0
+    real_estates_moved = 0
+    for start in range(0, len(duplicate_urls), BATCH_SIZE):
+        batch_urls = duplicate_urls[start : start + BATCH_SIZE]
+
+        with transaction.atomic():
+            # the agency with most real estates survives, less rows to move
+            duplicate_ids_by_survivor = {}
+            survivor_by_url = {}
+            for agency_id, profile_url in (
+                Agency.objects.filter(profile_url__in=batch_urls)
+                .annotate(real_estate_count=Count('realestate'))
+                .order_by('profile_url', '-real_estate_count', 'id')
+                .values_list('id', 'profile_url')
+            ):
+                if profile_url not in survivor_by_url:
+                    survivor_by_url[profile_url] = agency_id
+                    duplicate_ids_by_survivor[agency_id] = []
+                else:
+                    survivor_id = survivor_by_url[profile_url]
+                    duplicate_ids_by_survivor[survivor_id].append(agency_id)
+
+            for survivor_id, duplicate_ids in duplicate_ids_by_survivor.items():
+                real_estates_moved += RealEstate.objects.filter(
+                    agency_id__in=duplicate_ids
+                ).update(agency_id=survivor_id)
+                Agency.objects.filter(id__in=duplicate_ids).delete()
+                agencies_merged += len(duplicate_ids)
+
+        print(
+            f'\n  Merged profile urls {start + len(batch_urls)} '
+            f'of {len(duplicate_urls)}',
+            end='',
+        )
+
+    print(
+        f'\n  Merged {agencies_merged} duplicated agencies of '
+        f'{len(duplicate_urls)} profile urls, moved {real_estates_moved} real estates'
+    )
+
+
+class Migration(migrations.Migration):
+
+    # every batch of merged duplicates is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('real_estate_agency', '0002_agency_profile_url'),
+        ('real_estate', '0011_realestate_reference_code_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_agencies, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='agency',
+            name='profile_url',
+            field=models.CharField(max_length=500, unique=True),
+        ),
+    ]
@@ -16,4 +16,4 @@ class Agency(models.Model):
     contact_number_2 = models.CharField(max_length=20)
     contact_whatsapp = models.CharField(max_length=20)
     logo_url = models.CharField(max_length=500)
-    profile_url = models.CharField(max_length=500)
+    profile_url = models.CharField(max_length=500, unique=True)
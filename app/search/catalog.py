@@ -0,0 +1,309 @@
+"""
+Searches answered from the real estates already stored, instead of crawling.
+A city is in the catalog once all its real estates were crawled, a search of
+cities crawled recently becomes a single query over the real estates found by
+that crawl. A search narrower than a recent one is answered from the results
+of that one.
+"""
+
+from datetime import timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from real_estate.models import RealEstate, RealEstateUpdate
+from search.models import (
+    CatalogCity,
+    Filter,
+    Search,
+    SearchResultRealEstate,
+    normalize_place_name,
+    quantity_options,
+)
+from search.task import bulk_create_objects, bulk_load_isc_real_estate_search
+
+# results are written in the order of the queryset, each with its own time
+INSERT_RESULTS_SQL = """
+    INSERT INTO search_searchresultrealestate (id, search_id, real_estate_id)
+    SELECT gen_random_uuid(), %s, results.id
+    FROM   ({}) results
+"""
+
+# filter crawling every real estate of a city, stores are not searchable in ISC
+CITY_PROPERTY_TYPES = [
+    RealEstate.PropertyType.APARTMENT,
+    RealEstate.PropertyType.HOUSE,
+    RealEstate.PropertyType.TERRAIN,
+    RealEstate.PropertyType.OFFICE,
+    RealEstate.PropertyType.WAREHOUSE,
+    RealEstate.PropertyType.RURAL,
+]
+CITY_MAX_PRICE = 100_000_000
+CITY_MAX_AREA = 1_000_000
+
+
+def get_fresh_catalog_cities(filter_obj: Filter) -> Optional[List[CatalogCity]]:
+    """Catalog of every city of the filter, None when any is missing or stale"""
+    if settings.ISC_CATALOG_FRESH_SECONDS <= 0:
+        return None
+
+    names = {normalize_place_name(city) for city in filter_obj.city}
+    catalog_cities = list(
+        CatalogCity.objects.filter(
+            name__in=names,
+            search__isnull=False,
+            crawled_at__gte=timezone.now()
+            - timedelta(seconds=settings.ISC_CATALOG_FRESH_SECONDS),
+        )
+    )
+    if len(names) == 0 or len(catalog_cities) != len(names):
+        return None
+
+    return catalog_cities
+
+
+def quantity_condition(field: str, quantities: List[int]) -> Q:
+    """Same options sent to ISC, quantities up to 4 and then 5 or more"""
+    options = quantity_options(quantities)
+    if options is None:
+        return Q()
+
+    condition = Q(**{f"{field}__in": [option for option in options if option < 5]})
+    if 5 in options:
+        condition |= Q(**{f"{field}__gte": 5})
+    return condition
+
+
+def build_catalog_queryset(
+    filter_obj: Filter, catalog_cities: List[CatalogCity]
+) -> Optional[QuerySet]:
+    """
+    Real estates of the filter found by the last crawl of the cities, in a
+    query that can use the index on city, transaction type, property type and
+    price. Real estates that crawl did not find are left out, the catalog is
+    only as recent as it. None when a neighborhood of the filter is not in the
+    catalog, it may be named differently there.
+    """
+    city_names = [name for city in catalog_cities for name in city.city_names]
+    queryset = RealEstate.objects.filter(
+        searchresultrealestate__search__in=[city.search_id for city in catalog_cities],
+        city__in=city_names,
+        available=True,
+        price__gte=filter_obj.min_price,
+        price__lte=filter_obj.max_price,
+        area__gte=filter_obj.min_area,
+        area__lte=filter_obj.max_area,
+    )
+
+    if filter_obj.transaction_type:
+        queryset = queryset.filter(transaction_type__in=filter_obj.transaction_type)
+    if filter_obj.property_type:
+        queryset = queryset.filter(property_type__in=filter_obj.property_type)
+
+    if filter_obj.neighborhood:
+        neighborhood_names = {}
+        for city in catalog_cities:
+            for name in city.neighborhood_names:
+                neighborhood_names.setdefault(normalize_place_name(name), []).append(
+                    name
+                )
+
+        names = []
+        for neighborhood in filter_obj.neighborhood:
+            normalized_name = normalize_place_name(neighborhood)
+            if normalized_name not in neighborhood_names:
+                return None
+            names += neighborhood_names[normalized_name]
+
+        queryset = queryset.filter(neighborhood__in=names)
+
+    return queryset.filter(
+        quantity_condition("bedroom_quantity", filter_obj.bedroom_quantity),
+        quantity_condition("suite_quantity", filter_obj.suite_quantity),
+        quantity_condition("garage_slots_quantity", filter_obj.garage_slots_quantity),
+    )
+
+
+def insert_search_results(search_obj: Search, queryset: QuerySet) -> int:
+    """Real estates of the queryset as results of the search, in one query"""
+    sql, params = queryset.values("id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_RESULTS_SQL.format(sql), [search_obj.id, *params])
+        return cursor.rowcount
+
+
+def build_parent_results_queryset(
+    filter_obj: Filter, parent_search: Search
+) -> Optional[QuerySet]:
+    """
+    Results of the parent search found by the narrower filter. None when a
+    result is in a neighborhood named differently from the ones of the parent
+    filter, it can not tell which neighborhood it belongs to.
+    """
+    queryset = RealEstate.objects.filter(
+        searchresultrealestate__search=parent_search,
+        price__gte=filter_obj.min_price,
+        price__lte=filter_obj.max_price,
+        area__gte=filter_obj.min_area,
+        area__lte=filter_obj.max_area,
+    )
+
+    neighborhoods = {normalize_place_name(name) for name in filter_obj.neighborhood}
+    parent_neighborhoods = {
+        normalize_place_name(name) for name in parent_search.filter.neighborhood
+    }
+    if neighborhoods != parent_neighborhoods:
+        stored_names = (
+            SearchResultRealEstate.objects.filter(search=parent_search)
+            .values_list("real_estate__neighborhood", flat=True)
+            .distinct()
+        )
+
+        names = []
+        for name in stored_names:
+            normalized_name = normalize_place_name(name)
+            if normalized_name in neighborhoods:
+                names.append(name)
+            elif parent_neighborhoods and normalized_name not in parent_neighborhoods:
+                return None
+
+        queryset = queryset.filter(neighborhood__in=names)
+
+    # listed in the order of the results of the parent search
+    return queryset.filter(
+        quantity_condition("bedroom_quantity", filter_obj.bedroom_quantity),
+        quantity_condition("suite_quantity", filter_obj.suite_quantity),
+        quantity_condition("garage_slots_quantity", filter_obj.garage_slots_quantity),
+    ).order_by("searchresultrealestate__created_at", "searchresultrealestate__id")
+
+
+def answer_search_from_catalog(search_obj: Search) -> bool:
+    """
+    Finish a search with the real estates of the catalog, in a single
+    INSERT ... SELECT. False when the catalog can not answer it.
+    """
+    catalog_cities = get_fresh_catalog_cities(search_obj.filter)
+    if catalog_cities is None:
+        return False
+
+    queryset = build_catalog_queryset(search_obj.filter, catalog_cities)
+    if queryset is None:
+        return False
+
+    with transaction.atomic():
+        found = insert_search_results(search_obj, queryset)
+
+        search_obj.results_source = Search.ResultsSource.CATALOG
+        search_obj.query_status = Search.QueryStatus.FINISHED
+        search_obj.number_real_estate_found = found
+        # results are as old as the oldest crawl of the cities
+        search_obj.finished_at = min(city.crawled_at for city in catalog_cities)
+        search_obj.save()
+
+    print(f"Search {search_obj.id} answered from the catalog with {found} results")
+    return True
+
+
+def mark_delisted_real_estates(previous_search_id: UUID, search_obj: Search) -> int:
+    """
+    Mark the real estates found by the previous crawl of a city and missing
+    from a complete new one as no longer available, recording the change.
+    Returns how many were marked.
+    """
+    delisted_re_objects = list(
+        RealEstate.objects.filter(
+            searchresultrealestate__search_id=previous_search_id, available=True
+        ).exclude(searchresultrealestate__search=search_obj)
+    )
+
+    re_updates = []
+    for re_object in delisted_re_objects:
+        re_object.available = False
+        re_object.content_hash = re_object.get_content_hash()
+        re_object.updated_at = timezone.now()
+        re_updates.append(
+            RealEstateUpdate(
+                real_estate=re_object,
+                update=[RealEstateUpdate.Update.AVAILABILITY],
+                old_available=True,
+                new_available=False,
+            )
+        )
+
+    # a listing crawled again later is available again, its hash changed
+    with transaction.atomic():
+        RealEstate.objects.bulk_update(
+            delisted_re_objects, ["available", "content_hash", "updated_at"]
+        )
+        bulk_create_objects(re_updates)
+
+    return len(delisted_re_objects)
+
+
+def refresh_city_catalog(city: str) -> Optional[CatalogCity]:
+    """
+    Bulk load every real estate of a city and add it to the catalog, meant to
+    run periodically for the cities searched the most. Real estates of the
+    previous crawl of the city that are missing from this one were delisted.
+    """
+    filter_obj = Filter.objects.create(
+        property_type=CITY_PROPERTY_TYPES,
+        transaction_type=list(RealEstate.TransactionType.values),
+        city=[city],
+        neighborhood=[],
+        bedroom_quantity=[0],
+        suite_quantity=[0],
+        bathroom_quantity=[0],
+        garage_slots_quantity=[0],
+        min_price=0,
+        max_price=CITY_MAX_PRICE,
+        min_area=0,
+        max_area=CITY_MAX_AREA,
+    )
+    search_obj = Search.objects.create(filter=filter_obj)
+
+    bulk_load_isc_real_estate_search(search_obj.id)
+
+    search_obj.refresh_from_db()
+    if search_obj.query_status != Search.QueryStatus.FINISHED:
+        print(f"Catalog of city {city} was not refreshed, the crawl failed")
+        return None
+    # real estates of the pages skipped would be missing from the catalog
+    if search_obj.skipped_pages:
+        print(
+            f"Catalog of city {city} was not refreshed, "
+            f"pages {search_obj.skipped_pages} were skipped"
+        )
+        return None
+
+    previous_catalog_city = CatalogCity.objects.filter(
+        name=normalize_place_name(city), search__isnull=False
+    ).first()
+    if previous_catalog_city is not None:
+        delisted = mark_delisted_real_estates(
+            previous_catalog_city.search_id, search_obj
+        )
+        print(f"Catalog of city {city} has {delisted} real estates delisted")
+
+    results = SearchResultRealEstate.objects.filter(search=search_obj)
+    city_names = results.values_list("real_estate__city", flat=True).distinct()
+    neighborhood_names = results.values_list(
+        "real_estate__neighborhood", flat=True
+    ).distinct()
+
+    catalog_city, _ = CatalogCity.objects.update_or_create(
+        name=normalize_place_name(city),
+        defaults={
+            "city_names": sorted(set(city_names) | {city}),
+            "neighborhood_names": sorted(neighborhood_names),
+            "real_estate_count": results.count(),
+            "crawled_at": search_obj.finished_at,
+            "search": search_obj,
+        },
+    )
+    return catalog_city
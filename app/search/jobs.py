@@ -0,0 +1,326 @@
+import os
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from search.models import CrawlJob, Search
+from search.task import (
+    bulk_load_isc_real_estate_search,
+    crawl_isc_real_estate_search,
+    sync_attached_searches,
+)
+
+
+def enqueue_crawl(
+    search_obj: Search,
+    incremental: bool = False,
+    bulk_load: bool = False,
+    fingerprint: str = "",
+) -> CrawlJob:
+    """
+    Queue the crawl of a search, it runs once a crawl worker claims it.
+    With a fingerprint, IntegrityError is raised when a crawl of the same
+    filter is already queued or running.
+    """
+    return CrawlJob.objects.create(
+        search=search_obj,
+        incremental=incremental,
+        bulk_load=bulk_load,
+        fingerprint=fingerprint,
+    )
+
+
+def get_in_flight_crawl_job(fingerprint: str) -> Optional[CrawlJob]:
+    """Queued or running crawl of the filter with this fingerprint"""
+    return (
+        CrawlJob.objects.select_related("search")
+        .filter(
+            fingerprint=fingerprint,
+            status__in=[CrawlJob.Status.PENDING, CrawlJob.Status.RUNNING],
+        )
+        .first()
+    )
+
+
+def attach_search(search_obj: Search, crawl_leader: Search) -> None:
+    """Show the results of the crawl of crawl_leader for search_obj"""
+    search_obj.crawl_leader = crawl_leader
+    search_obj.results_source = Search.ResultsSource.SHARED_CRAWL
+    search_obj.query_status = crawl_leader.query_status
+    search_obj.number_real_estate_found = crawl_leader.number_real_estate_found
+    search_obj.save()
+
+    # finished while its job was still running, results are copied right away
+    if crawl_leader.query_status == Search.QueryStatus.FINISHED:
+        sync_attached_searches(crawl_leader)
+
+
+def enqueue_or_attach_crawl(search_obj: Search, fingerprint: str) -> CrawlJob:
+    """
+    Queue the crawl of a search, or attach the search to the crawl of the same
+    filter queued or running. The unique fingerprint of crawls in flight makes
+    a single one of concurrent requests, in any process, queue the crawl.
+    """
+    job = get_in_flight_crawl_job(fingerprint)
+    if job is None:
+        try:
+            with transaction.atomic():
+                return enqueue_crawl(search_obj, fingerprint=fingerprint)
+        except IntegrityError:
+            # queued by a concurrent request, committed before this insert
+            job = get_in_flight_crawl_job(fingerprint)
+            if job is None:
+                return enqueue_crawl(search_obj, fingerprint=fingerprint)
+
+    attach_search(search_obj, job.search)
+    return job
+
+
+def enqueue_refresh_crawl(search_obj: Search, fingerprint: str) -> Optional[CrawlJob]:
+    """
+    Queue an incremental crawl of a search showing stale results, unless a
+    crawl of the same filter is already queued or running.
+    """
+    if get_in_flight_crawl_job(fingerprint) is not None:
+        return None
+
+    try:
+        with transaction.atomic():
+            return enqueue_crawl(search_obj, incremental=True, fingerprint=fingerprint)
+    except IntegrityError:
+        return None
+
+
+def enqueue_next_pages_crawl(search_obj: Search) -> Optional[CrawlJob]:
+    """
+    Queue the crawl of the next pages of a lazy crawl, unless a crawl of the
+    search or of the same filter is already queued or running.
+    """
+    fingerprint = search_obj.filter.fingerprint
+    if CrawlJob.objects.filter(
+        search=search_obj,
+        status__in=[CrawlJob.Status.PENDING, CrawlJob.Status.RUNNING],
+    ).exists():
+        return None
+    if get_in_flight_crawl_job(fingerprint) is not None:
+        return None
+
+    try:
+        with transaction.atomic():
+            return enqueue_crawl(search_obj, fingerprint=fingerprint)
+    except IntegrityError:
+        return None
+
+
+def claim_crawl_job(worker_id: str, lease_seconds: int) -> Optional[CrawlJob]:
+    """
+    Claim the oldest pending job, or a running one whose worker stopped sending
+    heartbeats. Rows locked by other workers are skipped, so concurrent
+    workers never claim the same job and never wait for each other.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            CrawlJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=CrawlJob.Status.PENDING)
+                | Q(status=CrawlJob.Status.RUNNING, lease_until__lt=now)
+            )
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = CrawlJob.Status.RUNNING
+        job.worker_id = worker_id
+        job.attempts += 1
+        job.heartbeat_at = now
+        job.lease_until = now + timedelta(seconds=lease_seconds)
+        job.save()
+
+    return job
+
+
+def renew_crawl_job_lease(job: CrawlJob, lease_seconds: int) -> bool:
+    """Extend the lease of a running job, False when another worker took it"""
+    now = timezone.now()
+    renewed = CrawlJob.objects.filter(
+        id=job.id, status=CrawlJob.Status.RUNNING, worker_id=job.worker_id
+    ).update(
+        heartbeat_at=now,
+        lease_until=now + timedelta(seconds=lease_seconds),
+        updated_at=now,
+    )
+    return renewed == 1
+
+
+def finish_crawl_job(job: CrawlJob) -> None:
+    CrawlJob.objects.filter(id=job.id, worker_id=job.worker_id).update(
+        status=CrawlJob.Status.DONE, lease_until=None, updated_at=timezone.now()
+    )
+
+
+def fail_crawl_job(job: CrawlJob, error: str, max_attempts: int) -> None:
+    """
+    Queue the job again, or give up on it after max_attempts crawls. The
+    search of a job given up, and the searches attached to it, fail too.
+    """
+    status = CrawlJob.Status.PENDING
+    if job.attempts >= max_attempts:
+        status = CrawlJob.Status.FAILED
+
+    with transaction.atomic():
+        failed = CrawlJob.objects.filter(id=job.id, worker_id=job.worker_id).update(
+            status=status, last_error=error, lease_until=None, updated_at=timezone.now()
+        )
+        if failed and status == CrawlJob.Status.FAILED:
+            fail_crawl_search(job.search_id)
+
+
+def fail_crawl_search(search_id: uuid.UUID) -> None:
+    """
+    Stop waiting for the crawl of a search. A finished search, refreshed by
+    the crawl, keeps its results as they are.
+    """
+    search_obj = (
+        Search.objects.filter(id=search_id)
+        .exclude(query_status=Search.QueryStatus.FINISHED)
+        .first()
+    )
+    if search_obj is None:
+        return
+
+    print(f"Search {search_id} failed, its crawl was given up")
+    search_obj.query_status = Search.QueryStatus.FAILED
+    # the next pages of a lazy crawl are not requested again
+    search_obj.next_page = 0
+    search_obj.save(update_fields=["query_status", "next_page"])
+    sync_attached_searches(search_obj)
+
+
+class LeaseLost(Exception):
+    """The lease of a crawl job was taken by another worker"""
+
+
+class CrawlJobHeartbeat:
+    """Renew the lease of a job from a background thread while it is crawled"""
+
+    def __init__(self, job: CrawlJob, lease_seconds: int, interval: float):
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.lease_lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                if not renew_crawl_job_lease(self.job, self.lease_seconds):
+                    print(f"Lease of crawl job {self.job.id} was lost")
+                    self.lease_lost = True
+                    return
+        finally:
+            # every thread has its own database connection
+            connection.close()
+
+    def check_lease(self) -> None:
+        """Raise LeaseLost once the lease could not be renewed"""
+        if self.lease_lost:
+            raise LeaseLost(f"Lease of crawl job {self.job.id} was lost")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+class CrawlWorker:
+    """Claim crawl jobs from the database and crawl them one at a time"""
+
+    def __init__(
+        self,
+        worker_id: str = None,
+        lease_seconds: int = None,
+        heartbeat_seconds: float = None,
+        max_attempts: int = None,
+        poll_seconds: float = None,
+    ):
+        if worker_id is None:
+            worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or settings.ISC_CRAWL_JOB_LEASE_SECONDS
+        self.heartbeat_seconds = (
+            heartbeat_seconds or settings.ISC_CRAWL_JOB_HEARTBEAT_SECONDS
+        )
+        self.max_attempts = max_attempts or settings.ISC_CRAWL_JOB_MAX_ATTEMPTS
+        self.poll_seconds = poll_seconds or settings.ISC_CRAWL_JOB_POLL_SECONDS
+
+        self.jobs_done = 0
+        self.jobs_failed = 0
+
+    def run_once(self) -> bool:
+        """Crawl a single job, False when there was no job to claim"""
+        job = claim_crawl_job(self.worker_id, self.lease_seconds)
+        if job is None:
+            return False
+
+        print(
+            f"Worker {self.worker_id} claimed crawl job {job.id} of search "
+            f"{job.search_id}, attempt {job.attempts}"
+        )
+        try:
+            with CrawlJobHeartbeat(
+                job, self.lease_seconds, self.heartbeat_seconds
+            ) as heartbeat:
+                if job.bulk_load:
+                    bulk_load_isc_real_estate_search(
+                        job.search_id,
+                        raise_errors=True,
+                        check_lease=heartbeat.check_lease,
+                    )
+                else:
+                    # an interrupted crawl continues from its checkpoint
+                    crawl_isc_real_estate_search(
+                        job.search_id,
+                        incremental=job.incremental,
+                        raise_errors=True,
+                        check_lease=heartbeat.check_lease,
+                    )
+        except LeaseLost as e:
+            # the worker that took the job crawls it, its status is left as is
+            print(f"Crawl job {job.id} stopped. Error: {e}")
+            return True
+        except Exception as e:
+            print(f"Crawl job {job.id} failed. Error: {e}")
+            traceback.print_exc()
+            fail_crawl_job(job, str(e), self.max_attempts)
+            self.jobs_failed += 1
+            return True
+
+        finish_crawl_job(job)
+        self.jobs_done += 1
+        return True
+
+    def run(self, stop_event: threading.Event) -> None:
+        """Crawl jobs until stop_event is set, the running crawl is finished"""
+        try:
+            while not stop_event.is_set():
+                # like after a request, a broken connection is opened again
+                close_old_connections()
+                if not self.run_once():
+                    stop_event.wait(self.poll_seconds)
+        finally:
+            connection.close()
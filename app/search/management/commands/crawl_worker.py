@@ -0,0 +1,58 @@
+"""
+Django command to run crawl workers, claiming crawl jobs from the database.
+"""
+
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search.jobs import CrawlWorker
+
+
+class Command(BaseCommand):
+    """Django command to run crawl workers."""
+
+    help = "Crawl queued searches, more processes can run in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.ISC_CRAWL_WORKERS,
+            help="Crawl workers in this process, each crawls one search at a time",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping, waiting for running crawls...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        workers = [CrawlWorker() for _ in range(options["workers"])]
+        threads = [
+            threading.Thread(target=worker.run, args=(stop_event,))
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(workers)} crawl workers")
+
+        # signals are only delivered to the main thread while it is not blocked
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+
+        jobs_done = sum(worker.jobs_done for worker in workers)
+        jobs_failed = sum(worker.jobs_failed for worker in workers)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Crawl workers stopped, {jobs_done} jobs done, {jobs_failed} failed"
+            )
+        )
@@ -0,0 +1,33 @@
+"""
+Django command to crawl every real estate of cities into the search catalog.
+"""
+
+from django.core.management.base import BaseCommand
+
+from search.catalog import refresh_city_catalog
+
+
+class Command(BaseCommand):
+    """Django command to refresh the catalog of cities."""
+
+    help = "Crawl every real estate of the cities, searches of them skip the crawl"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "cities", nargs="+", help="Cities as searched, like blumenau"
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        for city in options["cities"]:
+            catalog_city = refresh_city_catalog(city)
+            if catalog_city is None:
+                self.stdout.write(self.style.ERROR(f"Catalog of {city} failed"))
+                continue
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Catalog of {city}: {catalog_city.real_estate_count} real "
+                    f"estates, {len(catalog_city.neighborhood_names)} neighborhoods"
+                )
+            )
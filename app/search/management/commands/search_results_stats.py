@@ -0,0 +1,38 @@
+"""
+Django command to print how many searches reused results instead of crawling.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from search.services import get_search_results_reuse_stats
+
+
+class Command(BaseCommand):
+    """Django command to print search results reuse stats."""
+
+    help = "Hit rate of reused search results and crawl seconds saved"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Searches created in the last hours",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        since = timezone.now() - timedelta(hours=options["hours"])
+        stats = get_search_results_reuse_stats(since)
+
+        self.stdout.write(
+            f"Searches: {stats['searches']}, cache hits: {stats['cache_hits']}, "
+            f"narrower than a cached search: {stats['parent_search_hits']} "
+            f"({stats['hit_rate']:.1%}), attached to a running crawl: "
+            f"{stats['shared_crawls']}, answered from the catalog: "
+            f"{stats['catalog_hits']}, crawl seconds saved: "
+            f"{stats['crawl_seconds_saved']:.1f}"
+        )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_searchresultrealestate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlerRateLimit',
+            fields=[
+                ('host', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('rate', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+                ('blocked_until', models.DateTimeField()),
+            ],
+        ),
+    ]
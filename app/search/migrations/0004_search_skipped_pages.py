@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:38
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0003_crawlerratelimit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='skipped_pages',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:51
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0004_search_skipped_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchCrawlCheckpoint',
+            fields=[
+                ('search', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='search.search')),
+                ('filter_url', models.TextField()),
+                ('last_page', models.IntegerField(default=0)),
+                ('total_pages', models.IntegerField(default=0)),
+                ('reference_codes', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, size=None)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0006_crawljob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='bulk_load',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0007_crawljob_bulk_load'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='filter',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='crawl_leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attached_searches', to='search.search'),
+        ),
+        migrations.AddConstraint(
+            model_name='crawljob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running']), models.Q(('fingerprint', ''), _negated=True)), fields=('fingerprint',), name='search_crawljob_unique_fingerprint_in_flight'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0008_search_single_flight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='crawl_seconds',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='results_source',
+            field=models.CharField(choices=[('crawl', 'crawl'), ('shared_crawl', 'shared crawl'), ('cache', 'cache')], default='crawl', max_length=15),
+        ),
+    ]
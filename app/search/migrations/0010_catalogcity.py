@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:22
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0009_search_results_reuse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCity',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('city_names', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('neighborhood_names', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('real_estate_count', models.IntegerField(default=0)),
+                ('crawled_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='search',
+            name='results_source',
+            field=models.CharField(choices=[('crawl', 'crawl'), ('shared_crawl', 'shared crawl'), ('cache', 'cache'), ('catalog', 'catalog')], default='crawl', max_length=15),
+        ),
+    ]
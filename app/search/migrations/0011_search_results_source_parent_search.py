@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0010_catalogcity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='search',
+            name='results_source',
+            field=models.CharField(choices=[('crawl', 'crawl'), ('shared_crawl', 'shared crawl'), ('cache', 'cache'), ('catalog', 'catalog'), ('parent_search', 'parent search')], default='crawl', max_length=15),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0011_search_results_source_parent_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='next_page',
+            field=models.IntegerField(default=0),
+        ),
+    ]
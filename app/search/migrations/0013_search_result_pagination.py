@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:42
+
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('real_estate', '0013_realestate_catalog_index'),
+        ('search', '0012_search_next_page'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchresultrealestate',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddIndex(
+            model_name='search',
+            index=models.Index(fields=['created_by', 'created_at', 'id'], name='search_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchresultrealestate',
+            index=models.Index(fields=['search', 'created_at', 'id'], name='search_result_page_idx'),
+        ),
+    ]
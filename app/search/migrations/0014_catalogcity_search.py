@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0013_search_result_pagination'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogcity',
+            name='search',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='search.search'),
+        ),
+    ]
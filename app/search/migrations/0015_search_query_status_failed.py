@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0014_catalogcity_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='search',
+            name='query_status',
+            field=models.CharField(choices=[('not_started', 'not started'), ('started', 'started'), ('partial', 'partial'), ('finished', 'finished'), ('failed', 'failed')], default='not_started', max_length=15),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:45
+
+import search.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0015_search_query_status_failed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchresultrealestate',
+            name='created_at',
+            field=models.DateTimeField(db_default=search.models.ClockTimestamp()),
+        ),
+    ]
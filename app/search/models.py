@@ -1,4 +1,8 @@
+import hashlib
+import json
+import unicodedata
 import uuid
+from typing import List, Optional, Set
 
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
@@ -7,6 +11,34 @@ from user.models import User
 from real_estate.models import RealEstate
 
 
+class ClockTimestamp(models.Func):
+    """
+    Time the row is written. Unlike now(), which is the start of the
+    transaction, it differs for every row written by a single query.
+    """
+
+    template = "clock_timestamp()"
+    output_field = models.DateTimeField()
+
+
+def normalize_place_name(name: str) -> str:
+    """City or neighborhood name without case, accents, dashes or extra spaces"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.lower().replace("-", " ").split())
+
+
+def quantity_options(quantities: List[int]) -> Optional[Set[int]]:
+    """
+    Quantity options sent to ISC, up to 4 and then 5 meaning 5 or more. None
+    when there is no condition, no options or only 0.
+    """
+    options = {min(quantity, 5) for quantity in quantities}
+    if len(options) == 0 or options == {0}:
+        return None
+    return options
+
+
 class Filter(models.Model):
     """Model with parameters used in the filter for real estate"""
 
@@ -31,6 +63,71 @@ class Filter(models.Model):
     max_price = models.FloatField()
     min_area = models.FloatField()
     max_area = models.FloatField()
+    # filters with the same fingerprint crawl the same real estates
+    fingerprint = models.CharField(max_length=64, blank=True, default="", db_index=True)
+
+    def get_fingerprint(self) -> str:
+        """
+        Hash of the filter in a canonical form, lists sorted without repeated
+        items, normalized city and neighborhood names and the bounds as
+        numbers.
+        """
+        normalize_name = normalize_place_name
+        content = {
+            "property_type": sorted(set(self.property_type or [])),
+            "transaction_type": sorted(set(self.transaction_type or [])),
+            "city": sorted({normalize_name(city) for city in self.city}),
+            "neighborhood": sorted(
+                {normalize_name(neighborhood) for neighborhood in self.neighborhood}
+            ),
+            "bedroom_quantity": sorted(set(self.bedroom_quantity)),
+            "suite_quantity": sorted(set(self.suite_quantity)),
+            "bathroom_quantity": sorted(set(self.bathroom_quantity)),
+            "garage_slots_quantity": sorted(set(self.garage_slots_quantity)),
+            "min_price": float(self.min_price),
+            "max_price": float(self.max_price),
+            "min_area": float(self.min_area),
+            "max_area": float(self.max_area),
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def contains(self, other: "Filter") -> bool:
+        """
+        Whether every real estate found by the other filter is found by this
+        one. Same cities and types, the other neighborhoods, quantities and
+        ranges within the ones of this filter.
+        """
+        normalize_name = normalize_place_name
+        if set(self.property_type or []) != set(other.property_type or []):
+            return False
+        if set(self.transaction_type or []) != set(other.transaction_type or []):
+            return False
+        if {normalize_name(city) for city in self.city} != {
+            normalize_name(city) for city in other.city
+        }:
+            return False
+
+        # no neighborhoods is the whole city
+        if self.neighborhood:
+            neighborhoods = {normalize_name(name) for name in self.neighborhood}
+            other_neighborhoods = {normalize_name(name) for name in other.neighborhood}
+            if not other_neighborhoods or not other_neighborhoods <= neighborhoods:
+                return False
+
+        for field in ["bedroom_quantity", "suite_quantity", "garage_slots_quantity"]:
+            options = quantity_options(getattr(self, field))
+            other_options = quantity_options(getattr(other, field))
+            if options is None:
+                continue
+            if other_options is None or not other_options <= options:
+                return False
+
+        return (
+            self.min_price <= other.min_price
+            and other.max_price <= self.max_price
+            and self.min_area <= other.min_area
+            and other.max_area <= self.max_area
+        )
 
 
 class Search(models.Model):
@@ -43,6 +140,8 @@ class Search(models.Model):
         STARTED = "started", "started"
         PARTIAL = "partial", "partial"
         FINISHED = "finished", "finished"
+        # the crawl was given up after failing too many times
+        FAILED = "failed", "failed"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,9 +154,153 @@ class Search(models.Model):
     )
     # TODO - check if is possible to delete this, and only count search results
     number_real_estate_found = models.IntegerField(default=0)
+    # result pages that could not be fetched while crawling
+    skipped_pages = ArrayField(models.IntegerField(), default=list, blank=True)
+    # continuation cursor of a lazy crawl, the result page its next crawl
+    # starts from, 0 when there are no pages left
+    next_page = models.IntegerField(default=0)
+
+    # where the results came from, a crawl of the search, the crawl of the same
+    # filter it was attached to or a recent search of the same filter
+    class ResultsSource(models.TextChoices):
+        CRAWL = "crawl", "crawl"
+        SHARED_CRAWL = "shared_crawl", "shared crawl"
+        CACHE = "cache", "cache"
+        CATALOG = "catalog", "catalog"
+        PARENT_SEARCH = "parent_search", "parent search"
+
+    results_source = models.CharField(
+        max_length=15, choices=ResultsSource, default=ResultsSource.CRAWL
+    )
+    # when the crawl that found the results finished and how long it took,
+    # copied with the results so reused ones keep the age of the crawl
+    finished_at = models.DateTimeField(null=True, blank=True)
+    crawl_seconds = models.FloatField(default=0.0)
+    # search whose crawl, of the same filter, was running when this one was
+    # created. Its results are shown until they are copied when it finishes
+    crawl_leader = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="attached_searches",
+    )
+
+    def get_results_search_id(self) -> uuid.UUID:
+        """Search whose results are shown for this one"""
+        return self.crawl_leader_id or self.id
+
+    class Meta:
+        indexes = [
+            # pages of the searches of a user, newest first
+            models.Index(
+                fields=["created_by", "created_at", "id"],
+                name="search_page_idx",
+            ),
+        ]
 
 
 class SearchResultRealEstate(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # set by the database, results are inserted by raw INSERT ... SELECT too.
+    # Results come in the order they were written, also within a page, and
+    # results copied from another search keep its times
+    created_at = models.DateTimeField(db_default=ClockTimestamp())
     search = models.ForeignKey(Search, on_delete=models.CASCADE)
     real_estate = models.ForeignKey(RealEstate, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # pages of the results of a search
+            models.Index(
+                fields=["search", "created_at", "id"],
+                name="search_result_page_idx",
+            ),
+        ]
+
+
+class CrawlerRateLimit(models.Model):
+    """Token bucket of a crawled host, shared by all crawler workers"""
+
+    host = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()
+    # requests per second, adapted to how the host is answering
+    rate = models.FloatField()
+    updated_at = models.DateTimeField()
+    blocked_until = models.DateTimeField()
+
+
+class SearchCrawlCheckpoint(models.Model):
+    """Progress of the crawl of a search, so an interrupted crawl is resumed"""
+
+    search = models.OneToOneField(Search, on_delete=models.CASCADE, primary_key=True)
+    # a checkpoint of another filter or ordering is not resumed
+    filter_url = models.TextField()
+    last_page = models.IntegerField(default=0)
+    total_pages = models.IntegerField(default=0)
+    # real estates already stored as results of the search
+    reference_codes = ArrayField(
+        models.CharField(max_length=50), default=list, blank=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class CrawlJob(models.Model):
+    """
+    Crawl of a search waiting for a crawl worker. Workers claim jobs with
+    SELECT ... FOR UPDATE SKIP LOCKED and keep a lease while crawling, a job
+    whose lease expired is claimed again by another worker.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "pending"
+        RUNNING = "running", "running"
+        DONE = "done", "done"
+        FAILED = "failed", "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    search = models.ForeignKey(Search, on_delete=models.CASCADE)
+    incremental = models.BooleanField(default=False)
+    # loaded with COPY, for city wide and backfill crawls
+    bulk_load = models.BooleanField(default=False)
+    status = models.CharField(max_length=15, choices=Status, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    worker_id = models.CharField(max_length=255, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    # fingerprint of the filter, a single crawl of a filter is queued or running
+    fingerprint = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # jobs to claim, pending ones and running ones with an expired lease
+            models.Index(fields=["status", "created_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fingerprint"],
+                condition=models.Q(status__in=["pending", "running"])
+                & ~models.Q(fingerprint=""),
+                name="search_crawljob_unique_fingerprint_in_flight",
+            ),
+        ]
+
+
+class CatalogCity(models.Model):
+    """
+    City whose real estates were crawled as a whole. While the crawl is
+    recent, searches of the city are answered from the stored real estates.
+    """
+
+    # normalized with normalize_place_name
+    name = models.CharField(max_length=100, primary_key=True)
+    # names as stored in the real estates of the city
+    city_names = ArrayField(models.CharField(max_length=100), default=list)
+    neighborhood_names = ArrayField(models.CharField(max_length=100), default=list)
+    real_estate_count = models.IntegerField(default=0)
+    crawled_at = models.DateTimeField()
+    # crawl of the whole city, only the real estates it found are searched
+    search = models.ForeignKey(Search, on_delete=models.SET_NULL, blank=True, null=True)
@@ -0,0 +1,338 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from search.webcrawler_http import FetchStatus
+from search.webcrawler_isc import (
+    WebcrawlerISCRealEstate,
+    WebsiteISCPageContent,
+    parse_result_page,
+)
+
+# parse executors by number of processes, shared by every crawl of the process
+parse_executors: Dict[int, Executor] = {}
+parse_executors_lock = threading.Lock()
+
+
+def get_parse_executor(processes: int) -> Executor:
+    """
+    Pool of worker processes that parse result pages, created on first use.
+    Without processes the pages are parsed in threads of this process.
+    """
+    processes = max(0, processes)
+    with parse_executors_lock:
+        executor = parse_executors.get(processes)
+        if executor is None:
+            if processes == 0:
+                executor = ThreadPoolExecutor(max_workers=1)
+            else:
+                # spawned, forking a process with running threads is not safe
+                executor = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            parse_executors[processes] = executor
+
+        return executor
+
+
+def timed_parse_result_page(*args) -> Tuple[WebsiteISCPageContent, float]:
+    """parse_result_page and the seconds it took, measured in the worker"""
+    start = time.perf_counter()
+    page_content = parse_result_page(*args)
+    return page_content, time.perf_counter() - start
+
+
+class PipelineStageStats:
+    """Throughput of a stage and the time it was held back by the next one"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    def record(self, busy_seconds: float, items: int = 1) -> None:
+        with self.lock:
+            self.items += items
+            self.busy_seconds += busy_seconds
+
+    def record_blocked(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_seconds += seconds
+
+    def as_dict(self, elapsed: float) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "items": self.items,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "blocked_seconds": round(self.blocked_seconds, 3),
+                "items_per_second": round(self.items / elapsed, 2) if elapsed else 0.0,
+            }
+
+
+class CrawlPipelineStopped(Exception):
+    pass
+
+
+class ParserDone:
+    """Marks the parser stage has no more pages"""
+
+
+class CrawlPipeline:
+    """
+    Crawl the result pages of a search in three stages joined by bounded
+    queues, so pages are fetched, parsed and written at the same time.
+    - fetchers: threads requesting pages, I/O bound
+    - parser: pages parsed in a pool of worker processes, away from the GIL
+    - writer: the calling thread, gets pages in order and writes them in batches
+
+    Fetchers never get more than `window` pages ahead of the writer, a slow
+    stage holds back the ones before it instead of piling pages in memory.
+    """
+
+    def __init__(
+        self,
+        crawler: WebcrawlerISCRealEstate,
+        fetch_workers: int = 4,
+        parse_processes: int = 2,
+        queue_size: int = 8,
+        write_batch_pages: int = 5,
+    ):
+        self.crawler = crawler
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_processes = parse_processes
+        self.queue_size = max(1, queue_size)
+        self.write_batch_pages = max(1, write_batch_pages)
+        # pages fetched, parsed or waiting for the writer at the same time
+        self.window = self.fetch_workers + 2 * self.queue_size
+
+        self.fetch_stats = PipelineStageStats("fetch")
+        self.parse_stats = PipelineStageStats("parse")
+        self.write_stats = PipelineStageStats("write")
+        self.elapsed = 0.0
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stats.name: stats.as_dict(self.elapsed)
+            for stats in [self.fetch_stats, self.parse_stats, self.write_stats]
+        }
+
+    def run(
+        self,
+        write_pages: Callable[[List[WebsiteISCPageContent]], None],
+        start_page: int = 1,
+    ) -> None:
+        """
+        Crawl the pages from start_page on, calling write_pages with batches
+        of consecutive pages. An error of any stage stops the pipeline and is
+        raised here.
+        """
+        start = time.perf_counter()
+        try:
+            self._run(write_pages, max(1, start_page))
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def _run(
+        self,
+        write_pages: Callable[[List[WebsiteISCPageContent]], None],
+        start_page: int,
+    ) -> None:
+        crawler = self.crawler
+        crawler.page = start_page
+        crawler.page_last = -1
+        crawler.real_estate_count = -1
+
+        # the first page tells how many pages the search has
+        fetch_start = time.perf_counter()
+        fetch_result = crawler.make_request(page=start_page)
+        self.fetch_stats.record(time.perf_counter() - fetch_start)
+        parse_start = time.perf_counter()
+        first_page = crawler.build_page_content(start_page, fetch_result)
+        self.parse_stats.record(time.perf_counter() - parse_start)
+        self.write([first_page], write_pages)
+
+        # without the first page the number of pages is unknown
+        if first_page.fetch_status == FetchStatus.FAILED:
+            return
+        if crawler.page_last <= start_page:
+            return
+
+        self.stop_event = threading.Event()
+        self.errors = []
+        self.window_slots = threading.Semaphore(self.window)
+        self.next_pages = iter(range(start_page + 1, crawler.page_last + 1))
+        self.next_pages_lock = threading.Lock()
+        self.fetched_queue = queue.Queue(maxsize=self.queue_size)
+        self.parsed_queue = queue.Queue(maxsize=self.queue_size)
+
+        fetchers = [
+            threading.Thread(target=self.fetch_stage, daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        parser = threading.Thread(
+            target=self.parse_stage, args=(len(fetchers),), daemon=True
+        )
+        for thread in fetchers + [parser]:
+            thread.start()
+
+        try:
+            self.write_stage(start_page + 1, write_pages)
+        except BaseException as e:
+            self.errors.append(e)
+        finally:
+            self.stop_event.set()
+            for thread in fetchers + [parser]:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+    def put(self, output_queue: queue.Queue, item, stats: PipelineStageStats):
+        """Put on a bounded queue, waiting while it is full unless stopping"""
+        blocked_start = time.perf_counter()
+        while True:
+            try:
+                output_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if self.stop_event.is_set():
+                    raise CrawlPipelineStopped()
+
+        stats.record_blocked(time.perf_counter() - blocked_start)
+
+    def fetch_stage(self) -> None:
+        try:
+            while not self.stop_event.is_set():
+                # a page slot is released once the page is written
+                blocked_start = time.perf_counter()
+                while not self.window_slots.acquire(timeout=0.1):
+                    if self.stop_event.is_set():
+                        return
+                self.fetch_stats.record_blocked(time.perf_counter() - blocked_start)
+
+                with self.next_pages_lock:
+                    page = next(self.next_pages, None)
+                if page is None:
+                    return
+
+                fetch_start = time.perf_counter()
+                fetch_result = self.crawler.make_request(page=page)
+                self.fetch_stats.record(time.perf_counter() - fetch_start)
+
+                self.put(self.fetched_queue, (page, fetch_result), self.fetch_stats)
+        except CrawlPipelineStopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            try:
+                # tells the parser this fetcher is done
+                self.put(self.fetched_queue, None, self.fetch_stats)
+            except CrawlPipelineStopped:
+                pass
+
+    def parse_stage(self, fetchers: int) -> None:
+        executor = get_parse_executor(self.parse_processes)
+        try:
+            while fetchers > 0:
+                try:
+                    item = self.fetched_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop_event.is_set():
+                        return
+                    continue
+
+                if item is None:
+                    fetchers -= 1
+                    continue
+
+                page, fetch_result = item
+                future = executor.submit(
+                    timed_parse_result_page,
+                    self.crawler.parser,
+                    page,
+                    fetch_result,
+                    self.crawler.real_estate_count,
+                    self.crawler.page_last,
+                )
+                self.put(self.parsed_queue, future, self.parse_stats)
+
+            self.put(self.parsed_queue, None, self.parse_stats)
+        except CrawlPipelineStopped:
+            pass
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def write_stage(
+        self,
+        next_page: int,
+        write_pages: Callable[[List[WebsiteISCPageContent]], None],
+    ) -> None:
+        # fetches finish out of order, a page waits here for the ones before it
+        parsed_pages: Dict[int, WebsiteISCPageContent] = {}
+        batch = []
+        parser_done = False
+
+        def write_batch():
+            self.write(list(batch), write_pages)
+            # fetchers may request as many pages as were written
+            for _ in batch:
+                self.window_slots.release()
+            batch.clear()
+
+        while not parser_done or batch:
+            if self.errors:
+                return
+
+            item = self.next_parsed_page(block=not batch)
+            if item is None and not batch and self.stop_event.is_set():
+                return
+
+            if isinstance(item, Future):
+                page_content, parse_seconds = item.result()
+                self.parse_stats.record(parse_seconds)
+                parsed_pages[page_content.page] = page_content
+            elif item is ParserDone:
+                parser_done = True
+
+            while next_page in parsed_pages:
+                batch.append(parsed_pages.pop(next_page))
+                next_page += 1
+                if len(batch) >= self.write_batch_pages:
+                    write_batch()
+
+            # a partial batch is written once nothing else is ready
+            if batch and (item is None or parser_done):
+                write_batch()
+
+    def next_parsed_page(self, block: bool) -> Optional[object]:
+        """Next future of the parser, ParserDone at the end, None when none is ready"""
+        while True:
+            try:
+                if block:
+                    item = self.parsed_queue.get(timeout=0.1)
+                else:
+                    item = self.parsed_queue.get_nowait()
+            except queue.Empty:
+                if block and not self.stop_event.is_set():
+                    continue
+                return None
+
+            return ParserDone if item is None else item
+
+    def write(
+        self,
+        batch: List[WebsiteISCPageContent],
+        write_pages: Callable[[List[WebsiteISCPageContent]], None],
+    ) -> None:
+        write_start = time.perf_counter()
+        write_pages(batch)
+        self.write_stats.record(time.perf_counter() - write_start, len(batch))
@@ -3,7 +3,10 @@ Serializers for search API
 """
 
 from rest_framework import serializers
-from common.pagination.serializers import PaginationSerializer
+from common.pagination.serializers import (
+    PaginationParamsSerializer,
+    PaginationSerializer,
+)
 
 from search.models import Search, Filter
 from real_estate.models import RealEstate
@@ -116,3 +119,11 @@ class SearchResultListSerializer(PaginationSerializer):
     """Serializer to list real estate related to a search"""
 
     data = SearchResultRealEstateSerializer(many=True)
+
+
+class SearchResultListParamsSerializer(PaginationParamsSerializer):
+    """Query params to list real estate related to a search"""
+
+    # index of the result being seen, the next pages of a lazy crawl are
+    # crawled once it gets near the last results
+    position = serializers.IntegerField(min_value=0, required=False)
@@ -1,26 +1,74 @@
-from typing import Dict, List
+from datetime import datetime, timedelta
+from typing import Dict, Optional
 import requests
 import os
 from asyncio import create_task
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
 from django.http.request import QueryDict
 from django.db.models.query import QuerySet
 
-from search.models import Filter, Search, SearchResultRealEstate
+from search.models import CrawlJob, Filter, Search, SearchResultRealEstate
 from search.serializers import (
     SearchCreateSerializer,
     SearchRetrieveSerializer,
     SearchListSerializer,
+    SearchResultListParamsSerializer,
     SearchResultListSerializer,
 )
 
 from user.models import User
 
 from common.errors.errors import SerializationError, DeserializationError
+from common.pagination.paginator import KeysetPaginator, Page
+from common.pagination.serializers import PaginationParamsSerializer
 
-from search.task import crawl_isc_real_estate_search
+from search.catalog import (
+    answer_search_from_catalog,
+    build_parent_results_queryset,
+    insert_search_results,
+)
+from search.jobs import (
+    enqueue_next_pages_crawl,
+    enqueue_or_attach_crawl,
+    enqueue_refresh_crawl,
+    get_in_flight_crawl_job,
+)
+from search.task import copy_search_results
 from search.webcrawler_isc import WebsiteISCFilter
 
+# recent searches compared with a new filter looking for a broader one
+PARENT_SEARCH_CANDIDATES = 20
+
+# fields of a real estate shown in the list of results of a search
+RESULT_REAL_ESTATE_FIELDS = [
+    "real_estate__id",
+    "real_estate__property_type",
+    "real_estate__transaction_type",
+    "real_estate__city",
+    "real_estate__neighborhood",
+    "real_estate__bedroom_quantity",
+    "real_estate__suite_quantity",
+    "real_estate__garage_slots_quantity",
+    "real_estate__price",
+    "real_estate__cond_price",
+    "real_estate__area",
+    "real_estate__area_total",
+    "real_estate__thumb_url",
+]
+
+search_paginator = KeysetPaginator(
+    ordering=["-created_at", "-id"], select_related=["filter"]
+)
+search_result_paginator = KeysetPaginator(
+    ordering=["created_at", "id"],
+    select_related=["real_estate"],
+    only=RESULT_REAL_ESTATE_FIELDS,
+)
+
 
 def deserialize_create_search(data: QueryDict) -> Dict:
     data_in = SearchCreateSerializer(data=data)
@@ -77,9 +125,9 @@ def serialize_create_search(search_obj: Search) -> Dict:
     return data_out.validated_data
 
 
-def serialize_list_search(search_queryset: QuerySet) -> Dict:
+def serialize_list_search(page: Page) -> Dict:
     data_list = []
-    for search_obj in search_queryset:
+    for search_obj in page.items:
         search_dict = {
             "id": search_obj.id,
             "query_status": search_obj.query_status,
@@ -103,12 +151,7 @@ def serialize_list_search(search_queryset: QuerySet) -> Dict:
 
     list_response_dict = {
         "data": data_list,
-        "meta": {
-            "total": 0,
-            "page": 0,
-            "per_page": 0,
-            "total_pages": 0,
-        },
+        "meta": page.get_meta(),
     }
 
     list_serializer = SearchListSerializer(data=list_response_dict)
@@ -153,15 +196,199 @@ def create_search(user: User, data: Dict) -> Search:
     if request_user.is_anonymous == True:
         request_user = None
 
-    filter_obj = Filter.objects.create(created_by=request_user, **data)
-    search_obj = Search.objects.create(created_by=request_user, filter=filter_obj)
+    filter_obj = Filter(created_by=request_user, **data)
+    filter_obj.fingerprint = filter_obj.get_fingerprint()
+
+    # retries and double submits get the search created the first time
+    search_obj = get_in_flight_search(request_user, filter_obj.fingerprint)
+    if search_obj is not None:
+        return search_obj
+
+    # a filter searched a moment ago is not crawled again, neither is a
+    # narrower one, answered from the results of the broader search
+    cached_search = get_cached_search(filter_obj.fingerprint)
+    parent_search = None
+    if cached_search is None:
+        parent_search = get_parent_search(filter_obj)
+
+    with transaction.atomic():
+        filter_obj.save()
+        search_obj = Search.objects.create(created_by=request_user, filter=filter_obj)
+
+        if cached_search is not None:
+            reuse_search_results(search_obj, cached_search)
+            return search_obj
+
+        if parent_search is not None and reuse_parent_search_results(
+            search_obj, parent_search
+        ):
+            return search_obj
 
-    # TODO - trigger function
-    crawl_isc_real_estate_search(search_obj.id)
+        # cities crawled as a whole are searched in the database
+        if answer_search_from_catalog(search_obj):
+            return search_obj
+
+        # crawled by a crawl worker, the search stays not started until then.
+        # A search of a filter being crawled waits for that crawl instead
+        enqueue_or_attach_crawl(search_obj, filter_obj.fingerprint)
 
     return search_obj
 
 
+def get_cached_search(fingerprint: str) -> Optional[Search]:
+    """
+    Most recently crawled finished search of the filter, within the freshness
+    window or the stale window after it, with every result page crawled
+    """
+    max_age = (
+        settings.ISC_SEARCH_RESULTS_FRESH_SECONDS
+        + settings.ISC_SEARCH_RESULTS_STALE_SECONDS
+    )
+    if max_age <= 0:
+        return None
+
+    return (
+        Search.objects.filter(
+            filter__fingerprint=fingerprint,
+            query_status=Search.QueryStatus.FINISHED,
+            skipped_pages=[],
+            finished_at__gte=timezone.now() - timedelta(seconds=max_age),
+        )
+        .order_by("-finished_at")
+        .first()
+    )
+
+
+def reuse_search_results(search_obj: Search, cached_search: Search) -> None:
+    """
+    Finish a search with a copy of the results of cached_search. Stale results
+    are refreshed by an incremental crawl of the search.
+    """
+    copied = copy_search_results(cached_search.id, search_obj.id)
+
+    search_obj.results_source = Search.ResultsSource.CACHE
+    search_obj.query_status = Search.QueryStatus.FINISHED
+    search_obj.number_real_estate_found = cached_search.number_real_estate_found
+    search_obj.finished_at = cached_search.finished_at
+    search_obj.crawl_seconds = cached_search.crawl_seconds
+    search_obj.save()
+
+    age = (timezone.now() - cached_search.finished_at).total_seconds()
+    print(
+        f"Search {search_obj.id} reused {copied} results of search "
+        f"{cached_search.id} crawled {age:.0f}s ago, "
+        f"saved {cached_search.crawl_seconds:.1f} crawl seconds"
+    )
+
+    if age > settings.ISC_SEARCH_RESULTS_FRESH_SECONDS:
+        enqueue_refresh_crawl(search_obj, search_obj.filter.fingerprint)
+
+
+def get_parent_search(filter_obj: Filter) -> Optional[Search]:
+    """
+    Most recently crawled fresh search whose filter contains this one, with
+    every result page crawled
+    """
+    if settings.ISC_SEARCH_RESULTS_FRESH_SECONDS <= 0:
+        return None
+
+    # bounds and types narrow the candidates, names are compared normalized
+    candidates = (
+        Search.objects.filter(
+            query_status=Search.QueryStatus.FINISHED,
+            skipped_pages=[],
+            finished_at__gte=timezone.now()
+            - timedelta(seconds=settings.ISC_SEARCH_RESULTS_FRESH_SECONDS),
+            filter__property_type__contains=filter_obj.property_type or [],
+            filter__transaction_type__contains=filter_obj.transaction_type or [],
+            filter__min_price__lte=filter_obj.min_price,
+            filter__max_price__gte=filter_obj.max_price,
+            filter__min_area__lte=filter_obj.min_area,
+            filter__max_area__gte=filter_obj.max_area,
+        )
+        .select_related("filter")
+        .order_by("-finished_at")[:PARENT_SEARCH_CANDIDATES]
+    )
+
+    for candidate in candidates:
+        if candidate.filter.contains(filter_obj):
+            return candidate
+
+    return None
+
+
+def reuse_parent_search_results(search_obj: Search, parent_search: Search) -> bool:
+    """
+    Finish a search with the results of a broader search filtered by its
+    filter. False when the results can not be filtered.
+    """
+    queryset = build_parent_results_queryset(search_obj.filter, parent_search)
+    if queryset is None:
+        return False
+
+    found = insert_search_results(search_obj, queryset)
+
+    search_obj.results_source = Search.ResultsSource.PARENT_SEARCH
+    search_obj.query_status = Search.QueryStatus.FINISHED
+    search_obj.number_real_estate_found = found
+    search_obj.finished_at = parent_search.finished_at
+    search_obj.crawl_seconds = parent_search.crawl_seconds
+    search_obj.save()
+
+    print(
+        f"Search {search_obj.id} reused {found} of the "
+        f"{parent_search.number_real_estate_found} results of broader search "
+        f"{parent_search.id}"
+    )
+    return True
+
+
+def get_search_results_reuse_stats(since: datetime) -> Dict:
+    """Searches created since then whose results were reused instead of crawled"""
+    searches = Search.objects.filter(created_at__gte=since)
+    stats = searches.aggregate(
+        searches=Count("id"),
+        cache_hits=Count("id", filter=Q(results_source=Search.ResultsSource.CACHE)),
+        shared_crawls=Count(
+            "id", filter=Q(results_source=Search.ResultsSource.SHARED_CRAWL)
+        ),
+        catalog_hits=Count("id", filter=Q(results_source=Search.ResultsSource.CATALOG)),
+        parent_search_hits=Count(
+            "id", filter=Q(results_source=Search.ResultsSource.PARENT_SEARCH)
+        ),
+        crawl_seconds_saved=Sum(
+            "crawl_seconds",
+            filter=Q(
+                results_source__in=[
+                    Search.ResultsSource.CACHE,
+                    Search.ResultsSource.PARENT_SEARCH,
+                ]
+            ),
+            default=0.0,
+        ),
+    )
+    hits = stats["cache_hits"] + stats["parent_search_hits"]
+    stats["hit_rate"] = round(hits / stats["searches"], 4) if stats["searches"] else 0.0
+    return stats
+
+
+def get_in_flight_search(user: Optional[User], fingerprint: str) -> Optional[Search]:
+    """Search of the user whose crawl, of the same filter, is queued or running"""
+    job = get_in_flight_crawl_job(fingerprint)
+    if job is None:
+        return None
+
+    if job.search.created_by_id == (user.id if user else None):
+        return job.search
+
+    return (
+        Search.objects.select_related("filter")
+        .filter(crawl_leader=job.search, created_by=user)
+        .order_by("created_at")
+        .first()
+    )
+
+
 def list_search(user: User) -> QuerySet:
     """List search entries"""
     if user.is_anonymous == True:
@@ -176,42 +403,94 @@ def get_search(id: str) -> Search:
     return Search.objects.get(id=id)
 
 
-def list_search_result(search_id: str) -> QuerySet:
-    """List real estates with certain search_id"""
-    return SearchResultRealEstate.objects.filter(search=search_id)
+def deserialize_list_search_params(query_params: QueryDict) -> Dict:
+    data_in = PaginationParamsSerializer(data=query_params)
+    if not data_in.is_valid():
+        raise DeserializationError(data_in.errors)
+
+    return data_in.validated_data
+
 
+def deserialize_list_search_result_params(query_params: QueryDict) -> Dict:
+    data_in = SearchResultListParamsSerializer(data=query_params)
+    if not data_in.is_valid():
+        raise DeserializationError(data_in.errors)
 
-def serialize_search_result(queryset: List[SearchResultRealEstate]) -> Dict:
-    """Convert queryset result to expected serialize format"""
+    return data_in.validated_data
+
+
+def list_search_result(search_id: str, position: Optional[int] = None) -> QuerySet:
+    """
+    List real estates with certain search_id. The position of the result being
+    seen may trigger the crawl of the next pages of a lazy crawl.
+    """
+    # a search attached to a running crawl shows the results of its leader
+    search_obj = Search.objects.only("id", "crawl_leader").filter(id=search_id).first()
+    if search_obj is not None:
+        search_id = search_obj.get_results_search_id()
+
+    queryset = SearchResultRealEstate.objects.filter(search=search_id)
+    if search_obj is not None and position is not None:
+        request_next_pages(search_id, queryset, position)
+
+    return queryset
+
+
+def request_next_pages(
+    search_id: str, results: QuerySet, position: int
+) -> Optional[CrawlJob]:
+    """
+    Queue the crawl of the next pages of a lazy crawl once there are
+    ISC_CRAWLER_LAZY_PREFETCH_RESULTS results or less after position
+    """
+    search_obj = (
+        Search.objects.select_related("filter")
+        .filter(id=search_id, next_page__gt=0)
+        .first()
+    )
+    if search_obj is None:
+        return None
+
+    results_left = results.count() - position
+    if results_left > settings.ISC_CRAWLER_LAZY_PREFETCH_RESULTS:
+        return None
+
+    job = enqueue_next_pages_crawl(search_obj)
+    if job is not None:
+        print(
+            f"Search {search_id} has {results_left} results left, queued the "
+            f"crawl of the pages from page {search_obj.next_page}"
+        )
+    return job
+
+
+def serialize_search_result(page: Page) -> Dict:
+    """Convert a page of search results to expected serialize format"""
     real_estate_list = []
 
-    for search_result_element in queryset:
+    for search_result_element in page.items:
+        real_estate = search_result_element.real_estate
         data_out = {
-            "id": search_result_element.real_estate.id,
-            "property_type": search_result_element.real_estate.property_type,
-            "transaction_type": search_result_element.real_estate.transaction_type,
-            "city": search_result_element.real_estate.city,
-            "neighborhood": search_result_element.real_estate.neighborhood,
-            "bedroom_quantity": search_result_element.real_estate.bedroom_quantity,
-            "suite_quantity": search_result_element.real_estate.suite_quantity,
-            "garage_slots_quantity": search_result_element.real_estate.suite_quantity,
-            "price": search_result_element.real_estate.price,
-            "condo_price": search_result_element.real_estate.cond_price,
-            "area": search_result_element.real_estate.area,
-            "area_total": search_result_element.real_estate.area_total,
-            "thumb_urls": search_result_element.real_estate.thumb_url,
+            "id": real_estate.id,
+            "property_type": real_estate.property_type,
+            "transaction_type": real_estate.transaction_type,
+            "city": real_estate.city,
+            "neighborhood": real_estate.neighborhood,
+            "bedroom_quantity": real_estate.bedroom_quantity,
+            "suite_quantity": real_estate.suite_quantity,
+            "garage_slots_quantity": real_estate.garage_slots_quantity,
+            "price": real_estate.price,
+            "condo_price": real_estate.cond_price,
+            "area": real_estate.area,
+            "area_total": real_estate.area_total,
+            "thumb_urls": real_estate.thumb_url,
         }
 
         real_estate_list.append(data_out)
 
     list_response_dict = {
         "data": real_estate_list,
-        "meta": {
-            "total": 0,
-            "page": 0,
-            "per_page": 0,
-            "total_pages": 0,
-        },
+        "meta": page.get_meta(),
     }
 
     serialize = SearchResultListSerializer(data=list_response_dict)
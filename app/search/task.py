@@ -1,17 +1,58 @@
+import threading
+import time
 import traceback
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from uuid import UUID
-from typing import List, Optional
-
-
-from search.models import Search, SearchResultRealEstate
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.db import transaction
+from django.db.models import Model
+from django.utils import timezone
+
+from search.bulk_load import bulk_load_real_estates
+from search.models import Search, SearchCrawlCheckpoint, SearchResultRealEstate
+from search.pipeline import CrawlPipeline
+from search.webcrawler_http import (
+    FetchStatus,
+    HTTPRequestError,
+    get_session_factory,
+    set_rate_limit_connection_factory,
+)
 from search.webcrawler_isc import (
     WebsiteISCFilter,
+    WebsiteISCOrder,
+    WebsiteISCPageContent,
     WebcrawlerISCRealEstate,
     WebsiteISCRealEstateInfo,
 )
 
-from real_estate.models import RealEstate, Agency
+from real_estate.models import RealEstate, RealEstateUpdate, Agency
+from radar.models import RadarRealEstate
+from radar.percolator import percolate_real_estates
+
+
+@contextmanager
+def rate_limit_connection():
+    """
+    psycopg2 connection of its own for the Postgres backed rate limiter of the
+    crawler, committed and closed after every query. It is never the thread
+    connection, so the bucket row is not locked until the page being written
+    commits and the fetch threads leave no connection open.
+    """
+    rate_limit_conn = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        rate_limit_conn.ensure_connection()
+        with rate_limit_conn.connection as conn:
+            yield conn
+    finally:
+        rate_limit_conn.close()
+
+
+set_rate_limit_connection_factory(rate_limit_connection)
 
 
 def extract_property_type_from_url(real_estate_url: str) -> RealEstate.PropertyType:
@@ -62,35 +103,26 @@ def convert_values_to_float(value: str) -> float:
     return tmp_value
 
 
-def create_real_estate_object(
-    real_estate_info: WebsiteISCRealEstateInfo, search_obj: Search
-) -> Optional[RealEstate]:
-    print(f"Creating real estate object for code {real_estate_info.code}")
-    try:
-        agency_obj = Agency.objects.get(profile_url=real_estate_info.agency.profile_url)
-    except Agency.DoesNotExist:
-        try:
-            print(f"Creating agency object for name {real_estate_info.agency.name}")
-            agency_obj = Agency(
-                name=real_estate_info.agency.name,
-                logo_url=real_estate_info.agency.logo_url,
-                profile_url=real_estate_info.agency.profile_url,
-                creci="",
-                city="",
-                address_street="",
-                address_number="",
-                contact_number_1="",
-                contact_number_2="",
-                contact_whatsapp="",
-            )
-            agency_obj.save()
+def build_agency_object(real_estate_info: WebsiteISCRealEstateInfo) -> Agency:
+    print(f"Creating agency object for name {real_estate_info.agency.name}")
+    return Agency(
+        name=real_estate_info.agency.name,
+        logo_url=real_estate_info.agency.logo_url,
+        profile_url=real_estate_info.agency.profile_url,
+        creci="",
+        city="",
+        address_street="",
+        address_number="",
+        contact_number_1="",
+        contact_number_2="",
+        contact_whatsapp="",
+    )
 
-        except Exception as e:
-            print(
-                f"Failed to create agency object for name {real_estate_info.agency.name}. Error: {e}."
-            )
-            return None
 
+def build_real_estate_object(
+    real_estate_info: WebsiteISCRealEstateInfo, agency_id: UUID
+) -> RealEstate:
+    print(f"Creating real estate object for code {real_estate_info.code}")
     if real_estate_info.url is None:
         raise ValueError(
             f"Failed to create real estate {real_estate_info.code} - URL is None"
@@ -101,6 +133,7 @@ def create_real_estate_object(
     price = convert_values_to_float(real_estate_info.price)
     area = convert_values_to_float(real_estate_info.space)
 
+    # converted to the stored types, so the content hash matches stored rows
     bedrooms = real_estate_info.bedrooms
     if len(bedrooms) == 0:
         bedrooms = 0
@@ -113,43 +146,426 @@ def create_real_estate_object(
     if len(garage_slots) == 0:
         garage_slots = 0
 
+    re_obj = RealEstate(
+        reference_code=real_estate_info.code,
+        property_type=property_type,
+        transaction_type=transaction_type,
+        city=real_estate_info.city,
+        neighborhood=real_estate_info.neighborhood,
+        bedroom_quantity=int(bedrooms),
+        suite_quantity=int(suites),
+        bathroom_quantity=0,
+        garage_slots_quantity=int(garage_slots),
+        price=price,
+        area=area,
+        area_total=area,
+        available=True,
+        agency_id=agency_id,
+        cond_price=0.0,
+        description="",
+        thumb_url=real_estate_info.thumb_urls,
+        url=real_estate_info.url,
+    )
+    re_obj.content_hash = re_obj.get_content_hash()
+    return re_obj
+
+
+def bulk_create_objects(
+    objs: List[Model], ignore_conflicts: bool = False
+) -> List[Model]:
+    """
+    Insert the objects with one query. If it fails they are inserted one at a
+    time, so a single bad listing does not drop the whole page.
+    With ignore_conflicts, rows whose unique fields were inserted by another
+    crawl are skipped. They are still returned, so the stored rows must be
+    selected again.
+    """
+    if len(objs) == 0:
+        return []
+
+    model = type(objs[0])
     try:
-        re_obj = RealEstate(
-            reference_code=real_estate_info.code,
-            property_type=property_type,
-            transaction_type=transaction_type,
-            city=real_estate_info.city,
-            neighborhood=real_estate_info.neighborhood,
-            bedroom_quantity=bedrooms,
-            suite_quantity=suites,
-            bathroom_quantity=0,
-            garage_slots_quantity=garage_slots,
-            price=price,
-            area=area,
-            area_total=area,
-            available=True,
-            agency=agency_obj,
-            cond_price=0.0,
-            description="",
-            thumb_url=real_estate_info.thumb_urls,
-            url=real_estate_info.url,
-        )
-        re_obj.save()
-        return re_obj
-    except Exception as e:
+        with transaction.atomic():
+            return model.objects.bulk_create(objs, ignore_conflicts=ignore_conflicts)
+    except DatabaseError as e:
         print(
-            f"Failed to create real estate object for code {real_estate_info.code}. Error: {e}."
+            f"Failed to bulk create {len(objs)} {model.__name__} objects. Error: {e}."
         )
-        return None
+
+    created_objs = []
+    for obj in objs:
+        try:
+            with transaction.atomic():
+                if ignore_conflicts:
+                    model.objects.bulk_create([obj], ignore_conflicts=True)
+                else:
+                    obj.save(force_insert=True)
+            created_objs.append(obj)
+        except DatabaseError as e:
+            print(f"Failed to create {model.__name__} object {obj.pk}. Error: {e}.")
+
+    return created_objs
+
+
+class AgencyCache:
+    """Bounded LRU of agency profile URL to agency ID, shared by the crawls of the process"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.agency_ids = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, profile_urls: Iterable[str]) -> Dict[str, UUID]:
+        agency_ids = {}
+        with self.lock:
+            for profile_url in profile_urls:
+                agency_id = self.agency_ids.get(profile_url)
+                if agency_id is None:
+                    self.misses += 1
+                    continue
+
+                self.agency_ids.move_to_end(profile_url)
+                agency_ids[profile_url] = agency_id
+                self.hits += 1
+
+        return agency_ids
+
+    def set_many(self, agency_ids: Dict[str, UUID]) -> None:
+        with self.lock:
+            for profile_url, agency_id in agency_ids.items():
+                self.agency_ids[profile_url] = agency_id
+                self.agency_ids.move_to_end(profile_url)
+
+            while len(self.agency_ids) > self.max_size:
+                self.agency_ids.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.agency_ids.clear()
+
+
+agency_cache = AgencyCache(settings.ISC_AGENCY_CACHE_SIZE)
+
+
+def resolve_agencies(
+    real_estate_list: List[WebsiteISCRealEstateInfo],
+) -> Dict[str, UUID]:
+    """Agency IDs of the real estates by profile URL, missing ones are created"""
+    agency_info_by_url = {}
+    for real_estate in real_estate_list:
+        if real_estate.agency is not None:
+            agency_info_by_url.setdefault(real_estate.agency.profile_url, real_estate)
+
+    agency_id_by_url = agency_cache.get_many(agency_info_by_url)
+    missing_urls = [url for url in agency_info_by_url if url not in agency_id_by_url]
+    if len(missing_urls) == 0:
+        return agency_id_by_url
+
+    stored_agency_ids = {}
+    for profile_url, agency_id in Agency.objects.filter(
+        profile_url__in=missing_urls
+    ).values_list("profile_url", "id"):
+        stored_agency_ids.setdefault(profile_url, agency_id)
+    agency_cache.set_many(stored_agency_ids)
+    agency_id_by_url.update(stored_agency_ids)
+
+    new_agencies = [
+        build_agency_object(agency_info_by_url[profile_url])
+        for profile_url in missing_urls
+        if profile_url not in stored_agency_ids
+    ]
+    if len(new_agencies) == 0:
+        return agency_id_by_url
+
+    # another crawl may store the same agency first, its row is used instead
+    bulk_create_objects(new_agencies, ignore_conflicts=True)
+    new_agency_ids = dict(
+        Agency.objects.filter(
+            profile_url__in=[agency_obj.profile_url for agency_obj in new_agencies]
+        ).values_list("profile_url", "id")
+    )
+    # created agencies are only known by other crawls once committed
+    transaction.on_commit(lambda: agency_cache.set_many(new_agency_ids))
+    agency_id_by_url.update(new_agency_ids)
+
+    return agency_id_by_url
+
+
+def store_real_estate_page(
+    search_obj: Search, real_estate_list: List[WebsiteISCRealEstateInfo]
+) -> List[str]:
+    """
+    Store the real estates of a result page and link them to the search, with
+    a few queries for the whole page. Returns the codes linked to the search.
+    """
+    # the same real estate may be listed twice
+    real_estate_by_code = {}
+    for real_estate in real_estate_list:
+        real_estate_by_code.setdefault(real_estate.code, real_estate)
+
+    re_object_by_code = {}
+    for re_object in RealEstate.objects.filter(reference_code__in=real_estate_by_code):
+        re_object_by_code.setdefault(re_object.reference_code, re_object)
+
+    changed_re_objects = []
+    re_updates = []
+    for code, re_object in re_object_by_code.items():
+        real_estate = real_estate_by_code[code]
+        try:
+            re_update = update_real_estate_object(re_object, real_estate, search_obj)
+        except Exception as e:
+            print(
+                f"Fail to update real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
+            )
+            continue
+
+        if re_update is None:
+            continue
+
+        changed_re_objects.append(re_object)
+        if len(re_update.update) > 0:
+            re_updates.append(re_update)
+
+    # unchanged real estates are not written
+    RealEstate.objects.bulk_update(
+        changed_re_objects,
+        RealEstate.content_fields + ["content_hash", "updated_at"],
+    )
+    bulk_create_objects(re_updates)
+
+    new_real_estate_list = [
+        real_estate
+        for code, real_estate in real_estate_by_code.items()
+        if code not in re_object_by_code
+    ]
+    agency_id_by_url = resolve_agencies(new_real_estate_list)
+
+    new_re_objects = []
+    for real_estate in new_real_estate_list:
+        try:
+            agency_id = agency_id_by_url[real_estate.agency.profile_url]
+        except (AttributeError, KeyError) as e:
+            print(
+                f"Fail to find agency of real estate code {real_estate.code} - URL {real_estate.url}. Error: {e}."
+            )
+            continue
+
+        try:
+            new_re_objects.append(build_real_estate_object(real_estate, agency_id))
+        except Exception as e:
+            print(
+                f"Fail to save real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
+            )
+
+    # another crawl may store the same real estate first, its row is used instead
+    bulk_create_objects(new_re_objects, ignore_conflicts=True)
+    new_re_object_ids = set(re_object.id for re_object in new_re_objects)
+    inserted_re_objects = []
+    for re_object in RealEstate.objects.filter(
+        reference_code__in=[re_object.reference_code for re_object in new_re_objects]
+    ):
+        re_object_by_code[re_object.reference_code] = re_object
+        if re_object.id in new_re_object_ids:
+            inserted_re_objects.append(re_object)
+
+    # listings new to the database are added to the radars they match
+    percolate_real_estates(inserted_re_objects)
+
+    # a refreshed search already has part of the results
+    linked_ids = set(
+        SearchResultRealEstate.objects.filter(
+            search=search_obj, real_estate__in=re_object_by_code.values()
+        ).values_list("real_estate_id", flat=True)
+    )
+    bulk_create_objects(
+        [
+            SearchResultRealEstate(search=search_obj, real_estate=re_object)
+            for re_object in re_object_by_code.values()
+            if re_object.id not in linked_ids
+        ]
+    )
+
+    return [code for code in real_estate_by_code if code in re_object_by_code]
 
 
 def update_real_estate_object(
     re_object: RealEstate,
     real_estate_info: WebsiteISCRealEstateInfo,
     search_obj: Search,
-):
+) -> Optional[RealEstateUpdate]:
+    """
+    Copy the crawled fields to re_object, without saving it. Returns None when
+    the content hash did not change, otherwise the price and availability
+    changes, the update list is empty when only other fields changed.
+    """
+    crawled_re_object = build_real_estate_object(real_estate_info, re_object.agency_id)
+    if crawled_re_object.content_hash == re_object.content_hash:
+        return None
+
     print(f"Updating ID {re_object.id} - Code {real_estate_info.code}")
-    pass
+    re_update = RealEstateUpdate(real_estate=re_object, update=[])
+    if crawled_re_object.price != re_object.price:
+        re_update.update.append(RealEstateUpdate.Update.PRICE)
+        re_update.old_price = re_object.price
+        re_update.new_price = crawled_re_object.price
+
+    if crawled_re_object.available != re_object.available:
+        re_update.update.append(RealEstateUpdate.Update.AVAILABILITY)
+        re_update.old_available = re_object.available
+        re_update.new_available = crawled_re_object.available
+
+    for field in RealEstate.content_fields:
+        setattr(re_object, field, getattr(crawled_re_object, field))
+    re_object.content_hash = crawled_re_object.content_hash
+    re_object.updated_at = timezone.now()
+
+    return re_update
+
+
+def is_known_page(page_content: WebsiteISCPageContent) -> bool:
+    """
+    True when every real estate of the page is stored and its content hash
+    did not change, like update_real_estate_object tells a change
+    """
+    real_estate_list = page_content.real_estate_list
+    if len(real_estate_list) == 0:
+        return False
+
+    re_objects = RealEstate.objects.filter(
+        reference_code__in=[real_estate.code for real_estate in real_estate_list]
+    ).only("reference_code", "content_hash")
+    content_hash_by_code = {
+        re_object.reference_code: re_object.content_hash for re_object in re_objects
+    }
+
+    for real_estate in real_estate_list:
+        content_hash = content_hash_by_code.get(real_estate.code)
+        if content_hash is None:
+            return False
+
+        try:
+            crawled_re_object = build_real_estate_object(real_estate, None)
+        except ValueError:
+            return False
+        if crawled_re_object.content_hash != content_hash:
+            return False
+
+    return True
+
+
+def get_crawl_checkpoint(search_obj: Search, filter_url: str) -> SearchCrawlCheckpoint:
+    """Checkpoint of an interrupted crawl of the same filter URL, or a new one"""
+    checkpoint, created = SearchCrawlCheckpoint.objects.get_or_create(
+        search=search_obj, defaults={"filter_url": filter_url}
+    )
+    if not created and checkpoint.filter_url != filter_url:
+        print(f"Discarding checkpoint of search {search_obj.id}, filter URL changed")
+        checkpoint.filter_url = filter_url
+        checkpoint.last_page = 0
+        checkpoint.total_pages = 0
+        checkpoint.reference_codes = []
+        checkpoint.save()
+
+    return checkpoint
+
+
+def save_crawl_checkpoint(
+    checkpoint: SearchCrawlCheckpoint,
+    page_content: WebsiteISCPageContent,
+    page_codes: List[str],
+) -> None:
+    """Mark the page as finished, with the codes stored from it"""
+    checkpoint.last_page = page_content.page
+    checkpoint.total_pages = page_content.total_pages
+    checkpoint.reference_codes += page_codes
+    checkpoint.save()
+
+
+COPY_LEADER_RESULTS_SQL = """
+    INSERT INTO search_searchresultrealestate
+        (id, search_id, real_estate_id, created_at)
+    SELECT gen_random_uuid(), s.id, r.real_estate_id, r.created_at
+    FROM   search_search s
+    JOIN   search_searchresultrealestate r ON r.search_id = s.crawl_leader_id
+    WHERE  s.crawl_leader_id = %s
+"""
+
+
+# copies keep the times of the results, so they are listed in the same order
+COPY_SEARCH_RESULTS_SQL = """
+    INSERT INTO search_searchresultrealestate
+        (id, search_id, real_estate_id, created_at)
+    SELECT gen_random_uuid(), %s, r.real_estate_id, r.created_at
+    FROM   search_searchresultrealestate r
+    WHERE  r.search_id = %s
+"""
+
+
+SYNC_SEARCH_RADARS_SQL = """
+    INSERT INTO radar_radarrealestate
+        (id, created_at, radar_id, real_estate_id, updated_real_estate_at, preference)
+    SELECT gen_random_uuid(), now(), rd.id, r.real_estate_id, now(), %s
+    FROM   radar_radar rd
+    JOIN   search_searchresultrealestate r ON r.search_id = rd.search_id
+    WHERE  rd.search_id = %s
+    AND    NOT EXISTS (
+        SELECT 1
+        FROM   radar_radarrealestate rr
+        WHERE  rr.radar_id = rd.id
+        AND    rr.real_estate_id = r.real_estate_id
+    )
+"""
+
+
+def sync_search_radars(search_obj: Search) -> int:
+    """
+    Add the results of a search crawled after its radars were created to
+    them, in a single query
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SYNC_SEARCH_RADARS_SQL,
+            [RadarRealEstate.Preference.PENDING, search_obj.id],
+        )
+        return cursor.rowcount
+
+
+def copy_search_results(source_search_id: UUID, search_id: UUID) -> int:
+    """Copy the results of a search to another one, in a single query"""
+    with connection.cursor() as cursor:
+        cursor.execute(COPY_SEARCH_RESULTS_SQL, [search_id, source_search_id])
+        return cursor.rowcount
+
+
+def sync_attached_searches(search_obj: Search) -> None:
+    """
+    Searches attached to the crawl of search_obj follow its status. Once it
+    is finished they get a copy of its results and are no longer attached.
+    """
+    attached_searches = Search.objects.filter(crawl_leader=search_obj)
+    if search_obj.query_status != Search.QueryStatus.FINISHED:
+        attached_searches.update(
+            query_status=search_obj.query_status,
+            number_real_estate_found=search_obj.number_real_estate_found,
+        )
+        return
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(COPY_LEADER_RESULTS_SQL, [search_obj.id])
+        attached = attached_searches.update(
+            query_status=search_obj.query_status,
+            number_real_estate_found=search_obj.number_real_estate_found,
+            skipped_pages=search_obj.skipped_pages,
+            finished_at=search_obj.finished_at,
+            crawl_seconds=search_obj.crawl_seconds,
+            crawl_leader=None,
+        )
+
+    if attached:
+        print(f"Copied results of search {search_obj.id} to {attached} searches")
 
 
 def create_isc_filter(search_obj: Search) -> WebsiteISCFilter:
@@ -222,7 +638,33 @@ def create_isc_filter(search_obj: Search) -> WebsiteISCFilter:
     return isc_filter
 
 
-def crawl_isc_real_estate_search(search_id: UUID) -> None:
+def crawl_isc_real_estate_search(
+    search_id: UUID,
+    incremental: bool = False,
+    pipeline: Optional[bool] = None,
+    lazy_pages: Optional[int] = None,
+    raise_errors: bool = False,
+    check_lease: Optional[Callable[[], None]] = None,
+) -> None:
+    """
+    Crawl ISC and store the real estates found for the search.
+    Incremental mode is meant to refresh a search crawled before, it orders
+    results by newest and stops once it only finds known real estates.
+    Progress is saved after every page, running it again for a search whose
+    crawl was interrupted continues from the next page.
+    In pipeline mode, ISC_CRAWLER_PIPELINE by default, pages are fetched,
+    parsed and stored at the same time by a CrawlPipeline. Incremental crawls
+    and sharded searches are crawled page by page.
+    In lazy mode, ISC_CRAWLER_LAZY_PAGES by default, only that many pages are
+    crawled. The search stays partial with the page to continue from in
+    next_page, running it again crawls the next pages. Lazy crawls are not
+    sharded and incremental crawls are never lazy.
+    A failed crawl is logged, with raise_errors the error is raised instead.
+    Failed pages are skipped, but a crawl whose first page failed has failed.
+    check_lease is called before every page is stored, a crawl job stops by
+    raising from it once another worker took the job.
+    """
+    crawl_start = time.perf_counter()
     try:
         search_obj = Search.objects.get(id=search_id)
     except Search.DoesNotExist:
@@ -230,56 +672,278 @@ def crawl_isc_real_estate_search(search_id: UUID) -> None:
         return
 
     webcrawler_filter = create_isc_filter(search_obj)
+    if incremental:
+        webcrawler_filter.order = WebsiteISCOrder.NEWEST
+
+    if lazy_pages is None:
+        lazy_pages = settings.ISC_CRAWLER_LAZY_PAGES
+    if incremental:
+        lazy_pages = 0
 
-    crawler = WebcrawlerISCRealEstate()
+    # pages crawled before by a lazy crawl count for the crawl time
+    previous_crawl_seconds = search_obj.crawl_seconds if search_obj.next_page else 0.0
+
+    crawler = WebcrawlerISCRealEstate(
+        max_workers=settings.ISC_CRAWLER_MAX_WORKERS,
+        parser=settings.ISC_CRAWLER_PARSER,
+        shard_pages=settings.ISC_CRAWLER_SHARD_PAGES if lazy_pages <= 0 else 0,
+    )
     crawler.set_filter(webcrawler_filter)
 
+    checkpoint = get_crawl_checkpoint(search_obj, crawler.url)
+    ingested_codes = set(checkpoint.reference_codes)
+
+    if pipeline is None:
+        pipeline = settings.ISC_CRAWLER_PIPELINE
+    pipeline = (
+        pipeline and not incremental and lazy_pages <= 0 and crawler.shard_pages <= 0
+    )
+
+    start_page = None
+    if checkpoint.last_page == 0:
+        search_obj.skipped_pages = []
+        start_page = 1
+    elif checkpoint.last_page < checkpoint.total_pages:
+        print(
+            f"Resuming search {search_id} after page {checkpoint.last_page} "
+            f"of {checkpoint.total_pages}"
+        )
+        start_page = checkpoint.last_page + 1
+
+    def store_page(page_content: WebsiteISCPageContent) -> None:
+        if check_lease is not None:
+            check_lease()
+
+        if page_content.fetch_status == FetchStatus.FAILED:
+            # without the first page there is no total and no pages to crawl
+            if page_content.total_pages == 0:
+                raise HTTPRequestError(
+                    f"Failed to fetch page {page_content.page} of search {search_id}"
+                )
+
+            search_obj.skipped_pages.append(page_content.page)
+            search_obj.save(update_fields=["skipped_pages"])
+            save_crawl_checkpoint(checkpoint, page_content, [])
+            return
+
+        if page_content.page == 1:
+            search_obj.number_real_estate_found = page_content.total
+            search_obj.query_status = Search.QueryStatus.PARTIAL
+            search_obj.save()
+            sync_attached_searches(search_obj)
+
+        # stored by the interrupted crawl being resumed
+        real_estate_list = [
+            real_estate
+            for real_estate in page_content.real_estate_list
+            if real_estate.code not in ingested_codes
+        ]
+
+        # the checkpoint only moves on once the whole page is stored
+        with transaction.atomic():
+            page_codes = store_real_estate_page(search_obj, real_estate_list)
+            save_crawl_checkpoint(checkpoint, page_content, page_codes)
+
+        ingested_codes.update(page_codes)
+
+    def store_pages(page_contents: List[WebsiteISCPageContent]) -> None:
+        # a batch of pages is stored in one transaction
+        with transaction.atomic():
+            for page_content in page_contents:
+                store_page(page_content)
+
+    try:
+        if start_page is not None and pipeline:
+            crawl_pipeline = CrawlPipeline(
+                crawler,
+                fetch_workers=settings.ISC_CRAWLER_MAX_WORKERS,
+                parse_processes=settings.ISC_PIPELINE_PARSE_PROCESSES,
+                queue_size=settings.ISC_PIPELINE_QUEUE_SIZE,
+                write_batch_pages=settings.ISC_PIPELINE_WRITE_BATCH_PAGES,
+            )
+            try:
+                crawl_pipeline.run(store_pages, start_page=start_page)
+            finally:
+                print(f"ISC pipeline stats: {crawl_pipeline.get_stats()}")
+        elif start_page is not None:
+            for page_content in crawler.crawl(
+                is_known_page=is_known_page if incremental else None,
+                known_pages_to_stop=settings.ISC_CRAWLER_KNOWN_PAGES_TO_STOP,
+                start_page=start_page,
+                end_page=start_page + lazy_pages - 1 if lazy_pages > 0 else 0,
+            ):
+                store_page(page_content)
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(f"Failure while crawling ISC. Error: {e}. Traceback: {tb}.")
+        if raise_errors:
+            raise
+        return
+
+    # counters are cumulative for every crawl done by this process
+    if crawler.http_cache is not None:
+        print(f"ISC HTTP cache stats: {crawler.http_cache.stats.as_dict()}")
+    print(f"ISC HTTP session stats: {get_session_factory().get_stats()}")
+    print(f"ISC agency cache hits: {agency_cache.hits}, misses: {agency_cache.misses}")
+
+    # the next pages of a lazy crawl are crawled once the user gets near them
+    if lazy_pages > 0 and 0 < checkpoint.last_page < checkpoint.total_pages:
+        search_obj.next_page = checkpoint.last_page + 1
+        search_obj.crawl_seconds = (
+            previous_crawl_seconds + time.perf_counter() - crawl_start
+        )
+        search_obj.save(update_fields=["next_page", "crawl_seconds"])
+        sync_search_radars(search_obj)
+        print(
+            f"Search {search_id} crawled up to page {checkpoint.last_page} of "
+            f"{checkpoint.total_pages}, continues from page {search_obj.next_page}"
+        )
+        return
+
+    if search_obj.skipped_pages:
+        print(f"Search {search_id} finished skipping pages {search_obj.skipped_pages}")
+
+    with transaction.atomic():
+        search_obj.query_status = Search.QueryStatus.FINISHED
+        search_obj.next_page = 0
+        search_obj.finished_at = timezone.now()
+        search_obj.crawl_seconds = (
+            previous_crawl_seconds + time.perf_counter() - crawl_start
+        )
+        search_obj.save()
+        checkpoint.delete()
+        sync_attached_searches(search_obj)
+        sync_search_radars(search_obj)
+
+
+def build_staging_row(real_estate_info: WebsiteISCRealEstateInfo) -> Optional[tuple]:
+    """Row of STAGING_COLUMNS for the bulk load, None when it can not be stored"""
+    agency_info = real_estate_info.agency
+    if agency_info is None:
+        print(f"Failed to find agency of real estate code {real_estate_info.code}.")
+        return None
+
     try:
+        re_obj = build_real_estate_object(real_estate_info, None)
+    except Exception as e:
+        print(
+            f"Fail to build real estate object code {real_estate_info.code} - URL {real_estate_info.url}. Error: {e}."
+        )
+        return None
+
+    return (
+        re_obj.reference_code,
+        re_obj.property_type,
+        re_obj.transaction_type,
+        re_obj.city,
+        re_obj.neighborhood,
+        re_obj.bedroom_quantity,
+        re_obj.suite_quantity,
+        re_obj.garage_slots_quantity,
+        re_obj.price,
+        re_obj.area,
+        re_obj.thumb_url,
+        re_obj.url,
+        re_obj.content_hash,
+        agency_info.name,
+        agency_info.logo_url,
+        agency_info.profile_url,
+    )
+
+
+@contextmanager
+def bulk_load_cursor():
+    """
+    psycopg2 cursor of a connection of its own, committed once the block ends.
+    The default connection stays free for other queries while COPY runs.
+    """
+    bulk_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        bulk_connection.ensure_connection()
+        with bulk_connection.connection as conn, conn.cursor() as cursor:
+            yield cursor
+    finally:
+        bulk_connection.close()
+
+
+def bulk_load_isc_real_estate_search(
+    search_id: UUID,
+    raise_errors: bool = False,
+    check_lease: Optional[Callable[[], None]] = None,
+) -> None:
+    """
+    Crawl ISC and bulk load the real estates found for the search with COPY,
+    meant for city wide and backfill crawls. Parsed listings stream into the
+    database while pages are crawled, nothing is written until the crawl ends
+    and an interrupted bulk load starts over instead of resuming.
+    raise_errors and check_lease work as in crawl_isc_real_estate_search.
+    """
+    crawl_start = time.perf_counter()
+    try:
+        search_obj = Search.objects.get(id=search_id)
+    except Search.DoesNotExist:
+        print(f"Search object does not exist. ID: {search_id}.")
+        return
+
+    crawler = WebcrawlerISCRealEstate(
+        max_workers=settings.ISC_CRAWLER_MAX_WORKERS,
+        parser=settings.ISC_CRAWLER_PARSER,
+        shard_pages=settings.ISC_CRAWLER_SHARD_PAGES,
+    )
+    crawler.set_filter(create_isc_filter(search_obj))
+    search_obj.skipped_pages = []
+    load_start = timezone.now()
+
+    def staging_rows():
         for page_content in crawler.crawl():
+            if check_lease is not None:
+                check_lease()
+
+            if page_content.fetch_status == FetchStatus.FAILED:
+                if page_content.total_pages == 0:
+                    raise HTTPRequestError(
+                        f"Failed to fetch page {page_content.page} of search {search_id}"
+                    )
+
+                search_obj.skipped_pages.append(page_content.page)
+                continue
+
             if page_content.page == 1:
                 search_obj.number_real_estate_found = page_content.total
-                search_obj.query_status = Search.QueryStatus.PARTIAL
-                search_obj.save()
-
-            real_estate_list = page_content.real_estate_list
-            for real_estate in real_estate_list:
-                try:
-                    real_estate_obj = RealEstate.objects.get(
-                        reference_code=real_estate.code
-                    )
-                    update_real_estate_object(real_estate_obj, real_estate, search_obj)
-
-                except RealEstate.DoesNotExist:
-
-                    try:
-                        real_estate_obj = create_real_estate_object(
-                            real_estate, search_obj
-                        )
-                    except Exception as e:
-                        print(
-                            f"Fail to save real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
-                        )
-                        continue
-
-                except Exception as e:
-                    print(
-                        f"Fail to save real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
-                    )
-                    continue
 
-                try:
-                    SearchResultRealEstate.objects.create(
-                        search=search_obj, real_estate=real_estate_obj
-                    )
-                except Exception as e:
-                    print(
-                        f"Fail to create search result for real estate code {real_estate.code} - URL {real_estate.url}. Error: {e}."
-                    )
+            for real_estate in page_content.real_estate_list:
+                yield build_staging_row(real_estate)
 
+    try:
+        with bulk_load_cursor() as cursor:
+            stats = bulk_load_real_estates(cursor, search_obj.id, staging_rows())
     except Exception as e:
         tb = traceback.format_exc()
-        print(f"Failure while crawling ISC. Error: {e}. Traceback: {tb}.")
+        print(f"Failure while bulk loading ISC. Error: {e}. Traceback: {tb}.")
+        if raise_errors:
+            raise
         return
 
-    search_obj.query_status = Search.QueryStatus.FINISHED
-    search_obj.save()
+    print(f"ISC bulk load stats: {stats.as_dict()}")
+    print(f"ISC HTTP session stats: {get_session_factory().get_stats()}")
+    if search_obj.skipped_pages:
+        print(f"Search {search_id} finished skipping pages {search_obj.skipped_pages}")
+
+    with transaction.atomic():
+        search_obj.query_status = Search.QueryStatus.FINISHED
+        search_obj.finished_at = timezone.now()
+        search_obj.crawl_seconds = time.perf_counter() - crawl_start
+        search_obj.save()
+        sync_attached_searches(search_obj)
+
+    # listings new to the database are added to the radars they match
+    if stats.real_estates_created > 0:
+        percolate_real_estates(
+            list(
+                RealEstate.objects.filter(
+                    searchresultrealestate__search=search_obj,
+                    created_at__gte=load_start,
+                )
+            )
+        )
@@ -2,16 +2,21 @@
 Tests for search API
 """
 
+import uuid
+
+from datetime import timedelta
 from unittest.mock import patch
 
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from search.models import Filter, Search, SearchResultRealEstate
+from search import services
+from search.models import CrawlJob, Filter, Search, SearchResultRealEstate
 from real_estate.models import RealEstate, Agency
 from user.models import User
 
@@ -124,10 +129,8 @@ class PublicApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("max_area", res.data)
 
-    @patch("search.services.crawl_isc_real_estate_search")
-    def test_public_create_search_success(self, search_task):
-        """User creates a search with success"""
-        search_task.delay.return_value = None
+    def test_public_create_search_success(self):
+        """User creates a search with success, the crawl is queued"""
 
         client = APIClient()
         url = reverse("search:search")
@@ -148,7 +151,7 @@ class PublicApiTests(TestCase):
         }
 
         res = client.post(url, payload)
-        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn("id", res.data)
         self.assertIn("filter", res.data)
         self.assertIn("query_status", res.data)
@@ -157,6 +160,189 @@ class PublicApiTests(TestCase):
         self.assertEqual(
             res.data.get("query_status", None), Search.QueryStatus.NOT_STARTED
         )
+        crawl_job = CrawlJob.objects.get()
+        self.assertEqual(crawl_job.search_id, res.data.get("id"))
+        self.assertEqual(crawl_job.status, CrawlJob.Status.PENDING)
+
+    def test_public_create_search_twice_returns_same_search(self):
+        """A retry of a search being crawled costs no new crawl"""
+        client = APIClient()
+        url = reverse("search:search")
+
+        payload = {
+            "property_type": ["apartment"],
+            "transaction_type": ["rent"],
+            "city": ["blumenau"],
+            "neighborhood": ["fortaleza"],
+            "bedroom_quantity": [1],
+            "suite_quantity": [0],
+            "bathroom_quantity": [1],
+            "garage_slots_quantity": [0],
+            "min_price": 500,
+            "max_price": 3000,
+            "min_area": 30,
+            "max_area": 100,
+        }
+
+        first_res = client.post(url, payload, format="json")
+        payload["neighborhood"] = ["Fortaleza "]
+        second_res = client.post(url, payload, format="json")
+
+        self.assertEqual(second_res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second_res.data.get("id"), first_res.data.get("id"))
+        self.assertEqual(Search.objects.count(), 1)
+        self.assertEqual(CrawlJob.objects.count(), 1)
+
+    def create_finished_search(self, age_seconds: float) -> Search:
+        search_obj = create_search()
+        search_obj.filter.fingerprint = search_obj.filter.get_fingerprint()
+        search_obj.filter.save()
+        search_obj.query_status = Search.QueryStatus.FINISHED
+        search_obj.number_real_estate_found = 1
+        search_obj.finished_at = timezone.now() - timedelta(seconds=age_seconds)
+        search_obj.crawl_seconds = 42.0
+        search_obj.save()
+        create_real_estate(search_obj)
+        return search_obj
+
+    def create_search_payload(self) -> dict:
+        return {
+            "property_type": ["apartment", "house"],
+            "transaction_type": ["rent", "buy"],
+            "city": ["xique-xique", "sao paulo"],
+            "neighborhood": ["some-trust", "some-quite"],
+            "bedroom_quantity": [2],
+            "suite_quantity": [1],
+            "bathroom_quantity": [2],
+            "garage_slots_quantity": [1],
+            "min_price": 100.0,
+            "max_price": 200.0,
+            "min_area": 20.0,
+            "max_area": 30.0,
+        }
+
+    def test_public_create_search_reuses_fresh_results(self):
+        """A filter searched a moment ago is not crawled again"""
+        cached_search = self.create_finished_search(age_seconds=60)
+        client = APIClient()
+
+        with self.settings(ISC_SEARCH_RESULTS_FRESH_SECONDS=3600):
+            res = client.post(
+                reverse("search:search"), self.create_search_payload(), format="json"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.FINISHED)
+        self.assertEqual(res.data.get("number_real_estate_found"), 1)
+        search_obj = Search.objects.get(id=res.data.get("id"))
+        self.assertNotEqual(search_obj.id, cached_search.id)
+        self.assertEqual(search_obj.results_source, Search.ResultsSource.CACHE)
+        self.assertEqual(search_obj.finished_at, cached_search.finished_at)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=search_obj).count(), 1
+        )
+        self.assertFalse(CrawlJob.objects.exists())
+
+        stats = services.get_search_results_reuse_stats(cached_search.created_at)
+        self.assertEqual(stats["searches"], 2)
+        self.assertEqual(stats["cache_hits"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["crawl_seconds_saved"], 42.0)
+
+    def test_public_create_search_crawls_results_with_skipped_pages(self):
+        """An incomplete search is not reused"""
+        cached_search = self.create_finished_search(age_seconds=60)
+        cached_search.skipped_pages = [1]
+        cached_search.save()
+        client = APIClient()
+
+        with self.settings(ISC_SEARCH_RESULTS_FRESH_SECONDS=3600):
+            res = client.post(
+                reverse("search:search"), self.create_search_payload(), format="json"
+            )
+
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.NOT_STARTED)
+        self.assertEqual(CrawlJob.objects.get().search_id, res.data.get("id"))
+
+    def test_public_create_search_refreshes_stale_results(self):
+        """Stale results are shown while an incremental crawl refreshes them"""
+        self.create_finished_search(age_seconds=7200)
+        client = APIClient()
+
+        with self.settings(
+            ISC_SEARCH_RESULTS_FRESH_SECONDS=3600,
+            ISC_SEARCH_RESULTS_STALE_SECONDS=86400,
+        ):
+            res = client.post(
+                reverse("search:search"), self.create_search_payload(), format="json"
+            )
+
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.FINISHED)
+        crawl_job = CrawlJob.objects.get()
+        self.assertEqual(crawl_job.search_id, res.data.get("id"))
+        self.assertTrue(crawl_job.incremental)
+
+    def test_public_create_search_crawls_expired_results(self):
+        self.create_finished_search(age_seconds=7200)
+        client = APIClient()
+
+        with self.settings(
+            ISC_SEARCH_RESULTS_FRESH_SECONDS=3600,
+            ISC_SEARCH_RESULTS_STALE_SECONDS=0,
+        ):
+            res = client.post(
+                reverse("search:search"), self.create_search_payload(), format="json"
+            )
+
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.NOT_STARTED)
+        self.assertFalse(CrawlJob.objects.get().incremental)
+
+    def test_public_create_search_narrower_than_cached_search(self):
+        """A tightened filter is answered from the results of the broader one"""
+        parent_search = self.create_finished_search(age_seconds=60)
+        RealEstate.objects.update(neighborhood="Some Trust", price=150.0, area=25.0)
+        expensive = RealEstate.objects.get()
+        expensive.id = uuid.uuid4()
+        expensive._state.adding = True
+        expensive.reference_code = "0002"
+        expensive.neighborhood = "some quite"
+        expensive.price = 190.0
+        expensive.save()
+        SearchResultRealEstate.objects.create(
+            search=parent_search, real_estate=expensive
+        )
+        payload = dict(
+            self.create_search_payload(), neighborhood=["some-trust"], max_price=160.0
+        )
+        client = APIClient()
+
+        with self.settings(ISC_SEARCH_RESULTS_FRESH_SECONDS=3600):
+            res = client.post(reverse("search:search"), payload, format="json")
+
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.FINISHED)
+        self.assertEqual(res.data.get("number_real_estate_found"), 1)
+        search_obj = Search.objects.get(id=res.data.get("id"))
+        self.assertEqual(search_obj.results_source, Search.ResultsSource.PARENT_SEARCH)
+        self.assertEqual(search_obj.finished_at, parent_search.finished_at)
+        results = SearchResultRealEstate.objects.filter(search=search_obj)
+        self.assertNotEqual(results.get().real_estate_id, expensive.id)
+        self.assertFalse(CrawlJob.objects.exists())
+
+        stats = services.get_search_results_reuse_stats(parent_search.created_at)
+        self.assertEqual(stats["parent_search_hits"], 1)
+        self.assertEqual(stats["crawl_seconds_saved"], 42.0)
+
+    def test_public_create_search_narrower_with_unknown_neighborhood_crawls(self):
+        """Results in a neighborhood named differently can not be filtered"""
+        self.create_finished_search(age_seconds=60)
+        payload = dict(self.create_search_payload(), neighborhood=["some-trust"])
+        client = APIClient()
+
+        with self.settings(ISC_SEARCH_RESULTS_FRESH_SECONDS=3600):
+            res = client.post(reverse("search:search"), payload, format="json")
+
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.NOT_STARTED)
+        self.assertTrue(CrawlJob.objects.exists())
 
     def test_public_list_search(self):
         """Unauthenticated user should get empty list"""
@@ -172,9 +358,10 @@ class PublicApiTests(TestCase):
         self.assertIn("meta", res.data)
         self.assertEqual(len(res.data.get("data")), 0)
         self.assertEqual(res.data.get("meta").get("total"), 0)
-        self.assertEqual(res.data.get("meta").get("page"), 0)
-        self.assertEqual(res.data.get("meta").get("per_page"), 0)
+        self.assertEqual(res.data.get("meta").get("page"), 1)
+        self.assertEqual(res.data.get("meta").get("per_page"), 50)
         self.assertEqual(res.data.get("meta").get("total_pages"), 0)
+        self.assertIsNone(res.data.get("meta").get("next_cursor"))
 
     def test_public_retrieve_fail_id_not_found(self):
         client = APIClient()
@@ -210,10 +397,46 @@ class PublicApiTests(TestCase):
         self.assertIn("meta", res.data)
         self.assertEqual(len(res.data.get("data")), 1)
         self.assertEqual(res.data.get("data")[0].get("id"), real_estate_obj.id)
-        self.assertEqual(res.data.get("meta").get("total"), 0)
-        self.assertEqual(res.data.get("meta").get("page"), 0)
-        self.assertEqual(res.data.get("meta").get("per_page"), 0)
-        self.assertEqual(res.data.get("meta").get("total_pages"), 0)
+        self.assertEqual(res.data.get("meta").get("total"), 1)
+        self.assertEqual(res.data.get("meta").get("page"), 1)
+        self.assertEqual(res.data.get("meta").get("per_page"), 50)
+        self.assertEqual(res.data.get("meta").get("total_pages"), 1)
+        self.assertIsNone(res.data.get("meta").get("next_cursor"))
+        self.assertFalse(res.data.get("meta").get("total_estimated"))
+
+    def test_public_search_result_position_crawls_next_pages(self):
+        """The next pages of a lazy crawl are crawled near the last result"""
+        search_obj = create_search()
+        create_real_estate(search_obj)
+        Search.objects.filter(id=search_obj.id).update(
+            query_status=Search.QueryStatus.PARTIAL, next_page=2
+        )
+
+        client = APIClient()
+        url = reverse("search:search-pk-result", args=[str(search_obj.id)])
+
+        with self.settings(ISC_CRAWLER_LAZY_PREFETCH_RESULTS=0):
+            res = client.get(url, {"position": 0})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertFalse(CrawlJob.objects.exists())
+
+            res = client.get(url, {"position": 1})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(CrawlJob.objects.filter(search=search_obj).count(), 1)
+
+            res = client.get(url, {"position": 1})
+            self.assertEqual(CrawlJob.objects.filter(search=search_obj).count(), 1)
+
+    def test_public_search_result_fail_invalid_position(self):
+        search_obj = create_search()
+
+        client = APIClient()
+        url = reverse("search:search-pk-result", args=[str(search_obj.id)])
+
+        res = client.get(url, {"position": -1})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("position", res.data)
 
 
 @patch("rest_framework.throttling.UserRateThrottle.get_rate", lambda x: "1000/minute")
@@ -228,10 +451,8 @@ class PrivateApiTest(TestCase):
             email="myuser@myemail.com", password="securepassword123", name="My user"
         )
 
-    @patch("search.services.crawl_isc_real_estate_search")
-    def test_private_create_search_success(self, search_task):
-        """User creates a search with success"""
-        search_task.delay.return_value = None
+    def test_private_create_search_success(self):
+        """User creates a search with success, the crawl is queued"""
 
         client = APIClient()
         client.force_authenticate(user=self.user)
@@ -253,7 +474,7 @@ class PrivateApiTest(TestCase):
         }
 
         res = client.post(url, payload)
-        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn("id", res.data)
         self.assertIn("filter", res.data)
         self.assertIn("query_status", res.data)
@@ -262,6 +483,47 @@ class PrivateApiTest(TestCase):
         self.assertEqual(
             res.data.get("query_status", None), Search.QueryStatus.NOT_STARTED
         )
+        crawl_job = CrawlJob.objects.get()
+        self.assertEqual(crawl_job.search_id, res.data.get("id"))
+        self.assertEqual(crawl_job.status, CrawlJob.Status.PENDING)
+
+    def test_private_create_search_attaches_to_crawl_in_flight(self):
+        """Search of a filter another user is crawling waits for that crawl"""
+        leader = create_search()
+        leader.filter.fingerprint = leader.filter.get_fingerprint()
+        leader.filter.save()
+        CrawlJob.objects.create(search=leader, fingerprint=leader.filter.fingerprint)
+        real_estate_obj = create_real_estate(leader)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        payload = {
+            "property_type": ["house", "apartment"],
+            "transaction_type": ["buy", "rent"],
+            "city": ["São Paulo", "xique-xique"],
+            "neighborhood": ["some-quite", "some-trust"],
+            "bedroom_quantity": [2],
+            "suite_quantity": [1],
+            "bathroom_quantity": [2],
+            "garage_slots_quantity": [1],
+            "min_price": 100,
+            "max_price": 200,
+            "min_area": 20,
+            "max_area": 30,
+        }
+
+        res = client.post(reverse("search:search"), payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        search_obj = Search.objects.get(id=res.data.get("id"))
+        self.assertEqual(search_obj.created_by, self.user)
+        self.assertEqual(search_obj.crawl_leader, leader)
+        self.assertEqual(CrawlJob.objects.count(), 1)
+
+        url = reverse("search:search-pk-result", args=[str(search_obj.id)])
+        res = client.get(url)
+        self.assertEqual(len(res.data.get("data")), 1)
+        self.assertEqual(res.data.get("data")[0].get("id"), real_estate_obj.id)
 
     def test_private_list_search(self):
         """Unauthenticated user should get empty list"""
@@ -281,10 +543,10 @@ class PrivateApiTest(TestCase):
         self.assertIn("query_status", res.data.get("data")[0])
         self.assertIn("filter", res.data.get("data")[0])
         self.assertIn("property_type", res.data.get("data")[0].get("filter"))
-        self.assertEqual(res.data.get("meta").get("total"), 0)
-        self.assertEqual(res.data.get("meta").get("page"), 0)
-        self.assertEqual(res.data.get("meta").get("per_page"), 0)
-        self.assertEqual(res.data.get("meta").get("total_pages"), 0)
+        self.assertEqual(res.data.get("meta").get("total"), 2)
+        self.assertEqual(res.data.get("meta").get("page"), 1)
+        self.assertEqual(res.data.get("meta").get("per_page"), 50)
+        self.assertEqual(res.data.get("meta").get("total_pages"), 1)
 
     def test_private_retrieve_search(self):
         search_obj = create_search(self.user)
@@ -0,0 +1,157 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from real_estate.models import Agency, RealEstate, RealEstateUpdate
+from search.bulk_load import CopyRowStream, escape_copy_value
+from search.factories import SearchFactory
+from search.models import Search, SearchResultRealEstate
+from search.task import bulk_load_isc_real_estate_search
+from search.tests.test_task import build_real_estate_info
+from search.webcrawler_http import FetchStatus
+from search.webcrawler_isc import WebcrawlerISCRealEstate, WebsiteISCPageContent
+
+
+class TestCopyRowStream(SimpleTestCase):
+
+    def test_values_are_escaped(self):
+        self.assertEqual(escape_copy_value(None), "\\N")
+        self.assertEqual(escape_copy_value(True), "t")
+        self.assertEqual(escape_copy_value("a\tb\nc\\d"), "a\\tb\\nc\\\\d")
+        self.assertEqual(
+            escape_copy_value(["https://a", 'say "hi"']),
+            '{"https://a","say \\\\"hi\\\\""}',
+        )
+
+    def test_rows_are_read_lazily(self):
+        consumed = []
+
+        def rows():
+            for i in range(100):
+                consumed.append(i)
+                yield (f"A{i}", i, None)
+
+        stream = CopyRowStream(rows())
+        chunk = stream.read(10)
+
+        self.assertEqual(chunk, "A0\t0\t\\N\nA1")
+        self.assertLess(len(consumed), 5)
+
+        rest = stream.read()
+        self.assertEqual(len(consumed), 100)
+        self.assertEqual((chunk + rest).count("\n"), 100)
+        self.assertEqual(stream.read(10), "")
+
+
+class TestBulkLoadISCRealEstateSearch(TransactionTestCase):
+    """The bulk load runs on a connection of its own, so data is committed"""
+
+    def setUp(self):
+        self.search_obj = SearchFactory()
+        self.pages = []
+
+    def fake_crawl(self, crawler, *args, **kwargs):
+        for page, real_estate_list in enumerate(self.pages, start=1):
+            yield WebsiteISCPageContent(
+                real_estate_list=real_estate_list,
+                total=sum(len(page) for page in self.pages),
+                page=page,
+                total_pages=len(self.pages),
+            )
+
+    def bulk_load(self):
+        with patch.object(
+            WebcrawlerISCRealEstate,
+            "crawl",
+            autospec=True,
+            side_effect=self.fake_crawl,
+        ):
+            bulk_load_isc_real_estate_search(self.search_obj.id)
+
+        self.search_obj.refresh_from_db()
+
+    def test_crawled_real_estates_are_loaded(self):
+        self.pages = [
+            [
+                build_real_estate_info(f"A{i}", f"https://agency/{i % 2}")
+                for i in range(3)
+            ],
+            [build_real_estate_info(f"B{i}", "https://agency/0") for i in range(3)],
+        ]
+        # listed again in the second page
+        self.pages[1].append(build_real_estate_info("A0", "https://agency/0"))
+        # longer than the column, left out
+        self.pages[1][0].neighborhood = "x" * 200
+        self.pages[1][1].agency = None
+
+        self.bulk_load()
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.number_real_estate_found, 7)
+        self.assertEqual(
+            sorted(RealEstate.objects.values_list("reference_code", flat=True)),
+            ["A0", "A1", "A2", "B2"],
+        )
+        self.assertEqual(Agency.objects.count(), 2)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 4
+        )
+
+        real_estate = RealEstate.objects.get(reference_code="A1")
+        self.assertEqual(real_estate.agency.profile_url, "https://agency/1")
+        self.assertEqual(real_estate.price, 450000.0)
+        self.assertEqual(real_estate.bedroom_quantity, 2)
+        self.assertEqual(real_estate.content_hash, real_estate.get_content_hash())
+
+    def test_results_keep_the_crawl_order(self):
+        self.pages = [
+            [build_real_estate_info("C0"), build_real_estate_info("A0")],
+            [build_real_estate_info("B0"), build_real_estate_info("C0")],
+        ]
+
+        self.bulk_load()
+
+        self.assertEqual(
+            list(
+                SearchResultRealEstate.objects.filter(search=self.search_obj)
+                .order_by("created_at", "id")
+                .values_list("real_estate__reference_code", flat=True)
+            ),
+            ["C0", "A0", "B0"],
+        )
+
+    def test_changed_real_estates_are_updated(self):
+        self.pages = [[build_real_estate_info("A0"), build_real_estate_info("A1")]]
+        self.bulk_load()
+
+        self.pages[0][0].price = "420.000,00"
+        self.search_obj = SearchFactory()
+        self.bulk_load()
+
+        self.assertEqual(RealEstate.objects.count(), 2)
+        self.assertEqual(RealEstate.objects.get(reference_code="A0").price, 420000.0)
+        re_update = RealEstateUpdate.objects.get()
+        self.assertEqual(re_update.update, [RealEstateUpdate.Update.PRICE])
+        self.assertEqual(re_update.old_price, 450000.0)
+        self.assertEqual(re_update.new_price, 420000.0)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 2
+        )
+
+    def test_failed_pages_are_skipped(self):
+        self.pages = [[build_real_estate_info("A0")], [build_real_estate_info("B0")]]
+
+        def fake_crawl(crawler, *args, **kwargs):
+            pages = list(self.fake_crawl(crawler))
+            pages[1].fetch_status = FetchStatus.FAILED
+            pages[1].real_estate_list = []
+            yield from pages
+
+        with patch.object(
+            WebcrawlerISCRealEstate, "crawl", autospec=True, side_effect=fake_crawl
+        ):
+            bulk_load_isc_real_estate_search(self.search_obj.id)
+
+        self.search_obj.refresh_from_db()
+        self.assertEqual(self.search_obj.skipped_pages, [2])
+        self.assertEqual(RealEstate.objects.count(), 1)
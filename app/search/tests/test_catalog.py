@@ -0,0 +1,318 @@
+"""
+Tests for searches answered from the catalog
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from real_estate.models import Agency, RealEstate, RealEstateUpdate
+from search import catalog
+from search.models import (
+    CatalogCity,
+    CrawlJob,
+    Filter,
+    Search,
+    SearchResultRealEstate,
+)
+
+
+def create_catalog_real_estate(reference_code: str, **kwargs) -> RealEstate:
+    agency_obj, _ = Agency.objects.get_or_create(creci="12345", name="blah")
+    model_dict = {
+        "reference_code": reference_code,
+        "property_type": RealEstate.PropertyType.APARTMENT,
+        "transaction_type": RealEstate.TransactionType.BUY,
+        "city": "Blumenau",
+        "neighborhood": "Itoupava Seca",
+        "bedroom_quantity": 2,
+        "suite_quantity": 1,
+        "bathroom_quantity": 2,
+        "garage_slots_quantity": 1,
+        "price": 450000.0,
+        "area": 70.0,
+        "area_total": 70.0,
+        "cond_price": 0.0,
+        "available": True,
+        "agency": agency_obj,
+    }
+    model_dict.update(kwargs)
+    return RealEstate.objects.create(**model_dict)
+
+
+def create_catalog_filter(**kwargs) -> Filter:
+    filter_dict = {
+        "property_type": ["apartment"],
+        "transaction_type": ["buy"],
+        "city": ["blumenau"],
+        "neighborhood": ["itoupava-seca"],
+        "bedroom_quantity": [2],
+        "suite_quantity": [0],
+        "bathroom_quantity": [0],
+        "garage_slots_quantity": [0],
+        "min_price": 100000.0,
+        "max_price": 500000.0,
+        "min_area": 50.0,
+        "max_area": 100.0,
+    }
+    filter_dict.update(kwargs)
+    return Filter.objects.create(**filter_dict)
+
+
+@patch("rest_framework.throttling.AnonRateThrottle.get_rate", lambda x: "1000/minute")
+class TestSearchCatalog(TestCase):
+
+    def setUp(self):
+        self.crawled_at = timezone.now() - timedelta(hours=1)
+        self.catalog_search = Search.objects.create(
+            filter=create_catalog_filter(neighborhood=[]),
+            query_status=Search.QueryStatus.FINISHED,
+            finished_at=self.crawled_at,
+        )
+        self.catalog_city = CatalogCity.objects.create(
+            name="blumenau",
+            city_names=["Blumenau", "blumenau"],
+            neighborhood_names=["Centro", "Itoupava Seca", "Itoupava-Seca"],
+            real_estate_count=5,
+            crawled_at=self.crawled_at,
+            search=self.catalog_search,
+        )
+
+        self.matching = [
+            self.create_crawled_real_estate("M1"),
+            self.create_crawled_real_estate("M2", neighborhood="Itoupava-Seca"),
+        ]
+        self.create_crawled_real_estate("OTHER-NEIGHBORHOOD", neighborhood="Centro")
+        self.create_crawled_real_estate("OTHER-BEDROOMS", bedroom_quantity=3)
+        self.create_crawled_real_estate("OTHER-PRICE", price=900000.0)
+        self.create_crawled_real_estate("OTHER-TRANSACTION", transaction_type="rent")
+        self.create_crawled_real_estate("UNAVAILABLE", available=False)
+        self.create_crawled_real_estate("OTHER-CITY", city="Gaspar")
+
+    def create_crawled_real_estate(self, reference_code: str, **kwargs) -> RealEstate:
+        """Real estate found by the crawl of the catalog city"""
+        real_estate = create_catalog_real_estate(reference_code, **kwargs)
+        SearchResultRealEstate.objects.create(
+            search=self.catalog_search, real_estate=real_estate
+        )
+        return real_estate
+
+    def get_catalog_references(self, filter_obj: Filter) -> set:
+        queryset = catalog.build_catalog_queryset(filter_obj, [self.catalog_city])
+        return set(queryset.values_list("reference_code", flat=True))
+
+    def test_catalog_query_matches_filter(self):
+        """Names are matched no matter the spelling of the search"""
+        filter_obj = create_catalog_filter(
+            city=["Blumenau"], neighborhood=["Itoupava Séca"]
+        )
+
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=86400):
+            catalog_cities = catalog.get_fresh_catalog_cities(filter_obj)
+
+        self.assertEqual(catalog_cities, [self.catalog_city])
+        self.assertEqual(self.get_catalog_references(filter_obj), {"M1", "M2"})
+
+    def test_catalog_query_quantities(self):
+        """Quantities are options like in ISC, 5 means 5 or more"""
+        self.create_crawled_real_estate("FIVE-BEDROOMS", bedroom_quantity=6)
+
+        filter_obj = create_catalog_filter(bedroom_quantity=[3, 5])
+        self.assertEqual(
+            self.get_catalog_references(filter_obj), {"OTHER-BEDROOMS", "FIVE-BEDROOMS"}
+        )
+
+        filter_obj = create_catalog_filter(bedroom_quantity=[0], neighborhood=[])
+        self.assertEqual(len(self.get_catalog_references(filter_obj)), 5)
+
+    def test_catalog_query_leaves_out_real_estates_not_crawled(self):
+        """A real estate no longer listed by the last crawl is not a result"""
+        create_catalog_real_estate("DELISTED")
+
+        filter_obj = create_catalog_filter()
+
+        self.assertEqual(self.get_catalog_references(filter_obj), {"M1", "M2"})
+
+    def test_unknown_neighborhood_is_not_answered(self):
+        """A neighborhood may be named differently, the search is crawled"""
+        filter_obj = create_catalog_filter(neighborhood=["itoupava norte"])
+
+        queryset = catalog.build_catalog_queryset(filter_obj, [self.catalog_city])
+
+        self.assertIsNone(queryset)
+
+    def test_stale_or_missing_catalog_is_not_used(self):
+        filter_obj = create_catalog_filter()
+
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=60):
+            self.assertIsNone(catalog.get_fresh_catalog_cities(filter_obj))
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=0):
+            self.assertIsNone(catalog.get_fresh_catalog_cities(filter_obj))
+
+        filter_obj = create_catalog_filter(city=["blumenau", "gaspar"])
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=86400):
+            self.assertIsNone(catalog.get_fresh_catalog_cities(filter_obj))
+
+    def test_public_create_search_answered_from_catalog(self):
+        """A search of a city in the catalog finishes without a crawl"""
+        payload = {
+            "property_type": ["apartment"],
+            "transaction_type": ["buy"],
+            "city": ["blumenau"],
+            "neighborhood": ["itoupava-seca"],
+            "bedroom_quantity": [2],
+            "suite_quantity": [0],
+            "bathroom_quantity": [0],
+            "garage_slots_quantity": [0],
+            "min_price": 100000.0,
+            "max_price": 500000.0,
+            "min_area": 50.0,
+            "max_area": 100.0,
+        }
+        client = APIClient()
+
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=86400):
+            res = client.post(reverse("search:search"), payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data.get("query_status"), Search.QueryStatus.FINISHED)
+        self.assertEqual(res.data.get("number_real_estate_found"), 2)
+        search_obj = Search.objects.get(id=res.data.get("id"))
+        self.assertEqual(search_obj.results_source, Search.ResultsSource.CATALOG)
+        self.assertEqual(search_obj.finished_at, self.crawled_at)
+        self.assertEqual(
+            set(
+                SearchResultRealEstate.objects.filter(search=search_obj).values_list(
+                    "real_estate_id", flat=True
+                )
+            ),
+            {real_estate.id for real_estate in self.matching},
+        )
+        self.assertFalse(CrawlJob.objects.exists())
+
+    def test_public_create_search_crawls_without_catalog(self):
+        payload = {
+            "property_type": ["apartment"],
+            "transaction_type": ["buy"],
+            "city": ["gaspar"],
+            "neighborhood": ["centro"],
+            "bedroom_quantity": [2],
+            "suite_quantity": [0],
+            "bathroom_quantity": [0],
+            "garage_slots_quantity": [0],
+            "min_price": 100000.0,
+            "max_price": 500000.0,
+            "min_area": 50.0,
+            "max_area": 100.0,
+        }
+        client = APIClient()
+
+        with self.settings(ISC_CATALOG_FRESH_SECONDS=86400):
+            res = client.post(reverse("search:search"), payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        search_obj = Search.objects.get(id=res.data.get("id"))
+        self.assertEqual(search_obj.results_source, Search.ResultsSource.CRAWL)
+        self.assertTrue(CrawlJob.objects.filter(search=search_obj).exists())
+
+
+class TestRefreshCityCatalog(TestCase):
+
+    def fake_bulk_load(self, search_id):
+        search_obj = Search.objects.get(id=search_id)
+        for reference_code, neighborhood in [("A", "Centro"), ("B", "Velha")]:
+            SearchResultRealEstate.objects.create(
+                search=search_obj,
+                real_estate=create_catalog_real_estate(
+                    reference_code, neighborhood=neighborhood
+                ),
+            )
+        search_obj.query_status = Search.QueryStatus.FINISHED
+        search_obj.finished_at = timezone.now()
+        search_obj.save()
+
+    def test_refresh_city_catalog(self):
+        with patch(
+            "search.catalog.bulk_load_isc_real_estate_search",
+            side_effect=self.fake_bulk_load,
+        ) as bulk_load:
+            catalog_city = catalog.refresh_city_catalog("Blumenau")
+
+        search_obj = Search.objects.get(id=bulk_load.call_args.args[0])
+        self.assertEqual(search_obj.filter.city, ["Blumenau"])
+        self.assertEqual(search_obj.filter.neighborhood, [])
+        self.assertEqual(catalog_city.name, "blumenau")
+        self.assertEqual(catalog_city.city_names, ["Blumenau"])
+        self.assertEqual(catalog_city.neighborhood_names, ["Centro", "Velha"])
+        self.assertEqual(catalog_city.real_estate_count, 2)
+        self.assertEqual(catalog_city.crawled_at, search_obj.finished_at)
+        self.assertEqual(catalog_city.search, search_obj)
+
+    def test_real_estates_missing_from_new_crawl_are_delisted(self):
+        previous_search = Search.objects.create(filter=create_catalog_filter())
+        for reference_code in ["A", "GONE"]:
+            SearchResultRealEstate.objects.create(
+                search=previous_search,
+                real_estate=create_catalog_real_estate(reference_code),
+            )
+        CatalogCity.objects.create(
+            name="blumenau",
+            city_names=["Blumenau"],
+            neighborhood_names=["Itoupava Seca"],
+            real_estate_count=2,
+            crawled_at=timezone.now(),
+            search=previous_search,
+        )
+
+        def fake_bulk_load(search_id):
+            search_obj = Search.objects.get(id=search_id)
+            SearchResultRealEstate.objects.create(
+                search=search_obj,
+                real_estate=RealEstate.objects.get(reference_code="A"),
+            )
+            search_obj.query_status = Search.QueryStatus.FINISHED
+            search_obj.finished_at = timezone.now()
+            search_obj.save()
+
+        with patch(
+            "search.catalog.bulk_load_isc_real_estate_search",
+            side_effect=fake_bulk_load,
+        ):
+            catalog.refresh_city_catalog("Blumenau")
+
+        self.assertTrue(RealEstate.objects.get(reference_code="A").available)
+        delisted = RealEstate.objects.get(reference_code="GONE")
+        self.assertFalse(delisted.available)
+        self.assertEqual(delisted.content_hash, delisted.get_content_hash())
+        re_update = RealEstateUpdate.objects.get()
+        self.assertEqual(re_update.real_estate, delisted)
+        self.assertEqual(re_update.update, [RealEstateUpdate.Update.AVAILABILITY])
+        self.assertTrue(re_update.old_available)
+        self.assertFalse(re_update.new_available)
+
+    def test_crawl_with_skipped_pages_keeps_catalog(self):
+        def fake_bulk_load(search_id):
+            self.fake_bulk_load(search_id)
+            Search.objects.filter(id=search_id).update(skipped_pages=[2])
+
+        with patch(
+            "search.catalog.bulk_load_isc_real_estate_search",
+            side_effect=fake_bulk_load,
+        ):
+            catalog_city = catalog.refresh_city_catalog("Blumenau")
+
+        self.assertIsNone(catalog_city)
+        self.assertFalse(CatalogCity.objects.exists())
+
+    def test_failed_crawl_keeps_catalog(self):
+        with patch("search.catalog.bulk_load_isc_real_estate_search"):
+            catalog_city = catalog.refresh_city_catalog("Blumenau")
+
+        self.assertIsNone(catalog_city)
+        self.assertFalse(CatalogCity.objects.exists())
@@ -0,0 +1,262 @@
+import threading
+from datetime import timedelta
+from unittest.mock import ANY, patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from search.factories import SearchFactory
+from search.jobs import (
+    CrawlJobHeartbeat,
+    CrawlWorker,
+    claim_crawl_job,
+    enqueue_crawl,
+    enqueue_or_attach_crawl,
+    finish_crawl_job,
+    renew_crawl_job_lease,
+)
+from search.models import CrawlJob, Search, SearchResultRealEstate
+from search.services import create_search
+from search.tests.test_webcrawler_isc import build_result_page
+from search.webcrawler_http import FetchResult, FetchStatus
+from search.webcrawler_isc import WebcrawlerISCRealEstate
+
+
+class TestClaimCrawlJob(TestCase):
+
+    def test_oldest_pending_job_is_claimed(self):
+        job = enqueue_crawl(SearchFactory())
+        enqueue_crawl(SearchFactory())
+
+        claimed = claim_crawl_job("worker-1", lease_seconds=60)
+
+        self.assertEqual(claimed.id, job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.RUNNING)
+        self.assertEqual(job.worker_id, "worker-1")
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.lease_until, timezone.now())
+
+    def test_job_with_expired_lease_is_claimed_again(self):
+        job = enqueue_crawl(SearchFactory())
+        claim_crawl_job("worker-1", lease_seconds=60)
+
+        self.assertIsNone(claim_crawl_job("worker-2", lease_seconds=60))
+
+        CrawlJob.objects.filter(id=job.id).update(
+            lease_until=timezone.now() - timedelta(seconds=1)
+        )
+        claimed = claim_crawl_job("worker-2", lease_seconds=60)
+
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.attempts, 2)
+        # the first worker lost the job
+        job.worker_id = "worker-1"
+        self.assertFalse(renew_crawl_job_lease(job, lease_seconds=60))
+        self.assertTrue(renew_crawl_job_lease(claimed, lease_seconds=60))
+
+
+class TestCrawlWorker(TestCase):
+
+    def setUp(self):
+        self.worker = CrawlWorker(
+            worker_id="worker-1",
+            lease_seconds=60,
+            heartbeat_seconds=60,
+            max_attempts=2,
+            poll_seconds=1,
+        )
+
+    @patch("search.jobs.crawl_isc_real_estate_search")
+    def test_claimed_job_is_crawled(self, crawl):
+        search_obj = SearchFactory()
+        job = enqueue_crawl(search_obj, incremental=True)
+
+        self.assertTrue(self.worker.run_once())
+        self.assertFalse(self.worker.run_once())
+
+        crawl.assert_called_once_with(
+            search_obj.id, incremental=True, raise_errors=True, check_lease=ANY
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.DONE)
+        self.assertEqual(self.worker.jobs_done, 1)
+
+    @patch.object(
+        WebcrawlerISCRealEstate,
+        "make_request",
+        side_effect=RuntimeError("ISC unreachable"),
+    )
+    def test_failed_job_is_retried_until_max_attempts(self, make_request):
+        search_obj = SearchFactory()
+        attached_search = SearchFactory(crawl_leader=search_obj)
+        job = enqueue_crawl(search_obj)
+
+        with self.settings(ISC_CRAWLER_PIPELINE=False, ISC_CRAWLER_LAZY_PAGES=0):
+            self.worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.PENDING)
+        self.assertEqual(job.last_error, "ISC unreachable")
+        search_obj.refresh_from_db()
+        self.assertEqual(search_obj.query_status, Search.QueryStatus.NOT_STARTED)
+
+        with self.settings(ISC_CRAWLER_PIPELINE=False, ISC_CRAWLER_LAZY_PAGES=0):
+            self.worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.worker.jobs_failed, 2)
+        self.assertFalse(self.worker.run_once())
+        # clients polling the searches stop waiting for the crawl
+        search_obj.refresh_from_db()
+        self.assertEqual(search_obj.query_status, Search.QueryStatus.FAILED)
+        attached_search.refresh_from_db()
+        self.assertEqual(attached_search.query_status, Search.QueryStatus.FAILED)
+
+    @patch.object(
+        WebcrawlerISCRealEstate,
+        "make_request",
+        return_value=FetchResult(None, FetchStatus.FAILED, 4, "503"),
+    )
+    def test_job_whose_first_page_failed_is_retried(self, make_request):
+        search_obj = SearchFactory()
+        job = enqueue_crawl(search_obj)
+
+        with self.settings(ISC_CRAWLER_PIPELINE=False, ISC_CRAWLER_LAZY_PAGES=0):
+            self.worker.run_once()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.PENDING)
+        search_obj.refresh_from_db()
+        self.assertNotEqual(search_obj.query_status, Search.QueryStatus.FINISHED)
+
+    def test_crawl_stops_once_lease_is_lost(self):
+        search_obj = SearchFactory()
+        job = enqueue_crawl(search_obj)
+        heartbeats = []
+
+        class RecordedHeartbeat(CrawlJobHeartbeat):
+            def __enter__(self):
+                heartbeats.append(self)
+                return super().__enter__()
+
+        def take_job(crawler, page=None):
+            # another worker claims the job while the first page is fetched
+            CrawlJob.objects.filter(id=job.id).update(worker_id="worker-2")
+            heartbeats[0].lease_lost = True
+            page = page or crawler.page
+            body = build_result_page(page, 3, [f"P{page}-A"])
+            return FetchResult(body, FetchStatus.FETCHED, 1)
+
+        with self.settings(ISC_CRAWLER_PIPELINE=False, ISC_CRAWLER_LAZY_PAGES=0), patch(
+            "search.jobs.CrawlJobHeartbeat", RecordedHeartbeat
+        ), patch.object(
+            WebcrawlerISCRealEstate, "make_request", autospec=True, side_effect=take_job
+        ):
+            self.assertTrue(self.worker.run_once())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.Status.RUNNING)
+        self.assertEqual(job.worker_id, "worker-2")
+        self.assertEqual(self.worker.jobs_done, 0)
+        self.assertEqual(self.worker.jobs_failed, 0)
+        self.assertFalse(
+            SearchResultRealEstate.objects.filter(search=search_obj).exists()
+        )
+
+
+class TestEnqueueOrAttachCrawl(TestCase):
+
+    def test_search_is_attached_to_crawl_in_flight(self):
+        leader = SearchFactory(query_status=Search.QueryStatus.PARTIAL)
+        job = enqueue_or_attach_crawl(leader, "fingerprint")
+
+        search_obj = SearchFactory()
+        self.assertEqual(enqueue_or_attach_crawl(search_obj, "fingerprint"), job)
+
+        search_obj.refresh_from_db()
+        self.assertEqual(search_obj.crawl_leader, leader)
+        self.assertEqual(search_obj.query_status, Search.QueryStatus.PARTIAL)
+        self.assertEqual(CrawlJob.objects.count(), 1)
+
+    def test_filter_is_crawled_again_once_crawl_is_done(self):
+        enqueue_or_attach_crawl(SearchFactory(), "fingerprint")
+        finish_crawl_job(claim_crawl_job("worker-1", lease_seconds=60))
+
+        search_obj = SearchFactory()
+        new_job = enqueue_or_attach_crawl(search_obj, "fingerprint")
+
+        self.assertEqual(new_job.search, search_obj)
+        self.assertIsNone(Search.objects.get(id=search_obj.id).crawl_leader)
+
+
+class TestCreateSearchConcurrency(TransactionTestCase):
+
+    def test_concurrent_identical_searches_queue_one_crawl(self):
+        data = {
+            "property_type": ["apartment"],
+            "transaction_type": ["rent"],
+            "city": ["blumenau"],
+            "neighborhood": ["fortaleza"],
+            "bedroom_quantity": [1],
+            "suite_quantity": [0],
+            "bathroom_quantity": [1],
+            "garage_slots_quantity": [0],
+            "min_price": 500,
+            "max_price": 3000,
+            "min_area": 30,
+            "max_area": 100,
+        }
+        barrier = threading.Barrier(8)
+        search_ids = []
+
+        def create():
+            try:
+                barrier.wait(10)
+                search_ids.append(create_search(AnonymousUser(), dict(data)).id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(search_ids), 8)
+        job = CrawlJob.objects.get()
+        # retries get the search of the crawl, racing ones are attached to it
+        for search_obj in Search.objects.filter(id__in=search_ids):
+            self.assertIn(search_obj.get_results_search_id(), [job.search_id])
+
+
+class TestClaimCrawlJobConcurrency(TransactionTestCase):
+
+    def test_job_locked_by_other_worker_is_skipped(self):
+        locked_job = enqueue_crawl(SearchFactory())
+        other_job = enqueue_crawl(SearchFactory())
+        locked = threading.Event()
+        release = threading.Event()
+
+        def lock_job():
+            # another worker in the middle of claiming the oldest job
+            try:
+                with transaction.atomic():
+                    CrawlJob.objects.select_for_update().get(id=locked_job.id)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=lock_job)
+        thread.start()
+        try:
+            locked.wait(10)
+            claimed = claim_crawl_job("worker-1", lease_seconds=60)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(claimed.id, other_job.id)
@@ -144,3 +144,74 @@ class TestModel(TestCase):
         SearchResultRealEstate.objects.create(
             search=search_obj, real_estate=real_estate_obj
         )
+
+    def test_filter_fingerprint_is_canonical(self):
+        filter_dict = {
+            "property_type": [RealEstate.PropertyType.APARTMENT],
+            "transaction_type": [RealEstate.TransactionType.BUY],
+            "city": ["Florianópolis"],
+            "neighborhood": ["Santo  Antônio de Lisboa", "centro"],
+            "bedroom_quantity": [3, 2],
+            "suite_quantity": [1],
+            "bathroom_quantity": [2],
+            "garage_slots_quantity": [1],
+            "min_price": 100,
+            "max_price": 200,
+            "min_area": 20,
+            "max_area": 30,
+        }
+        fingerprint = Filter(**filter_dict).get_fingerprint()
+
+        same_filter_dict = dict(
+            filter_dict,
+            city=["florianopolis "],
+            neighborhood=["Centro", "santo antonio de lisboa"],
+            bedroom_quantity=[2, 3, 3],
+            min_price=100.0,
+        )
+        self.assertEqual(Filter(**same_filter_dict).get_fingerprint(), fingerprint)
+
+        other_filter_dict = dict(filter_dict, max_price=201)
+        self.assertNotEqual(Filter(**other_filter_dict).get_fingerprint(), fingerprint)
+
+    def test_filter_contains_narrower_filter(self):
+        filter_dict = {
+            "property_type": [RealEstate.PropertyType.APARTMENT],
+            "transaction_type": [RealEstate.TransactionType.BUY],
+            "city": ["Florianópolis"],
+            "neighborhood": ["Santo Antônio de Lisboa", "centro"],
+            "bedroom_quantity": [2, 3],
+            "suite_quantity": [0],
+            "bathroom_quantity": [2],
+            "garage_slots_quantity": [1, 5],
+            "min_price": 100,
+            "max_price": 200,
+            "min_area": 20,
+            "max_area": 30,
+        }
+        broad_filter = Filter(**filter_dict)
+
+        narrower_filters = [
+            dict(filter_dict, city=["florianopolis"], max_price=150),
+            dict(filter_dict, neighborhood=["Centro"]),
+            dict(filter_dict, bedroom_quantity=[3], suite_quantity=[1]),
+            dict(filter_dict, garage_slots_quantity=[7], min_area=25),
+        ]
+        for narrower_dict in narrower_filters:
+            self.assertTrue(broad_filter.contains(Filter(**narrower_dict)))
+
+        other_filters = [
+            dict(filter_dict, city=["florianopolis", "palhoca"]),
+            dict(filter_dict, property_type=[RealEstate.PropertyType.HOUSE]),
+            dict(filter_dict, neighborhood=["centro", "trindade"]),
+            dict(filter_dict, neighborhood=[]),
+            dict(filter_dict, bedroom_quantity=[0]),
+            dict(filter_dict, garage_slots_quantity=[2]),
+            dict(filter_dict, max_price=201),
+            dict(filter_dict, min_area=10),
+        ]
+        for other_dict in other_filters:
+            self.assertFalse(broad_filter.contains(Filter(**other_dict)))
+
+        whole_city_filter = Filter(**dict(filter_dict, neighborhood=[]))
+        self.assertTrue(whole_city_filter.contains(broad_filter))
@@ -0,0 +1,180 @@
+"""
+Tests for keyset pagination of search results
+"""
+
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from real_estate.factories import RealEstateFactory
+from real_estate_agency.factories import AgencyFactory
+from search.factories import SearchFactory
+from search.models import CrawlJob, Search, SearchResultRealEstate
+from search.task import copy_search_results
+
+
+@patch("rest_framework.throttling.AnonRateThrottle.get_rate", lambda x: "1000/minute")
+class TestSearchResultPagination(TestCase):
+
+    def setUp(self):
+        self.search_obj = SearchFactory()
+        self.agency = AgencyFactory()
+        self.url = reverse("search:search-pk-result", args=[str(self.search_obj.id)])
+        self.client = APIClient()
+
+    def add_results(self, n: int) -> list:
+        real_estates = []
+        for _ in range(n):
+            real_estate = RealEstateFactory(agency=self.agency)
+            real_estate.url = f"https://apt.com/{real_estate.reference_code}"
+            real_estate.save()
+            SearchResultRealEstate.objects.create(
+                search=self.search_obj, real_estate=real_estate
+            )
+            real_estates.append(real_estate)
+        return real_estates
+
+    def get_pages(self, limit: int) -> list:
+        pages = []
+        params = {"limit": limit}
+        while True:
+            res = self.client.get(self.url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data)
+
+            next_cursor = res.data.get("meta").get("next_cursor")
+            if next_cursor is None:
+                return pages
+            params = {"limit": limit, "cursor": next_cursor}
+
+    def test_pages_follow_cursor(self):
+        real_estates = self.add_results(5)
+
+        pages = self.get_pages(limit=2)
+
+        self.assertEqual([len(page.get("data")) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [item.get("id") for page in pages for item in page.get("data")],
+            [real_estate.id for real_estate in real_estates],
+        )
+        for number, page in enumerate(pages, start=1):
+            meta = page.get("meta")
+            self.assertEqual(meta.get("page"), number)
+            self.assertEqual(meta.get("per_page"), 2)
+            self.assertEqual(meta.get("total"), 5)
+            self.assertEqual(meta.get("total_pages"), 3)
+
+    def test_results_of_a_page_and_their_copies_keep_crawl_order(self):
+        """Results written by a single query are listed in the order written"""
+        real_estates = [RealEstateFactory(agency=self.agency) for _ in range(5)]
+        SearchResultRealEstate.objects.bulk_create(
+            [
+                SearchResultRealEstate(search=self.search_obj, real_estate=real_estate)
+                for real_estate in real_estates
+            ]
+        )
+        copy_search = SearchFactory()
+        copy_search_results(self.search_obj.id, copy_search.id)
+
+        for search_obj in [self.search_obj, copy_search]:
+            self.url = reverse("search:search-pk-result", args=[str(search_obj.id)])
+            pages = self.get_pages(limit=2)
+
+            self.assertEqual(
+                [item.get("id") for page in pages for item in page.get("data")],
+                [real_estate.id for real_estate in real_estates],
+            )
+
+    def test_cursor_crawls_next_pages_without_position(self):
+        """Clients paging with the cursor alone trigger the lazy crawl too"""
+        self.add_results(2)
+        Search.objects.filter(id=self.search_obj.id).update(
+            query_status=Search.QueryStatus.PARTIAL, next_page=2
+        )
+
+        with self.settings(ISC_CRAWLER_LAZY_PREFETCH_RESULTS=1):
+            res = self.client.get(self.url, {"limit": 1})
+            self.assertFalse(CrawlJob.objects.exists())
+
+            next_cursor = res.data.get("meta").get("next_cursor")
+            res = self.client.get(self.url, {"limit": 1, "cursor": next_cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(CrawlJob.objects.filter(search=self.search_obj).count(), 1)
+
+    def test_results_added_after_cursor_are_in_next_pages(self):
+        """Pages crawled lazily are seen after the ones already crawled"""
+        real_estates = self.add_results(2)
+
+        res = self.client.get(self.url, {"limit": 2})
+        next_cursor = res.data.get("meta").get("next_cursor")
+        self.assertIsNone(next_cursor)
+
+        res = self.client.get(self.url, {"limit": 1})
+        next_cursor = res.data.get("meta").get("next_cursor")
+        real_estates += self.add_results(2)
+        res = self.client.get(self.url, {"limit": 5, "cursor": next_cursor})
+
+        self.assertEqual(
+            [item.get("id") for item in res.data.get("data")],
+            [real_estate.id for real_estate in real_estates[1:]],
+        )
+
+    def test_total_is_estimated_above_threshold(self):
+        self.add_results(4)
+
+        with self.settings(PAGINATION_EXACT_TOTAL_MAX=2):
+            res = self.client.get(self.url, {"limit": 1})
+
+        meta = res.data.get("meta")
+        self.assertTrue(meta.get("total_estimated"))
+        self.assertGreaterEqual(meta.get("total"), 3)
+
+        res = self.client.get(self.url, {"limit": 1, "total": "false"})
+
+        meta = res.data.get("meta")
+        self.assertEqual(meta.get("total"), 0)
+        self.assertEqual(meta.get("total_pages"), 0)
+        self.assertIsNotNone(meta.get("next_cursor"))
+
+    def test_limit_is_capped(self):
+        self.add_results(3)
+
+        with self.settings(PAGINATION_MAX_LIMIT=2):
+            res = self.client.get(self.url, {"limit": 100})
+
+        self.assertEqual(len(res.data.get("data")), 2)
+        self.assertEqual(res.data.get("meta").get("per_page"), 2)
+
+    def test_invalid_cursor(self):
+        self.add_results(1)
+        cursors = [
+            "not a cursor",
+            # valid cursor whose key is not a date and an id
+            "eyJwYWdlIjogMSwgImtleSI6IFsiYSIsICJiIl19",
+        ]
+
+        for cursor in cursors:
+            res = self.client.get(self.url, {"cursor": cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("cursor", res.data)
+
+    def test_page_queries_do_not_grow_with_results(self):
+        """Real estates of a page are loaded with the results, no N+1"""
+        self.add_results(2)
+        with CaptureQueriesContext(connection) as few_results:
+            self.client.get(self.url, {"limit": 10})
+
+        self.add_results(8)
+        with CaptureQueriesContext(connection) as many_results:
+            res = self.client.get(self.url, {"limit": 10})
+
+        self.assertEqual(len(res.data.get("data")), 10)
+        self.assertEqual(len(many_results), len(few_results))
@@ -0,0 +1,135 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from search.pipeline import CrawlPipeline
+from search.tests.test_webcrawler_isc import build_result_page
+from search.webcrawler_http import FetchResult, FetchStatus
+from search.webcrawler_isc import WebcrawlerISCRealEstate, WebsiteISCFilter
+
+
+class TestCrawlPipeline(SimpleTestCase):
+
+    def setUp(self):
+        self.crawler = WebcrawlerISCRealEstate()
+        self.crawler.set_filter(
+            WebsiteISCFilter(
+                property_type=["apartamento"],
+                transaction_type=["comprar"],
+                city="blumenau",
+                neighborhood=["centro"],
+                bedroom_quantity=["1"],
+                suite_quantity=["1"],
+                garage_slots_quantity=["1"],
+                min_price=500000,
+                max_price=600000,
+                min_area=35,
+                max_area=85,
+            )
+        )
+        self.crawler.make_request = self.fake_make_request
+        self.page_last = 12
+        self.failed_pages = []
+        self.requested_pages = []
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def fake_make_request(self, page=None):
+        with self.lock:
+            self.requested_pages.append(page)
+        if page in self.failed_pages:
+            return FetchResult(None, FetchStatus.FAILED, 4, "503")
+
+        body = build_result_page(page, self.page_last, [f"P{page}-A", f"P{page}-B"])
+        return FetchResult(body, FetchStatus.FETCHED, 1)
+
+    def write_pages(self, page_contents):
+        self.batches.append([page_content.page for page_content in page_contents])
+
+    def test_pages_are_written_in_order(self):
+        self.failed_pages = [5]
+        pipeline = CrawlPipeline(
+            self.crawler,
+            fetch_workers=4,
+            parse_processes=0,
+            queue_size=2,
+            write_batch_pages=3,
+        )
+
+        pipeline.run(self.write_pages)
+
+        pages = [page for batch in self.batches for page in batch]
+        self.assertEqual(pages, list(range(1, 13)))
+        self.assertEqual(self.batches[0], [1])
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+        self.assertEqual(sorted(self.requested_pages), list(range(1, 13)))
+
+        stats = pipeline.get_stats()
+        self.assertEqual(stats["fetch"]["items"], 12)
+        self.assertEqual(stats["parse"]["items"], 12)
+        self.assertEqual(stats["write"]["items"], 12)
+
+    def test_resumed_crawl_starts_at_page(self):
+        pipeline = CrawlPipeline(self.crawler, parse_processes=0)
+
+        pipeline.run(self.write_pages, start_page=10)
+
+        pages = [page for batch in self.batches for page in batch]
+        self.assertEqual(pages, [10, 11, 12])
+        self.assertEqual(sorted(self.requested_pages), [10, 11, 12])
+
+    def test_failed_first_page_stops_crawl(self):
+        self.failed_pages = [1]
+        pipeline = CrawlPipeline(self.crawler, parse_processes=0)
+
+        pipeline.run(self.write_pages)
+
+        self.assertEqual(self.batches, [[1]])
+        self.assertEqual(self.requested_pages, [1])
+
+    def test_slow_writer_holds_back_fetchers(self):
+        self.page_last = 40
+        pipeline = CrawlPipeline(
+            self.crawler,
+            fetch_workers=2,
+            parse_processes=0,
+            queue_size=1,
+            write_batch_pages=1,
+        )
+        pages_ahead = []
+
+        def write_pages(page_contents):
+            with self.lock:
+                written = sum(len(batch) for batch in self.batches)
+                pages_ahead.append(len(self.requested_pages) - written)
+            self.batches.append([page_content.page for page_content in page_contents])
+
+        pipeline.run(write_pages)
+
+        self.assertEqual(sum(len(batch) for batch in self.batches), 40)
+        # the first page is written before the others are requested
+        self.assertLessEqual(max(pages_ahead), pipeline.window + 1)
+
+    def test_writer_error_stops_pipeline(self):
+        self.page_last = 40
+
+        def write_pages(page_contents):
+            if page_contents[0].page > 1:
+                raise RuntimeError("database is gone")
+
+        pipeline = CrawlPipeline(
+            self.crawler, fetch_workers=2, parse_processes=0, queue_size=1
+        )
+
+        with self.assertRaisesMessage(RuntimeError, "database is gone"):
+            pipeline.run(write_pages)
+        self.assertLess(len(self.requested_pages), 40)
+
+    def test_pages_are_parsed_in_worker_processes(self):
+        self.page_last = 4
+        pipeline = CrawlPipeline(self.crawler, parse_processes=1)
+
+        pipeline.run(self.write_pages)
+
+        pages = [page for batch in self.batches for page in batch]
+        self.assertEqual(pages, [1, 2, 3, 4])
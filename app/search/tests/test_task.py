@@ -0,0 +1,594 @@
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from radar.factories import RadarFactory
+from radar.models import RadarRealEstate
+from radar.percolator import clear_radar_percolator, get_radar_percolator
+from real_estate.factories import RealEstateFactory
+from real_estate_agency.factories import AgencyFactory
+from real_estate.models import Agency, RealEstate, RealEstateUpdate
+from search.factories import SearchFactory
+from search.models import Search, SearchCrawlCheckpoint, SearchResultRealEstate
+from search.task import (
+    AgencyCache,
+    agency_cache,
+    build_agency_object,
+    build_real_estate_object,
+    create_isc_filter,
+    crawl_isc_real_estate_search,
+    is_known_page,
+    rate_limit_connection,
+    store_real_estate_page,
+)
+from search.tests.test_webcrawler_isc import build_result_page
+from search.webcrawler_http import FetchResult, FetchStatus, PostgresTokenBucket
+from search.webcrawler_isc import (
+    WebcrawlerISCRealEstate,
+    WebsiteISCAgencyInfo,
+    WebsiteISCPageContent,
+    WebsiteISCRealEstateInfo,
+)
+
+
+class TestCrawlISCRealEstateSearch(TestCase):
+
+    def setUp(self):
+        # agencies of other tests are rolled back
+        agency_cache.clear()
+        self.search_obj = SearchFactory()
+        self.failed_pages = []
+        self.page_last = 3
+        self.requested_urls = []
+
+    def fake_make_request(self, crawler, page=None):
+        page = page or crawler.page
+        self.requested_urls.append(f"{crawler.url}&page={page}")
+        if page in self.failed_pages:
+            return FetchResult(None, FetchStatus.FAILED, 4, "503")
+
+        body = build_result_page(page, self.page_last, [f"P{page}-A", f"P{page}-B"])
+        return FetchResult(body, FetchStatus.FETCHED, 1)
+
+    def crawl(
+        self, incremental: bool = False, pipeline: bool = False, lazy_pages: int = 0
+    ):
+        with patch.object(
+            WebcrawlerISCRealEstate,
+            "make_request",
+            autospec=True,
+            side_effect=self.fake_make_request,
+        ):
+            crawl_isc_real_estate_search(
+                self.search_obj.id,
+                incremental=incremental,
+                pipeline=pipeline,
+                lazy_pages=lazy_pages,
+            )
+
+        self.search_obj.refresh_from_db()
+
+    def test_interrupted_crawl_is_resumed(self):
+        self.page_last = 5
+        self.create_known_real_estates(range(1, 6))
+        fake_make_request = self.fake_make_request
+
+        def interrupted_make_request(crawler, page=None):
+            if (page or crawler.page) == 3:
+                raise RuntimeError("worker recycled")
+            return fake_make_request(crawler, page)
+
+        self.fake_make_request = interrupted_make_request
+        with self.settings(ISC_CRAWLER_MAX_WORKERS=1):
+            self.crawl()
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.PARTIAL)
+        checkpoint = SearchCrawlCheckpoint.objects.get(search=self.search_obj)
+        self.assertEqual(checkpoint.last_page, 2)
+        self.assertEqual(checkpoint.total_pages, 5)
+        self.assertEqual(checkpoint.reference_codes, ["P1-A", "P1-B", "P2-A", "P2-B"])
+
+        self.fake_make_request = fake_make_request
+        self.requested_urls = []
+        self.crawl()
+
+        self.assertEqual(
+            [url.rsplit("=", 1)[1] for url in self.requested_urls], ["3", "4", "5"]
+        )
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 10
+        )
+        self.assertFalse(
+            SearchCrawlCheckpoint.objects.filter(search=self.search_obj).exists()
+        )
+
+    def test_resumed_crawl_skips_ingested_real_estates(self):
+        self.create_known_real_estates(range(1, 4))
+        crawler = WebcrawlerISCRealEstate()
+        crawler.set_filter(create_isc_filter(self.search_obj))
+        SearchCrawlCheckpoint.objects.create(
+            search=self.search_obj,
+            filter_url=crawler.url,
+            last_page=1,
+            total_pages=3,
+            reference_codes=["P1-A", "P1-B", "P2-A"],
+        )
+
+        self.crawl()
+
+        self.assertEqual(len(self.requested_urls), 2)
+        codes = SearchResultRealEstate.objects.filter(
+            search=self.search_obj
+        ).values_list("real_estate__reference_code", flat=True)
+        self.assertEqual(sorted(codes), ["P2-B", "P3-A", "P3-B"])
+
+    def test_checkpoint_of_other_filter_is_discarded(self):
+        self.create_known_real_estates(range(1, 4))
+        SearchCrawlCheckpoint.objects.create(
+            search=self.search_obj,
+            filter_url="https://www.imoveis-sc.com.br/other",
+            last_page=2,
+            total_pages=3,
+            reference_codes=["P1-A"],
+        )
+
+        self.crawl()
+
+        self.assertEqual(len(self.requested_urls), 3)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 6
+        )
+
+    def test_search_finishes_with_skipped_pages(self):
+        self.failed_pages = [2]
+
+        self.crawl()
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.number_real_estate_found, 6)
+        self.assertEqual(self.search_obj.skipped_pages, [2])
+
+    def test_search_fails_when_first_page_fails(self):
+        self.failed_pages = [1]
+
+        self.crawl()
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.NOT_STARTED)
+        self.assertIsNone(self.search_obj.finished_at)
+        self.assertEqual(self.search_obj.skipped_pages, [])
+
+    def test_search_without_skipped_pages(self):
+        self.crawl()
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.skipped_pages, [])
+        self.assertIsNotNone(self.search_obj.finished_at)
+        self.assertGreater(self.search_obj.crawl_seconds, 0)
+
+    def test_attached_search_gets_results_of_finished_crawl(self):
+        self.create_known_real_estates(range(1, 4))
+        attached_search = SearchFactory(crawl_leader=self.search_obj)
+
+        self.crawl()
+
+        attached_search.refresh_from_db()
+        self.assertIsNone(attached_search.crawl_leader)
+        self.assertEqual(attached_search.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(attached_search.number_real_estate_found, 6)
+        codes = SearchResultRealEstate.objects.filter(
+            search=attached_search
+        ).values_list("real_estate__reference_code", flat=True)
+        self.assertEqual(
+            sorted(codes), ["P1-A", "P1-B", "P2-A", "P2-B", "P3-A", "P3-B"]
+        )
+
+    def test_attached_search_follows_partial_crawl(self):
+        self.create_known_real_estates(range(1, 4))
+        attached_search = SearchFactory(crawl_leader=self.search_obj)
+        fake_make_request = self.fake_make_request
+
+        def interrupted_make_request(crawler, page=None):
+            if (page or crawler.page) == 2:
+                raise RuntimeError("worker recycled")
+            return fake_make_request(crawler, page)
+
+        self.fake_make_request = interrupted_make_request
+        with self.settings(ISC_CRAWLER_MAX_WORKERS=1):
+            self.crawl()
+
+        attached_search.refresh_from_db()
+        self.assertEqual(attached_search.crawl_leader, self.search_obj)
+        self.assertEqual(attached_search.query_status, Search.QueryStatus.PARTIAL)
+        self.assertFalse(
+            SearchResultRealEstate.objects.filter(search=attached_search).exists()
+        )
+
+    def test_lazy_crawl_continues_from_next_page(self):
+        self.page_last = 5
+        self.create_known_real_estates(range(1, 6))
+
+        self.crawl(lazy_pages=2)
+
+        self.assertEqual(
+            [url.rsplit("=", 1)[1] for url in self.requested_urls], ["1", "2"]
+        )
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.PARTIAL)
+        self.assertEqual(self.search_obj.next_page, 3)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 4
+        )
+
+        self.requested_urls = []
+        self.crawl(lazy_pages=2)
+
+        self.assertEqual(
+            [url.rsplit("=", 1)[1] for url in self.requested_urls], ["3", "4"]
+        )
+        self.assertEqual(self.search_obj.next_page, 5)
+
+        self.requested_urls = []
+        self.crawl(lazy_pages=2)
+
+        self.assertEqual([url.rsplit("=", 1)[1] for url in self.requested_urls], ["5"])
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.next_page, 0)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 10
+        )
+
+    def test_lazy_crawl_results_are_added_to_radars(self):
+        self.create_known_real_estates(range(1, 4))
+        radar = RadarFactory(search=self.search_obj)
+
+        with self.settings(RADAR_PERCOLATOR_REFRESH_SECONDS=0):
+            self.crawl(lazy_pages=1)
+
+        codes = RadarRealEstate.objects.filter(radar=radar).values_list(
+            "real_estate__reference_code", flat=True
+        )
+        self.assertEqual(sorted(codes), ["P1-A", "P1-B"])
+
+        with self.settings(RADAR_PERCOLATOR_REFRESH_SECONDS=0):
+            self.crawl(lazy_pages=0)
+
+        self.assertEqual(RadarRealEstate.objects.filter(radar=radar).count(), 6)
+
+    def test_pipeline_crawl_stores_every_page(self):
+        self.page_last = 6
+        self.failed_pages = [4]
+        self.create_known_real_estates(range(1, 7))
+
+        with self.settings(
+            ISC_CRAWLER_SHARD_PAGES=0,
+            ISC_PIPELINE_PARSE_PROCESSES=0,
+            ISC_PIPELINE_WRITE_BATCH_PAGES=2,
+        ):
+            self.crawl(pipeline=True)
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.number_real_estate_found, 12)
+        self.assertEqual(self.search_obj.skipped_pages, [4])
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 10
+        )
+        self.assertFalse(
+            SearchCrawlCheckpoint.objects.filter(search=self.search_obj).exists()
+        )
+
+    def test_interrupted_pipeline_crawl_is_resumed(self):
+        self.page_last = 5
+        self.create_known_real_estates(range(1, 6))
+        fake_make_request = self.fake_make_request
+
+        def interrupted_make_request(crawler, page=None):
+            if (page or crawler.page) == 3:
+                raise RuntimeError("worker recycled")
+            return fake_make_request(crawler, page)
+
+        self.fake_make_request = interrupted_make_request
+        pipeline_settings = {
+            "ISC_CRAWLER_SHARD_PAGES": 0,
+            "ISC_PIPELINE_PARSE_PROCESSES": 0,
+            "ISC_PIPELINE_WRITE_BATCH_PAGES": 1,
+        }
+        with self.settings(**pipeline_settings):
+            self.crawl(pipeline=True)
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.PARTIAL)
+        checkpoint = SearchCrawlCheckpoint.objects.get(search=self.search_obj)
+        self.assertLess(checkpoint.last_page, 3)
+
+        self.fake_make_request = fake_make_request
+        with self.settings(**pipeline_settings):
+            self.crawl(pipeline=True)
+
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 10
+        )
+
+    def create_known_real_estates(self, pages: list):
+        # stored as crawled from the result pages built for tests, which only
+        # have the code, so they have the content hash of a later crawl
+        agency_obj = AgencyFactory()
+        for page in pages:
+            page_body = build_result_page(page, 1, [f"P{page}-A", f"P{page}-B"])
+            for real_estate in WebcrawlerISCRealEstate().extract_info(page_body):
+                build_real_estate_object(real_estate, agency_obj.id).save()
+
+    def test_incremental_crawl_stops_at_known_pages(self):
+        self.page_last = 20
+        self.create_known_real_estates(range(3, 21))
+
+        with self.settings(ISC_CRAWLER_MAX_WORKERS=1):
+            self.crawl(incremental=True)
+
+        self.assertEqual(len(self.requested_urls), 4)
+        self.assertIn("ordenacao=mais-recentes", self.requested_urls[0])
+        self.assertEqual(self.search_obj.query_status, Search.QueryStatus.FINISHED)
+        self.assertEqual(self.search_obj.number_real_estate_found, 40)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 4
+        )
+
+    def test_incremental_crawl_does_not_duplicate_results(self):
+        self.create_known_real_estates(range(1, 4))
+
+        self.crawl()
+        self.crawl(incremental=True)
+
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 6
+        )
+
+    def test_changed_real_estate_is_not_known(self):
+        self.create_known_real_estates([1])
+        page = build_result_page(1, 1, ["P1-A", "P1-B"])
+        page_content = WebsiteISCPageContent(
+            real_estate_list=WebcrawlerISCRealEstate().extract_info(page),
+            total=2,
+            page=1,
+            total_pages=1,
+        )
+
+        self.assertTrue(is_known_page(page_content))
+
+        # crawled before with another price
+        re_object = RealEstate.objects.get(reference_code="P1-B")
+        re_object.price = 10.0
+        re_object.content_hash = re_object.get_content_hash()
+        re_object.save()
+        self.assertFalse(is_known_page(page_content))
+
+
+def build_real_estate_info(
+    code: str, agency_url: str = "https://www.imoveis-sc.com.br/imobiliaria/a"
+) -> WebsiteISCRealEstateInfo:
+    return WebsiteISCRealEstateInfo(
+        code=code,
+        model="Apartamento",
+        neighborhood="Centro",
+        city="Blumenau",
+        summary="",
+        url=f"https://www.imoveis-sc.com.br/blumenau/comprar/apartamento/centro/{code}",
+        bedrooms="2",
+        suite="1",
+        garage_slots="1",
+        space="75",
+        price="450.000,00",
+        agency=WebsiteISCAgencyInfo("Agency", agency_url, "https://cdn/logo.png"),
+        thumb_urls=[],
+    )
+
+
+class TestStoreRealEstatePage(TestCase):
+
+    def setUp(self):
+        agency_cache.clear()
+        # built once per process, not for every page
+        clear_radar_percolator()
+        get_radar_percolator()
+        self.search_obj = SearchFactory()
+
+    def tearDown(self):
+        clear_radar_percolator()
+
+    def store(self, codes: list, agency_urls: list) -> list:
+        real_estate_list = [
+            build_real_estate_info(code, agency_urls[i % len(agency_urls)])
+            for i, code in enumerate(codes)
+        ]
+        return store_real_estate_page(self.search_obj, real_estate_list)
+
+    def test_page_is_stored_with_fixed_number_of_queries(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.store(["A1", "A2"], ["https://agency/a"])
+        with CaptureQueriesContext(connection) as large_page:
+            codes = self.store(
+                [f"B{i}" for i in range(20)], ["https://agency/b", "https://agency/c"]
+            )
+
+        self.assertEqual(len(large_page.captured_queries), len(small_page))
+        self.assertEqual(codes, [f"B{i}" for i in range(20)])
+        self.assertEqual(RealEstate.objects.count(), 22)
+        self.assertEqual(Agency.objects.count(), 3)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 22
+        )
+
+        real_estate = RealEstate.objects.get(reference_code="B0")
+        self.assertEqual(real_estate.price, 450000.0)
+        self.assertEqual(real_estate.property_type, RealEstate.PropertyType.APARTMENT)
+        self.assertEqual(real_estate.agency.profile_url, "https://agency/b")
+
+    def test_stored_page_is_not_duplicated(self):
+        RealEstateFactory(reference_code="A1")
+
+        self.store(["A1", "A2", "A2"], ["https://agency/a"])
+        codes = self.store(["A1", "A2", "A3"], ["https://agency/a"])
+
+        self.assertEqual(codes, ["A1", "A2", "A3"])
+        self.assertEqual(RealEstate.objects.count(), 3)
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 3
+        )
+
+    def test_unchanged_real_estate_is_not_written(self):
+        self.store(["A1", "A2"], ["https://agency/a"])
+
+        with CaptureQueriesContext(connection) as page_queries:
+            self.store(["A1", "A2"], ["https://agency/a"])
+
+        real_estate_writes = [
+            query
+            for query in page_queries.captured_queries
+            if query["sql"].startswith('UPDATE "real_estate_realestate"')
+        ]
+        self.assertEqual(real_estate_writes, [])
+        self.assertEqual(RealEstateUpdate.objects.count(), 0)
+
+    def test_price_change_is_recorded(self):
+        self.store(["A1", "A2"], ["https://agency/a"])
+        real_estate = RealEstate.objects.get(reference_code="A1")
+
+        real_estate_list = [build_real_estate_info("A1"), build_real_estate_info("A2")]
+        real_estate_list[0].price = "420.000,00"
+        store_real_estate_page(self.search_obj, real_estate_list)
+
+        real_estate.refresh_from_db()
+        self.assertEqual(real_estate.price, 420000.0)
+        self.assertGreater(real_estate.updated_at, real_estate.created_at)
+
+        re_update = RealEstateUpdate.objects.get()
+        self.assertEqual(re_update.real_estate_id, real_estate.id)
+        self.assertEqual(re_update.update, [RealEstateUpdate.Update.PRICE])
+        self.assertEqual(re_update.old_price, 450000.0)
+        self.assertEqual(re_update.new_price, 420000.0)
+
+    def test_known_agencies_are_resolved_from_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store(["A1", "A2"], ["https://agency/a", "https://agency/b"])
+
+        with CaptureQueriesContext(connection) as page_queries:
+            self.store(["A3", "A4", "A5"], ["https://agency/a", "https://agency/b"])
+
+        agency_queries = [
+            query
+            for query in page_queries.captured_queries
+            if "real_estate_agency_agency" in query["sql"]
+        ]
+        self.assertEqual(agency_queries, [])
+        self.assertEqual(agency_cache.hits, 2)
+        self.assertEqual(
+            RealEstate.objects.filter(agency__profile_url="https://agency/a").count(), 3
+        )
+
+    def test_new_real_estates_are_added_to_matching_radars(self):
+        radar = RadarFactory(
+            search__filter__neighborhood=["centro"],
+            search__filter__bedroom_quantity=[2],
+            search__filter__max_price=500000.0,
+        )
+        RealEstateFactory(reference_code="A1")
+        clear_radar_percolator()
+
+        self.store(["A1", "A2"], ["https://agency/a"])
+
+        codes = RadarRealEstate.objects.filter(radar=radar).values_list(
+            "real_estate__reference_code", flat=True
+        )
+        self.assertEqual(list(codes), ["A2"])
+
+    def test_agency_stored_by_another_crawl_is_reused(self):
+        build_agency = build_agency_object
+
+        def store_agency_first(real_estate_info):
+            # another crawl stores the agency after this one looked it up
+            Agency.objects.create(
+                name="Other crawl", profile_url=real_estate_info.agency.profile_url
+            )
+            return build_agency(real_estate_info)
+
+        with patch("search.task.build_agency_object", side_effect=store_agency_first):
+            codes = self.store(["A1", "A2"], ["https://agency/a"])
+
+        self.assertEqual(codes, ["A1", "A2"])
+        agency_obj = Agency.objects.get(profile_url="https://agency/a")
+        self.assertEqual(agency_obj.name, "Other crawl")
+        self.assertEqual(RealEstate.objects.filter(agency=agency_obj).count(), 2)
+
+    def test_real_estate_stored_by_another_crawl_is_linked(self):
+        build_real_estate = build_real_estate_object
+        stored_by_other_crawl = {}
+
+        def store_real_estate_first(real_estate_info, agency_id):
+            # another crawl stores the real estate after this one looked it up
+            if real_estate_info.code == "A1":
+                stored_by_other_crawl["A1"] = RealEstateFactory(reference_code="A1")
+            return build_real_estate(real_estate_info, agency_id)
+
+        with patch(
+            "search.task.build_real_estate_object", side_effect=store_real_estate_first
+        ):
+            codes = self.store(["A1", "A2"], ["https://agency/a"])
+
+        self.assertEqual(codes, ["A1", "A2"])
+        self.assertEqual(RealEstate.objects.count(), 2)
+        linked_ids = SearchResultRealEstate.objects.filter(
+            search=self.search_obj, real_estate__reference_code="A1"
+        ).values_list("real_estate_id", flat=True)
+        self.assertEqual(list(linked_ids), [stored_by_other_crawl["A1"].id])
+
+    def test_rolled_back_agencies_are_not_cached(self):
+        self.store(["A1"], ["https://agency/a"])
+
+        self.assertEqual(agency_cache.get_many(["https://agency/a"]), {})
+
+    def test_invalid_real_estate_does_not_drop_page(self):
+        real_estate_list = [build_real_estate_info(f"A{i}") for i in range(3)]
+        # longer than the column, the bulk insert fails
+        real_estate_list[1].neighborhood = "x" * 200
+        real_estate_list[2].agency = None
+
+        codes = store_real_estate_page(self.search_obj, real_estate_list)
+
+        self.assertEqual(codes, ["A0"])
+        self.assertEqual(
+            SearchResultRealEstate.objects.filter(search=self.search_obj).count(), 1
+        )
+
+
+class TestAgencyCache(SimpleTestCase):
+
+    def test_least_recently_used_agency_is_evicted(self):
+        cache = AgencyCache(max_size=2)
+        cache.set_many({"a": 1, "b": 2})
+        cache.get_many(["a"])
+        cache.set_many({"c": 3})
+
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": 1, "c": 3})
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+
+
+class TestRateLimitConnection(TransactionTestCase):
+
+    def test_bucket_is_not_locked_while_page_is_written(self):
+        bucket = PostgresTokenBucket(
+            "example.com", rate_limit_connection, 3.0, 0.5, 10.0
+        )
+
+        with transaction.atomic():
+            self.assertEqual(bucket.take(burst=2), 0.0)
+
+            # another crawler takes a token before the page commits
+            with rate_limit_connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT tokens FROM search_crawlerratelimit "
+                    "WHERE host = %s FOR UPDATE NOWAIT",
+                    ["example.com"],
+                )
+                self.assertIsNotNone(cursor.fetchone())
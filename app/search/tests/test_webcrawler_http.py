@@ -0,0 +1,483 @@
+import gzip
+import os
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+
+from search.models import CrawlerRateLimit
+from search.webcrawler_http import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    FetchStatus,
+    HTTPCache,
+    HTTPSessionFactory,
+    LocalTokenBucket,
+    PostgresTokenBucket,
+    circuit_breakers,
+    fetch,
+    get_backoff,
+    get_circuit_breaker,
+    get_rate_limiter,
+    http_get,
+    parse_retry_after,
+    rate_limiters,
+)
+
+URL = "https://www.imoveis-sc.com.br/blumenau/comprar/apartamento?page=2"
+
+
+def build_response(status_code: int = 200, text: str = "", headers: dict = None):
+    response = Mock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    return response
+
+
+class TestHTTPCache(SimpleTestCase):
+
+    def setUp(self):
+        for registry in [rate_limiters, circuit_breakers]:
+            registry_patch = patch.dict(registry, clear=True)
+            registry_patch.start()
+            self.addCleanup(registry_patch.stop)
+
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.http_cache = HTTPCache(directory=self.cache_dir.name, ttl=60)
+
+    def test_miss_stores_response(self):
+        session = Mock()
+        session.get.return_value = build_response(
+            text="<html>page 2</html>", headers={"etag": '"v1"'}
+        )
+
+        body = http_get(session, URL, {}, http_cache=self.http_cache)
+
+        self.assertEqual(body, "<html>page 2</html>")
+        entry = self.http_cache.get(URL)
+        self.assertEqual(entry.body, "<html>page 2</html>")
+        self.assertEqual(entry.etag, '"v1"')
+
+        stats = self.http_cache.stats.as_dict()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["stores"], 1)
+
+    def test_fresh_hit_does_not_request(self):
+        self.http_cache.store(URL, "<html>cached</html>", None, None)
+        session = Mock()
+
+        body = http_get(session, URL, {}, http_cache=self.http_cache)
+
+        self.assertEqual(body, "<html>cached</html>")
+        session.get.assert_not_called()
+
+        stats = self.http_cache.stats.as_dict()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["hit_rate"], 1.0)
+        self.assertEqual(stats["bytes_saved"], len("<html>cached</html>"))
+
+    def test_stale_entry_is_revalidated(self):
+        entry = self.http_cache.store(
+            URL, "<html>cached</html>", '"v1"', "Mon, 01 Sep 2025 10:00:00 GMT"
+        )
+        entry.stored_at = time.time() - 120
+        self.http_cache.write_meta(entry)
+
+        session = Mock()
+        session.get.return_value = build_response(status_code=304)
+
+        body = http_get(session, URL, {"accept": "*/*"}, http_cache=self.http_cache)
+
+        self.assertEqual(body, "<html>cached</html>")
+        request_headers = session.get.call_args.kwargs["headers"]
+        self.assertEqual(request_headers["if-none-match"], '"v1"')
+        self.assertEqual(
+            request_headers["if-modified-since"], "Mon, 01 Sep 2025 10:00:00 GMT"
+        )
+        self.assertEqual(request_headers["accept"], "*/*")
+        self.assertTrue(self.http_cache.is_fresh(self.http_cache.get(URL)))
+        self.assertEqual(self.http_cache.stats.as_dict()["revalidations"], 1)
+
+    def test_stale_entry_is_replaced(self):
+        entry = self.http_cache.store(URL, "<html>old</html>", '"v1"', None)
+        entry.stored_at = time.time() - 120
+        self.http_cache.write_meta(entry)
+
+        session = Mock()
+        session.get.return_value = build_response(
+            text="<html>new</html>", headers={"etag": '"v2"'}
+        )
+
+        body = http_get(session, URL, {}, http_cache=self.http_cache)
+
+        self.assertEqual(body, "<html>new</html>")
+        self.assertEqual(self.http_cache.get(URL).etag, '"v2"')
+
+    def test_failed_request_is_not_stored(self):
+        session = Mock()
+        session.get.return_value = build_response(status_code=500, text="error")
+
+        result = fetch(session, URL, {}, http_cache=self.http_cache, retries=0)
+
+        self.assertIsNone(result.body)
+        self.assertIsNone(self.http_cache.get(URL))
+
+    def test_no_store_response_is_not_stored(self):
+        session = Mock()
+        session.get.return_value = build_response(
+            text="<html>private</html>", headers={"cache-control": "no-store"}
+        )
+
+        body = http_get(session, URL, {}, http_cache=self.http_cache)
+
+        self.assertEqual(body, "<html>private</html>")
+        self.assertIsNone(self.http_cache.get(URL))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # random hex bodies compress poorly, each entry takes ~2.3KB on disk
+        bodies = {f"{URL}&n={n}": os.urandom(2048).hex() for n in range(3)}
+        http_cache = HTTPCache(directory=self.cache_dir.name, max_size=6 * 1024)
+
+        urls = list(bodies)
+        for n, url in enumerate(urls[:2]):
+            http_cache.store(url, bodies[url], None, None)
+            body_path, _ = http_cache.get_paths(url)
+            os.utime(body_path, (n, n))
+
+        # the first entry becomes the most recently used one
+        http_cache.get(urls[0])
+        http_cache.store(urls[2], bodies[urls[2]], None, None)
+
+        self.assertIsNotNone(http_cache.get(urls[0]))
+        self.assertIsNone(http_cache.get(urls[1]))
+        self.assertIsNotNone(http_cache.get(urls[2]))
+        self.assertEqual(http_cache.stats.as_dict()["evictions"], 1)
+
+    def test_http_get_without_cache(self):
+        session = Mock()
+        session.get.return_value = build_response(text="<html>page</html>")
+
+        self.assertEqual(http_get(session, URL, {}), "<html>page</html>")
+
+        session.get.return_value = build_response(status_code=404)
+        self.assertIsNone(http_get(session, URL, {}))
+
+
+class TestRateLimiter(SimpleTestCase):
+
+    def setUp(self):
+        for registry in [rate_limiters, circuit_breakers]:
+            registry_patch = patch.dict(registry, clear=True)
+            registry_patch.start()
+            self.addCleanup(registry_patch.stop)
+
+    def test_token_bucket_waits_for_refill(self):
+        bucket = LocalTokenBucket(rate=2.0, min_rate=0.5, max_rate=10.0)
+
+        self.assertEqual(bucket.take(burst=1), 0.0)
+        wait = bucket.take(burst=1)
+        self.assertGreater(wait, 0.4)
+        self.assertLessEqual(wait, 0.5)
+
+    def test_rate_increases_on_fast_responses(self):
+        bucket = LocalTokenBucket(rate=2.0, min_rate=0.5, max_rate=2.5)
+        rate_limiter = AdaptiveRateLimiter(bucket, increase=0.2)
+
+        rate_limiter.record_response(200, 0.1)
+        self.assertAlmostEqual(bucket.get_rate(), 2.2)
+
+        for _ in range(5):
+            rate_limiter.record_response(200, 0.1)
+        self.assertEqual(bucket.get_rate(), 2.5)
+
+    def test_rate_decreases_on_errors_and_slow_responses(self):
+        bucket = LocalTokenBucket(rate=4.0, min_rate=0.5, max_rate=10.0)
+        rate_limiter = AdaptiveRateLimiter(bucket)
+
+        rate_limiter.record_response(503, 0.1)
+        self.assertEqual(bucket.get_rate(), 2.0)
+
+        # a burst of errors from requests already in flight counts once
+        rate_limiter.record_response(429, 0.1)
+        self.assertEqual(bucket.get_rate(), 2.0)
+
+        rate_limiter.last_decrease = 0.0
+        rate_limiter.record_response(200, 5.0)
+        self.assertEqual(bucket.get_rate(), 1.0)
+
+    def test_latency_spike_decreases_rate(self):
+        bucket = LocalTokenBucket(rate=4.0, min_rate=0.5, max_rate=4.0)
+        rate_limiter = AdaptiveRateLimiter(bucket)
+
+        for _ in range(5):
+            rate_limiter.record_response(200, 0.2)
+        self.assertEqual(bucket.get_rate(), 4.0)
+
+        rate_limiter.record_response(200, 1.5)
+        self.assertEqual(bucket.get_rate(), 2.0)
+
+    def test_retry_after_blocks_requests(self):
+        bucket = LocalTokenBucket(rate=10.0, min_rate=0.5, max_rate=10.0)
+        rate_limiter = AdaptiveRateLimiter(bucket)
+
+        rate_limiter.record_response(429, 0.1, "30")
+
+        wait = bucket.take(burst=2)
+        self.assertGreater(wait, 29)
+        self.assertLessEqual(wait, 30)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_rate_limiter_is_shared_per_host(self):
+        self.assertIs(
+            get_rate_limiter("www.imoveis-sc.com.br"),
+            get_rate_limiter("www.imoveis-sc.com.br"),
+        )
+        self.assertIsNot(
+            get_rate_limiter("www.imoveis-sc.com.br"),
+            get_rate_limiter("example.com"),
+        )
+
+    def test_fetch_reports_response_to_rate_limiter(self):
+        session = Mock()
+        session.get.return_value = build_response(
+            status_code=429, headers={"retry-after": "10"}
+        )
+
+        self.assertIsNone(fetch(session, URL, {}, retries=0).body)
+
+        wait = get_rate_limiter("www.imoveis-sc.com.br").bucket.take(burst=2)
+        self.assertGreater(wait, 9)
+
+
+class TestFetchRetries(SimpleTestCase):
+
+    def setUp(self):
+        registry_patch = patch.dict(circuit_breakers, clear=True)
+        registry_patch.start()
+        self.addCleanup(registry_patch.stop)
+
+        # requests are not rate limited and retried without waiting
+        for target in ["get_rate_limiter", "time.sleep"]:
+            target_patch = patch(f"search.webcrawler_http.{target}")
+            target_patch.start()
+            self.addCleanup(target_patch.stop)
+
+    def test_fetched_on_first_attempt(self):
+        session = Mock()
+        session.get.return_value = build_response(text="<html>page</html>")
+
+        result = fetch(session, URL, {})
+
+        self.assertEqual(result.body, "<html>page</html>")
+        self.assertEqual(result.status, FetchStatus.FETCHED)
+        self.assertEqual(result.attempts, 1)
+
+    def test_retried_after_timeout_and_server_error(self):
+        session = Mock()
+        session.get.side_effect = [
+            Exception("timeout"),
+            build_response(status_code=503),
+            build_response(text="<html>page</html>"),
+        ]
+
+        result = fetch(session, URL, {}, retries=3)
+
+        self.assertEqual(result.body, "<html>page</html>")
+        self.assertEqual(result.status, FetchStatus.RETRIED)
+        self.assertEqual(result.attempts, 3)
+
+    def test_failed_after_retries(self):
+        session = Mock()
+        session.get.return_value = build_response(status_code=503)
+
+        result = fetch(session, URL, {}, retries=2)
+
+        self.assertIsNone(result.body)
+        self.assertEqual(result.status, FetchStatus.FAILED)
+        self.assertEqual(result.attempts, 3)
+        self.assertEqual(session.get.call_count, 3)
+
+    def test_client_error_is_not_retried(self):
+        session = Mock()
+        session.get.return_value = build_response(status_code=404)
+
+        result = fetch(session, URL, {}, retries=3)
+
+        self.assertEqual(result.status, FetchStatus.FAILED)
+        self.assertEqual(session.get.call_count, 1)
+
+    def test_backoff_grows_exponentially_up_to_max(self):
+        with patch("search.webcrawler_http.random.uniform", side_effect=max):
+            self.assertEqual(get_backoff(1), 0.5)
+            self.assertEqual(get_backoff(3), 2.0)
+            self.assertEqual(get_backoff(10), 10.0)
+
+    def test_open_circuit_fails_fast(self):
+        session = Mock()
+        session.get.side_effect = Exception("connection refused")
+
+        result = fetch(session, URL, {}, retries=9)
+
+        # the fifth failure opens the circuit, no more requests are sent
+        self.assertEqual(session.get.call_count, 5)
+        self.assertEqual(result.status, FetchStatus.FAILED)
+        self.assertIn("circuit open", result.error)
+
+        result = fetch(session, URL, {}, retries=9)
+        self.assertEqual(session.get.call_count, 5)
+        self.assertEqual(result.attempts, 1)
+
+
+class TestCircuitBreaker(SimpleTestCase):
+
+    def test_half_open_after_reset(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.allow_request())
+
+        circuit_breaker.opened_at -= 30
+        # one trial request at a time
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertFalse(circuit_breaker.allow_request())
+
+        circuit_breaker.record_success()
+        self.assertEqual(circuit_breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(circuit_breaker.allow_request())
+
+    def test_failed_trial_opens_circuit_again(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+
+        circuit_breaker.record_failure()
+        circuit_breaker.opened_at -= 30
+        self.assertTrue(circuit_breaker.allow_request())
+
+        circuit_breaker.record_failure()
+        self.assertEqual(circuit_breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+    def test_circuit_breaker_is_shared_per_host(self):
+        with patch.dict(circuit_breakers, clear=True):
+            self.assertIs(
+                get_circuit_breaker("www.imoveis-sc.com.br"),
+                get_circuit_breaker("www.imoveis-sc.com.br"),
+            )
+
+
+class GzipPageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = gzip.compress(b"<html>" + b"page " * 1000 + b"</html>")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPSessionFactory(SimpleTestCase):
+
+    def setUp(self):
+        self.session_factory = HTTPSessionFactory(pool_size=4)
+
+    def test_session_per_thread_with_shared_pool(self):
+        session = self.session_factory.get_session()
+        self.assertIs(self.session_factory.get_session(), session)
+
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(self.session_factory.get_session())
+        )
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(sessions[0], session)
+        self.assertIs(
+            sessions[0].get_adapter("https://www.imoveis-sc.com.br"),
+            session.get_adapter("https://www.imoveis-sc.com.br"),
+        )
+
+    def test_session_asks_for_compression(self):
+        session = self.session_factory.get_session()
+
+        self.assertIn("gzip", session.headers["accept-encoding"])
+
+    def test_connections_are_reused(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), GzipPageHandler)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        for _ in range(5):
+            response = self.session_factory.get_session().get(url)
+            self.assertTrue(response.text.startswith("<html>page"))
+
+        stats = self.session_factory.get_stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["connection_reuse_rate"], 0.8)
+        self.assertGreater(stats["bytes_decoded"], stats["bytes_received"])
+        self.assertGreater(stats["compression_ratio"], 1)
+
+
+@contextmanager
+def rate_limit_connection():
+    with transaction.atomic():
+        yield connection
+
+
+class TestPostgresTokenBucket(TestCase):
+
+    def test_bucket_is_created_once(self):
+        PostgresTokenBucket("example.com", rate_limit_connection, 3.0, 0.5, 10.0)
+        bucket = PostgresTokenBucket(
+            "example.com", rate_limit_connection, 5.0, 0.5, 10.0
+        )
+
+        self.assertEqual(CrawlerRateLimit.objects.count(), 1)
+        self.assertEqual(bucket.get_rate(), 3.0)
+
+    def test_tokens_are_shared_between_buckets(self):
+        bucket_1 = PostgresTokenBucket(
+            "example.com", rate_limit_connection, 1.0, 0.5, 10.0
+        )
+        bucket_2 = PostgresTokenBucket(
+            "example.com", rate_limit_connection, 1.0, 0.5, 10.0
+        )
+
+        self.assertEqual(bucket_1.take(burst=1), 0.0)
+        self.assertGreater(bucket_2.take(burst=1), 0.9)
+
+    def test_adjust_rate_and_block(self):
+        bucket = PostgresTokenBucket(
+            "example.com", rate_limit_connection, 4.0, 1.0, 10.0
+        )
+
+        bucket.adjust(0.5, 0.0)
+        self.assertEqual(bucket.get_rate(), 2.0)
+
+        bucket.adjust(0.1, 0.0, block_seconds=20)
+        self.assertEqual(bucket.get_rate(), 1.0)
+        self.assertGreater(bucket.take(burst=2), 19)
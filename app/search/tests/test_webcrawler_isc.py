@@ -1,6 +1,26 @@
+import os
+
+from unittest.mock import patch
+
+from bs4 import BeautifulSoup
+
 from django.test import SimpleTestCase
 
-from search.webcrawler_isc import WebsiteISCFilter, WebcrawlerISCRealEstate
+from search.webcrawler_http import FetchResult, FetchStatus
+from search.webcrawler_isc import (
+    WebsiteISCFilter,
+    WebsiteISCOrder,
+    WebcrawlerISCRealEstate,
+    WebsiteISCParser,
+    lxml_html,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as fixture:
+        return fixture.read()
 
 
 class TestWebCrawlerISC(SimpleTestCase):
@@ -46,3 +66,443 @@ class TestWebCrawlerISC(SimpleTestCase):
 
         expected_url = "https://www.imoveis-sc.com.br/blumenau/comprar+alugar/apartamento+casa+terreno/agua-verde_bom-retiro_centro_fidelis/quartos/3,4,5+?valor=500000-1200000&area=35-95&suites=1%2C4%2C5%2B&vagas=1%2C4%2C5%2B"
         self.assertEqual(crawler.url, expected_url)
+
+    def test_url_generation_newest_first(self):
+        isc_filter = WebsiteISCFilter(
+            property_type=["apartamento"],
+            transaction_type=["comprar"],
+            city="blumenau",
+            neighborhood=["centro"],
+            bedroom_quantity=["1"],
+            suite_quantity=["1"],
+            garage_slots_quantity=["1"],
+            min_price=500000,
+            max_price=600000,
+            min_area=35,
+            max_area=85,
+            order=WebsiteISCOrder.NEWEST,
+        )
+
+        crawler = WebcrawlerISCRealEstate()
+        crawler.set_filter(isc_filter)
+
+        expected_url = (
+            "https://www.imoveis-sc.com.br/blumenau/comprar/apartamento/centro/quartos/1"
+            "?valor=500000-600000&area=35-85&suites=1&vagas=1&ordenacao=mais-recentes"
+        )
+        self.assertEqual(crawler.url, expected_url)
+
+
+def build_result_page(page: int, page_last: int, codes: list) -> str:
+    articles = ""
+    for code in codes:
+        articles += f"""
+        <article class="imovel">
+            <div class="imovel-data">
+                <meta itemprop="sku" content="{code}">
+            </div>
+        </article>
+        """
+
+    return f"""
+    <html><body>
+        <div class="header-data"><span class="lista-imovel-count">{page_last * 2}</span></div>
+        {articles}
+        <div class="navigation">Página {page} de {page_last}</div>
+    </body></html>
+    """
+
+
+class TestWebCrawlerISCConcurrentPages(SimpleTestCase):
+
+    def setUp(self):
+        isc_filter = WebsiteISCFilter(
+            property_type=["apartamento"],
+            transaction_type=["comprar"],
+            city="blumenau",
+            neighborhood=["centro"],
+            bedroom_quantity=["1"],
+            suite_quantity=["1"],
+            garage_slots_quantity=["1"],
+            min_price=500000,
+            max_price=600000,
+            min_area=35,
+            max_area=85,
+        )
+        self.isc_filter = isc_filter
+        self.requested_pages = []
+        self.failed_pages = []
+
+    def fake_make_request(self, page=None):
+        self.requested_pages.append(page)
+        if page in self.failed_pages:
+            return FetchResult(None, FetchStatus.FAILED, 4, "503")
+
+        body = build_result_page(page, 6, [f"P{page}-A", f"P{page}-B"])
+        return FetchResult(body, FetchStatus.FETCHED, 1)
+
+    def test_concurrent_crawl_yields_pages_in_order(self):
+        crawler = WebcrawlerISCRealEstate(max_workers=4)
+        crawler.set_filter(self.isc_filter)
+        crawler.make_request = self.fake_make_request
+
+        page_contents = list(crawler.crawl())
+
+        self.assertEqual([pc.page for pc in page_contents], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(sorted(self.requested_pages), [1, 2, 3, 4, 5, 6])
+        for page_content in page_contents:
+            self.assertEqual(page_content.total, 12)
+            self.assertEqual(page_content.total_pages, 6)
+            self.assertEqual(
+                [re.code for re in page_content.real_estate_list],
+                [f"P{page_content.page}-A", f"P{page_content.page}-B"],
+            )
+
+    def test_resumed_crawl_starts_at_page(self):
+        for max_workers, shard_pages in [(1, 0), (4, 0), (4, 10)]:
+            self.requested_pages = []
+            crawler = WebcrawlerISCRealEstate(
+                max_workers=max_workers, shard_pages=shard_pages
+            )
+            crawler.set_filter(self.isc_filter)
+            crawler.make_request = self.fake_make_request
+
+            page_contents = list(crawler.crawl(start_page=4))
+
+            self.assertEqual([pc.page for pc in page_contents], [4, 5, 6])
+            self.assertEqual(sorted(self.requested_pages), [4, 5, 6])
+            self.assertEqual(page_contents[0].total_pages, 6)
+
+    def test_crawl_stops_at_end_page(self):
+        for max_workers, start_page in [(1, 1), (4, 1), (4, 3)]:
+            self.requested_pages = []
+            crawler = WebcrawlerISCRealEstate(max_workers=max_workers)
+            crawler.set_filter(self.isc_filter)
+            crawler.make_request = self.fake_make_request
+
+            page_contents = list(
+                crawler.crawl(start_page=start_page, end_page=start_page + 1)
+            )
+
+            self.assertEqual(
+                [pc.page for pc in page_contents], [start_page, start_page + 1]
+            )
+            self.assertEqual(sorted(self.requested_pages), [start_page, start_page + 1])
+
+        crawler.make_request = self.fake_make_request
+        page_contents = list(crawler.crawl(start_page=5, end_page=10))
+        self.assertEqual([pc.page for pc in page_contents], [5, 6])
+
+    def test_concurrent_crawl_stops_requesting_when_consumer_stops(self):
+        crawler = WebcrawlerISCRealEstate(max_workers=2)
+        crawler.set_filter(self.isc_filter)
+        crawler.make_request = self.fake_make_request
+
+        crawl_generator = crawler.crawl()
+        next(crawl_generator)
+        next(crawl_generator)
+        crawl_generator.close()
+
+        # page 1, page 2 and at most max_workers pages ahead
+        self.assertLessEqual(len(self.requested_pages), 4)
+
+    def test_failed_page_is_skipped(self):
+        for max_workers in [1, 4]:
+            crawler = WebcrawlerISCRealEstate(max_workers=max_workers)
+            crawler.set_filter(self.isc_filter)
+            crawler.make_request = self.fake_make_request
+            self.failed_pages = [3]
+
+            page_contents = list(crawler.crawl())
+
+            self.assertEqual([pc.page for pc in page_contents], [1, 2, 3, 4, 5, 6])
+            failed_page = page_contents[2]
+            self.assertEqual(failed_page.fetch_status, FetchStatus.FAILED)
+            self.assertEqual(failed_page.fetch_attempts, 4)
+            self.assertEqual(failed_page.real_estate_list, [])
+            self.assertEqual(failed_page.total_pages, 6)
+            self.assertEqual(page_contents[3].fetch_status, FetchStatus.FETCHED)
+
+    def test_incremental_crawl_stops_after_known_pages(self):
+        known_pages = [2, 4, 5, 6]
+        for max_workers in [1, 4]:
+            crawler = WebcrawlerISCRealEstate(max_workers=max_workers)
+            crawler.set_filter(self.isc_filter)
+            crawler.make_request = self.fake_make_request
+            self.requested_pages = []
+
+            page_contents = list(
+                crawler.crawl(
+                    is_known_page=lambda pc: pc.page in known_pages,
+                    known_pages_to_stop=2,
+                )
+            )
+
+            # page 2 alone does not stop the crawl, pages 4 and 5 do
+            self.assertEqual([pc.page for pc in page_contents], [1, 2, 3, 4, 5])
+            self.assertLessEqual(len(self.requested_pages), 6)
+
+    def test_incremental_crawl_does_not_count_failed_pages(self):
+        crawler = WebcrawlerISCRealEstate()
+        crawler.set_filter(self.isc_filter)
+        crawler.make_request = self.fake_make_request
+        self.failed_pages = [3]
+
+        page_contents = list(
+            crawler.crawl(is_known_page=lambda pc: True, known_pages_to_stop=2)
+        )
+
+        self.assertEqual([pc.page for pc in page_contents], [1, 2])
+
+        page_contents = list(
+            crawler.crawl(is_known_page=lambda pc: pc.page > 1, known_pages_to_stop=2)
+        )
+
+        self.assertEqual([pc.page for pc in page_contents], [1, 2, 3, 4, 5])
+
+    def test_failed_first_page_stops_crawl(self):
+        for max_workers in [1, 4]:
+            crawler = WebcrawlerISCRealEstate(max_workers=max_workers)
+            crawler.set_filter(self.isc_filter)
+            crawler.make_request = self.fake_make_request
+            self.failed_pages = [1]
+
+            page_contents = list(crawler.crawl())
+
+            self.assertEqual(len(page_contents), 1)
+            self.assertEqual(page_contents[0].fetch_status, FetchStatus.FAILED)
+
+
+class TestWebCrawlerISCShardedCrawl(SimpleTestCase):
+
+    def setUp(self):
+        self.isc_filter = WebsiteISCFilter(
+            property_type=["apartamento"],
+            transaction_type=["comprar"],
+            city="blumenau",
+            neighborhood=["centro"],
+            bedroom_quantity=["1"],
+            suite_quantity=["1"],
+            garage_slots_quantity=["1"],
+            min_price=100000,
+            max_price=900000,
+            min_area=30,
+            max_area=200,
+        )
+        # most real estates are cheap, so some price ranges need a second split
+        self.catalog = [
+            (f"RE{i:04d}", 100000 + (i % 50) * 1000 if i < 400 else 100000 + i * 1000)
+            for i in range(600)
+        ]
+        self.page_size = 20
+        self.requested_pages = []
+
+    def fake_make_request(self, crawler, page=None):
+        page = page or crawler.page
+        codes = [
+            code
+            for code, price in self.catalog
+            if crawler.filter.min_price <= price <= crawler.filter.max_price
+        ]
+        page_last = max(1, -(-len(codes) // self.page_size))
+        self.requested_pages.append(
+            (crawler.filter.min_price, crawler.filter.max_price, page)
+        )
+
+        first_code = (page - 1) * self.page_size
+        last_code = page * self.page_size
+        page_codes = codes[first_code:last_code]
+        body = build_result_page(page, page_last, page_codes)
+        return FetchResult(body, FetchStatus.FETCHED, 1)
+
+    def test_split_by_price(self):
+        filters = self.isc_filter.split(4)
+
+        self.assertEqual(
+            [(f.min_price, f.max_price) for f in filters],
+            [(100000, 300000), (300000, 500000), (500000, 700000), (700000, 900000)],
+        )
+        for shard_filter in filters:
+            self.assertEqual(shard_filter.min_area, 30)
+            self.assertEqual(shard_filter.city, "blumenau")
+        self.assertEqual(self.isc_filter.min_price, 100000)
+
+    def test_split_by_area_when_price_is_narrow(self):
+        self.isc_filter.min_price = 500000
+        self.isc_filter.max_price = 500001
+
+        filters = self.isc_filter.split(2)
+
+        self.assertEqual(
+            [(f.min_area, f.max_area) for f in filters], [(30, 115), (115, 200)]
+        )
+        self.assertEqual(filters[0].min_price, 500000)
+
+    def test_split_not_possible(self):
+        self.isc_filter.min_price = self.isc_filter.max_price = 500000
+        self.isc_filter.min_area = self.isc_filter.max_area = 70
+
+        self.assertEqual(self.isc_filter.split(4), [self.isc_filter])
+
+    def test_sharded_crawl_yields_every_real_estate_once(self):
+        crawler = WebcrawlerISCRealEstate(max_workers=4, shard_pages=5)
+        crawler.set_filter(self.isc_filter)
+
+        with patch.object(
+            WebcrawlerISCRealEstate,
+            "make_request",
+            autospec=True,
+            side_effect=self.fake_make_request,
+        ):
+            page_contents = list(crawler.crawl())
+
+        codes = [re.code for pc in page_contents for re in pc.real_estate_list]
+        self.assertEqual(sorted(codes), sorted(code for code, _ in self.catalog))
+
+        self.assertEqual(
+            [pc.page for pc in page_contents], list(range(1, len(page_contents) + 1))
+        )
+        for page_content in page_contents:
+            self.assertEqual(page_content.total_pages, len(page_contents))
+
+        # the whole search has 30 pages, every shard has at most 5
+        shard_pages = [page for min_price, _, page in self.requested_pages]
+        self.assertEqual(max(shard_pages), 5)
+
+    def test_resumed_sharded_crawl_yields_remaining_pages(self):
+        crawler = WebcrawlerISCRealEstate(max_workers=4, shard_pages=5)
+        crawler.set_filter(self.isc_filter)
+
+        with patch.object(
+            WebcrawlerISCRealEstate,
+            "make_request",
+            autospec=True,
+            side_effect=self.fake_make_request,
+        ):
+            page_contents = list(crawler.crawl())
+            first_run_pages = [
+                request for request in self.requested_pages if request[2] > 1
+            ]
+            self.requested_pages = []
+
+            start_page = len(page_contents) - 5
+            resumed_page_contents = list(crawler.crawl(start_page=start_page))
+
+        self.assertEqual(
+            [pc.page for pc in resumed_page_contents],
+            list(range(start_page, len(page_contents) + 1)),
+        )
+        resumed_codes = [
+            re.code for pc in resumed_page_contents for re in pc.real_estate_list
+        ]
+        skipped_pages = start_page - 1
+        codes = [
+            re.code
+            for pc in page_contents[skipped_pages:]
+            for re in pc.real_estate_list
+        ]
+        self.assertEqual(resumed_codes, codes)
+        # the shards are planned again, but finished pages are not fetched
+        resume_request = (100000, 900000, start_page)
+        self.assertIn(resume_request, self.requested_pages)
+        next_pages = [
+            request
+            for request in self.requested_pages
+            if request[2] > 1 and request != resume_request
+        ]
+        self.assertEqual(len(next_pages), 6)
+        first_next_page = len(first_run_pages) - len(next_pages)
+        self.assertEqual(sorted(next_pages), sorted(first_run_pages[first_next_page:]))
+
+    def test_small_search_is_not_sharded(self):
+        self.catalog = self.catalog[:60]
+        crawler = WebcrawlerISCRealEstate(max_workers=4, shard_pages=5)
+        crawler.set_filter(self.isc_filter)
+
+        with patch.object(
+            WebcrawlerISCRealEstate,
+            "make_request",
+            autospec=True,
+            side_effect=self.fake_make_request,
+        ):
+            page_contents = list(crawler.crawl())
+
+        self.assertEqual([pc.page for pc in page_contents], [1, 2, 3])
+        self.assertEqual(len(self.requested_pages), 3)
+
+
+class TestWebCrawlerISCParser(SimpleTestCase):
+
+    def setUp(self):
+        self.page = load_fixture("isc_result_page.html")
+
+    def real_estate_to_dict(self, real_estate) -> dict:
+        real_estate_dict = dict(vars(real_estate))
+        if real_estate.agency is not None:
+            real_estate_dict["agency"] = vars(real_estate.agency)
+        return real_estate_dict
+
+    def test_single_pass_matches_legacy_parser(self):
+        legacy_crawler = WebcrawlerISCRealEstate(parser=WebsiteISCParser.LEGACY)
+        single_pass_crawler = WebcrawlerISCRealEstate(
+            parser=WebsiteISCParser.SINGLE_PASS
+        )
+
+        legacy_list = legacy_crawler.extract_info(self.page)
+        single_pass_list = single_pass_crawler.extract_info(self.page)
+
+        self.assertEqual(len(single_pass_list), 20)
+        self.assertEqual(
+            [self.real_estate_to_dict(re) for re in single_pass_list],
+            [self.real_estate_to_dict(re) for re in legacy_list],
+        )
+
+    def test_single_pass_fields(self):
+        crawler = WebcrawlerISCRealEstate()
+
+        real_estate_list = crawler.extract_info(self.page)
+
+        real_estate = real_estate_list[2]
+        self.assertEqual(real_estate.code, "AP1074")
+        self.assertEqual(real_estate.city, "Blumenau")
+        self.assertEqual(real_estate.neighborhood, "Velha")
+        self.assertEqual(real_estate.bedrooms, "1")
+        self.assertEqual(real_estate.suite, "")
+        self.assertEqual(real_estate.garage_slots, "3")
+        self.assertEqual(real_estate.space, "66,73")
+        self.assertEqual(real_estate.price, "607.645,00")
+        self.assertEqual(real_estate.agency.name, "Casa Nova Negócios Imobiliários")
+        self.assertEqual(len(real_estate.thumb_urls), 3)
+
+        # listing without neighborhood and listing without agency
+        self.assertEqual(real_estate_list[7].neighborhood, "")
+        self.assertIsNone(real_estate_list[11].agency)
+
+    def test_page_without_real_estate(self):
+        for parser in [WebsiteISCParser.LEGACY, WebsiteISCParser.SINGLE_PASS]:
+            crawler = WebcrawlerISCRealEstate(parser=parser)
+            self.assertIsNone(crawler.extract_info("<html><body></body></html>"))
+
+    def test_page_parsed_once_for_pagination_and_listings(self):
+        for parser in [WebsiteISCParser.LEGACY, WebsiteISCParser.SINGLE_PASS]:
+            crawler = WebcrawlerISCRealEstate(parser=parser)
+            crawler.page_last = -1
+            crawler.real_estate_count = -1
+
+            with patch(
+                "search.webcrawler_isc.WebsiteISCParsedPage.release", autospec=True
+            ) as patched_release, patch(
+                "search.webcrawler_isc.lxml_html.fromstring",
+                wraps=lxml_html.fromstring,
+            ) as patched_fromstring, patch(
+                "search.webcrawler_isc.BeautifulSoup", wraps=BeautifulSoup
+            ) as patched_soup:
+                page_content = crawler.build_page_content(
+                    1, FetchResult(self.page, FetchStatus.FETCHED, 1)
+                )
+
+            self.assertEqual(patched_fromstring.call_count + patched_soup.call_count, 1)
+            patched_release.assert_called_once()
+            self.assertEqual(page_content.total, 187)
+            self.assertEqual(page_content.total_pages, 10)
+            self.assertEqual(len(page_content.real_estate_list), 20)
@@ -8,15 +8,20 @@ from rest_framework.serializers import ModelSerializer
 
 from rest_framework_simplejwt import authentication
 
+from drf_spectacular.utils import extend_schema
+
 from search.models import Filter, Search
 from search.serializers import (
     SearchCreateSerializer,
     SearchRetrieveSerializer,
     SearchListSerializer,
+    SearchResultListParamsSerializer,
     SearchResultListSerializer,
 )
 from search import services
 
+from common.pagination.serializers import PaginationParamsSerializer
+
 from common.errors.errors import SerializationError, DeserializationError
 
 
@@ -72,21 +77,31 @@ class SearchView(
             print(f"Failed to serialize create search response. Error: {e.errors}")
             return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response(response, status=status.HTTP_201_CREATED)
+        # the crawl is queued, query status tells when results are found
+        return Response(response, status=status.HTTP_202_ACCEPTED)
 
-    # TODO - improve pagination - query ?page=2&limit=50
     # TODO - improve pagination with sorting ?sort=created_at or ?order=desc
 
+    @extend_schema(parameters=[PaginationParamsSerializer])
     def list(self, request: Request) -> Response:
-        # TODO - missing pagination handling
+        try:
+            query_params = services.deserialize_list_search_params(request.query_params)
+        except DeserializationError as e:
+            print(f"Failed to deserialize list search params. Error: {e.errors}")
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             search_queryset = services.list_search(request.user)
+            page = services.search_paginator.paginate(search_queryset, query_params)
+        except DeserializationError as e:
+            print(f"Failed to paginate list search. Error: {e.errors}")
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"Failed to list search. Error: {e}")
             return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         try:
-            response = services.serialize_list_search(search_queryset)
+            response = services.serialize_list_search(page)
         except SerializationError as e:
             print(f"Failed to serialize list search response. Error: {e.errors}")
             return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -129,16 +144,38 @@ class SearchResultView(
     def get_serializer_class(self):
         return SearchResultListSerializer
 
+    @extend_schema(parameters=[SearchResultListParamsSerializer])
     def list(self, request: Request, id: str) -> Response:
-        # TODO - missing pagination handling
         try:
-            search_queryset = services.list_search_result(id)
+            query_params = services.deserialize_list_search_result_params(
+                request.query_params
+            )
+        except DeserializationError as e:
+            print(
+                f"Failed to deserialize list search results params. Error: {e.errors}"
+            )
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # clients paging with the cursor alone are at the page it requests
+            position = query_params.get("position")
+            if position is None:
+                position = services.search_result_paginator.get_position(
+                    query_params
+                )
+            search_queryset = services.list_search_result(id, position)
+            page = services.search_result_paginator.paginate(
+                search_queryset, query_params
+            )
+        except DeserializationError as e:
+            print(f"Failed to paginate list search results. Error: {e.errors}")
+            return Response(e.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"Failed to list search results. Error: {e}")
             return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         try:
-            response = services.serialize_search_result(search_queryset)
+            response = services.serialize_search_result(page)
         except SerializationError as e:
             print(
                 f"Failed to serialize list search results response. Error: {e.errors}"
@@ -0,0 +1,299 @@
+"""
+Bulk load of crawled real estates with COPY, for crawls with thousands of
+listings. Rows are streamed from the crawler into a temporary staging table and
+merged into the real estate, agency and search result tables with a few set
+based queries.
+
+Shared by the Django task and the cloud function, it only needs a psycopg2
+cursor, so keep both copies of this file equal.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+# columns of a staging row, in order
+STAGING_COLUMNS = [
+    "reference_code",
+    "property_type",
+    "transaction_type",
+    "city",
+    "neighborhood",
+    "bedroom_quantity",
+    "suite_quantity",
+    "garage_slots_quantity",
+    "price",
+    "area",
+    "thumb_url",
+    "url",
+    "content_hash",
+    "agency_name",
+    "agency_logo_url",
+    "agency_profile_url",
+]
+
+CREATE_STAGING_TABLE_SQL = """
+    CREATE TEMPORARY TABLE isc_real_estate_staging (
+        reference_code text,
+        property_type text,
+        transaction_type text,
+        city text,
+        neighborhood text,
+        bedroom_quantity integer,
+        suite_quantity integer,
+        garage_slots_quantity integer,
+        price double precision,
+        area double precision,
+        thumb_url text[],
+        url text,
+        content_hash text,
+        agency_name text,
+        agency_logo_url text,
+        agency_profile_url text,
+        -- not copied, numbers the rows in the order they were crawled
+        position bigserial
+    ) ON COMMIT DROP
+"""
+
+COPY_STAGING_SQL = (
+    f"COPY isc_real_estate_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN"
+)
+
+# rows that do not fit the columns of the real tables are left out, instead of
+# failing the whole load
+VALID_STAGING_ROW_SQL = """
+    s.reference_code IS NOT NULL
+    AND char_length(s.reference_code) <= 50
+    AND char_length(s.city) <= 100
+    AND char_length(s.neighborhood) <= 100
+    AND char_length(s.url) <= 250
+    AND coalesce(array_length(s.thumb_url, 1), 0) <= 50
+    AND char_length(s.agency_profile_url) <= 500
+"""
+
+MERGE_AGENCIES_SQL = f"""
+    INSERT INTO real_estate_agency_agency (
+        id, name, logo_url, profile_url, creci, city,
+        address_street, address_number,
+        contact_number_1, contact_number_2, contact_whatsapp
+    )
+    SELECT DISTINCT ON (s.agency_profile_url)
+        gen_random_uuid(), left(s.agency_name, 100), left(s.agency_logo_url, 500),
+        s.agency_profile_url, '', '', '', '', '', '', ''
+    FROM   isc_real_estate_staging s
+    WHERE  {VALID_STAGING_ROW_SQL}
+    ORDER  BY s.agency_profile_url
+    ON CONFLICT (profile_url) DO NOTHING
+"""
+
+# price and availability changes of stored real estates, before they are updated
+MERGE_REAL_ESTATE_UPDATES_SQL = f"""
+    INSERT INTO real_estate_realestateupdate (
+        id, real_estate_id, update, created_at,
+        old_price, new_price, old_available, new_available
+    )
+    SELECT
+        gen_random_uuid(), r.id,
+        array_remove(
+            ARRAY[
+                CASE WHEN r.price <> s.price THEN 'price' END,
+                CASE WHEN NOT r.available THEN 'availability' END
+            ],
+            NULL
+        ),
+        now(),
+        CASE WHEN r.price <> s.price THEN r.price END,
+        CASE WHEN r.price <> s.price THEN s.price END,
+        CASE WHEN NOT r.available THEN r.available END,
+        CASE WHEN NOT r.available THEN true END
+    FROM   (
+        SELECT DISTINCT ON (s.reference_code) s.*
+        FROM   isc_real_estate_staging s
+        WHERE  {VALID_STAGING_ROW_SQL}
+        ORDER  BY s.reference_code
+    ) s
+    JOIN   real_estate_realestate r ON r.reference_code = s.reference_code
+    WHERE  s.content_hash <> ''
+    AND    r.content_hash <> s.content_hash
+    AND    (r.price <> s.price OR NOT r.available)
+"""
+
+MERGE_CHANGED_REAL_ESTATES_SQL = f"""
+    UPDATE real_estate_realestate r
+    SET    property_type = s.property_type,
+           transaction_type = s.transaction_type,
+           city = s.city,
+           neighborhood = s.neighborhood,
+           bedroom_quantity = s.bedroom_quantity,
+           suite_quantity = s.suite_quantity,
+           garage_slots_quantity = s.garage_slots_quantity,
+           price = s.price,
+           area = s.area,
+           area_total = s.area,
+           available = true,
+           thumb_url = s.thumb_url,
+           url = s.url,
+           content_hash = s.content_hash,
+           updated_at = now()
+    FROM   (
+        SELECT DISTINCT ON (s.reference_code) s.*
+        FROM   isc_real_estate_staging s
+        WHERE  {VALID_STAGING_ROW_SQL}
+        ORDER  BY s.reference_code
+    ) s
+    WHERE  r.reference_code = s.reference_code
+    AND    s.content_hash <> ''
+    AND    r.content_hash <> s.content_hash
+"""
+
+MERGE_NEW_REAL_ESTATES_SQL = f"""
+    INSERT INTO real_estate_realestate (
+        id, reference_code, property_type, transaction_type,
+        city, neighborhood,
+        bedroom_quantity, suite_quantity, bathroom_quantity,
+        garage_slots_quantity,
+        price, area, area_total, available,
+        agency_id, cond_price,
+        description, thumb_url, url, content_hash, created_at, updated_at
+    )
+    SELECT DISTINCT ON (s.reference_code)
+        gen_random_uuid(), s.reference_code, s.property_type, s.transaction_type,
+        s.city, s.neighborhood,
+        s.bedroom_quantity, s.suite_quantity, 0,
+        s.garage_slots_quantity,
+        s.price, s.area, s.area, true,
+        a.id, 0.0,
+        '', s.thumb_url, s.url, s.content_hash, now(), now()
+    FROM   isc_real_estate_staging s
+    JOIN   real_estate_agency_agency a ON a.profile_url = s.agency_profile_url
+    WHERE  {VALID_STAGING_ROW_SQL}
+    ORDER  BY s.reference_code
+    ON CONFLICT (reference_code) DO NOTHING
+"""
+
+# results are written in the order they were crawled, the first time a real
+# estate was listed
+MERGE_SEARCH_RESULTS_SQL = f"""
+    INSERT INTO search_searchresultrealestate (id, search_id, real_estate_id)
+    SELECT gen_random_uuid(), %(search_id)s::uuid, r.id
+    FROM   (
+        SELECT s.reference_code, min(s.position) AS position
+        FROM   isc_real_estate_staging s
+        WHERE  {VALID_STAGING_ROW_SQL}
+        GROUP  BY s.reference_code
+    ) s
+    JOIN   real_estate_realestate r ON r.reference_code = s.reference_code
+    WHERE  NOT EXISTS (
+        SELECT 1
+        FROM   search_searchresultrealestate ssrre
+        WHERE  ssrre.search_id = %(search_id)s::uuid
+        AND    ssrre.real_estate_id = r.id
+    )
+    ORDER  BY s.position
+"""
+
+
+@dataclass
+class BulkLoadStats:
+    rows_copied: int = 0
+    agencies_created: int = 0
+    real_estates_created: int = 0
+    real_estates_updated: int = 0
+    search_results_created: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def escape_copy_value(value: Any) -> str:
+    """Value in the text format of COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        # array literal, its elements quoted
+        elements = []
+        for element in value:
+            element = str(element).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{element}"')
+        value = "{" + ",".join(elements) + "}"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class CopyRowStream:
+    """
+    File like object read by COPY FROM STDIN. Rows are formatted while COPY
+    reads them, so they are never collected in memory.
+    """
+
+    def __init__(self, rows: Iterable[Optional[Sequence[Any]]]):
+        self.rows = iter(rows)
+        self.buffer = ""
+        self.rows_read = 0
+
+    def next_lines(self, size: int) -> Iterator[str]:
+        length = 0
+        for row in self.rows:
+            # rows the caller could not build are skipped
+            if row is None:
+                continue
+
+            line = "\t".join(escape_copy_value(value) for value in row) + "\n"
+            self.rows_read += 1
+            length += len(line)
+            yield line
+            if length >= size:
+                return
+
+    def read(self, size: int = -1) -> str:
+        if size is None or size < 0:
+            size = float("inf")
+
+        if len(self.buffer) < size:
+            self.buffer += "".join(self.next_lines(size - len(self.buffer)))
+
+        if size == float("inf"):
+            chunk, self.buffer = self.buffer, ""
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def bulk_load_real_estates(
+    cursor, search_id: str, rows: Iterable[Optional[Sequence[Any]]]
+) -> BulkLoadStats:
+    """
+    Copy staging rows, with the values of STAGING_COLUMNS, and merge them into
+    the real estates of the search. Stored real estates whose content hash
+    changed are updated, an empty hash leaves them as they are. Must run
+    inside a transaction, the staging table is dropped on commit.
+    """
+    stats = BulkLoadStats()
+
+    cursor.execute(CREATE_STAGING_TABLE_SQL)
+    stream = CopyRowStream(rows)
+    cursor.copy_expert(COPY_STAGING_SQL, stream)
+    stats.rows_copied = stream.rows_read
+    cursor.execute("ANALYZE isc_real_estate_staging")
+
+    cursor.execute(MERGE_AGENCIES_SQL)
+    stats.agencies_created = cursor.rowcount
+    cursor.execute(MERGE_REAL_ESTATE_UPDATES_SQL)
+    cursor.execute(MERGE_CHANGED_REAL_ESTATES_SQL)
+    stats.real_estates_updated = cursor.rowcount
+    cursor.execute(MERGE_NEW_REAL_ESTATES_SQL)
+    stats.real_estates_created = cursor.rowcount
+    cursor.execute(MERGE_SEARCH_RESULTS_SQL, {"search_id": str(search_id)})
+    stats.search_results_created = cursor.rowcount
+
+    return stats
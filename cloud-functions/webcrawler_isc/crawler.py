@@ -1,7 +1,15 @@
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import threading
 import traceback
 
 from database import (
+    borrow_conn,
+    transaction,
+    on_commit,
+    savepoint,
     fetch_search,
     Search,
     RealEstate,
@@ -9,19 +17,53 @@ from database import (
     get_filter_fields,
     set_search_number_real_estate_found,
     set_search_query_status,
-    get_real_estate_by_reference_code,
-    get_agency_by_profile_url,
-    insert_agency,
-    insert_real_estate,
+    set_search_skipped_pages,
+    get_search_skipped_pages,
+    get_crawl_checkpoint,
+    save_crawl_checkpoint,
+    delete_crawl_checkpoint,
+    get_real_estate_ids_by_reference_codes,
+    get_real_estates_by_reference_codes,
+    get_agency_ids_by_profile_urls,
+    insert_agencies,
+    insert_real_estates,
+    insert_real_estate_updates,
+    update_real_estates,
+    insert_search_results,
     ObjectNotFoundError,
     GenericInsertError
 )
+from bulk_load import bulk_load_real_estates
+from webcrawler_http import (
+    FetchStatus,
+    get_session_factory,
+    set_rate_limit_connection_factory,
+)
 from webcrawler_isc import (
     WebsiteISCFilter,
     WebcrawlerISCRealEstate,
     WebsiteISCRealEstateInfo,
 )
 
+ISC_CRAWLER_MAX_WORKERS = int(os.environ.get("ISC_CRAWLER_MAX_WORKERS", 4))
+ISC_CRAWLER_PARSER = os.environ.get("ISC_CRAWLER_PARSER", "single_pass")
+ISC_CRAWLER_SHARD_PAGES = int(os.environ.get("ISC_CRAWLER_SHARD_PAGES", 10))
+ISC_AGENCY_CACHE_SIZE = int(os.environ.get("ISC_AGENCY_CACHE_SIZE", 1024))
+
+
+@contextmanager
+def rate_limit_connection():
+    """
+    Connection used by the Postgres backed rate limiter of the crawler, never
+    the one of the page being written
+    """
+    with borrow_conn() as conn:
+        with conn:
+            yield conn
+
+
+set_rate_limit_connection_factory(rate_limit_connection)
+
 
 def create_isc_filter(search_id: str) -> WebsiteISCFilter:
 
@@ -165,37 +207,98 @@ def convert_values_to_float(value: str) -> float:
     return tmp_value
 
 
-# TODO - improve error handling
-def create_real_estate_object(
-    real_estate_info: WebsiteISCRealEstateInfo, search_obj: Search
-) -> None:
-    print(f"Creating real estate object for code {real_estate_info.code}")
-    try:
-        agency_obj = get_agency_by_profile_url(
-            profile_url=real_estate_info.agency.profile_url
+class AgencyCache:
+    """Bounded LRU of agency profile URL to agency ID, kept while the instance is warm"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.agency_ids = OrderedDict()
+        # pages are stored while the crawler threads fetch the next ones
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, profile_urls: Iterable[str]) -> Dict[str, str]:
+        agency_ids = {}
+        with self.lock:
+            for profile_url in profile_urls:
+                agency_id = self.agency_ids.get(profile_url)
+                if agency_id is None:
+                    self.misses += 1
+                    continue
+
+                self.agency_ids.move_to_end(profile_url)
+                agency_ids[profile_url] = agency_id
+                self.hits += 1
+
+        return agency_ids
+
+    def set_many(self, agency_ids: Dict[str, str]) -> None:
+        with self.lock:
+            for profile_url, agency_id in agency_ids.items():
+                self.agency_ids[profile_url] = agency_id
+                self.agency_ids.move_to_end(profile_url)
+
+            while len(self.agency_ids) > self.max_size:
+                self.agency_ids.popitem(last=False)
+
+
+agency_cache = AgencyCache(ISC_AGENCY_CACHE_SIZE)
+
+
+def resolve_agencies(real_estate_list: List[WebsiteISCRealEstateInfo]) -> Dict[str, str]:
+    """Agency IDs of the real estates by profile URL, missing ones are created"""
+    agency_info_by_url = {}
+    for real_estate in real_estate_list:
+        if real_estate.agency is not None:
+            agency_info_by_url.setdefault(real_estate.agency.profile_url, real_estate.agency)
+
+    agency_id_by_url = agency_cache.get_many(agency_info_by_url)
+    missing_urls = [url for url in agency_info_by_url if url not in agency_id_by_url]
+    if len(missing_urls) == 0:
+        return agency_id_by_url
+
+    stored_agency_ids = get_agency_ids_by_profile_urls(missing_urls)
+
+    new_agencies = []
+    for profile_url in missing_urls:
+        if profile_url in stored_agency_ids:
+            continue
+
+        agency_info = agency_info_by_url[profile_url]
+        print(f"Creating agency object for name {agency_info.name}")
+        new_agencies.append(
+            {
+                "name": agency_info.name,
+                "logo_url": agency_info.logo_url,
+                "profile_url": agency_info.profile_url,
+            }
         )
-    except ObjectNotFoundError:
-        try:
-            print(f"Creating agency object for name {real_estate_info.agency.name}")
-            insert_agency(
-                name=real_estate_info.agency.name,
-                logo_url=real_estate_info.agency.logo_url,
-                profile_url=real_estate_info.agency.profile_url,
-                creci="",
-                city="",
-                address_street="",
-                address_number="",
-                contact_number_1="",
-                contact_number_2="",
-                contact_whatsapp="",
-            )
 
-        except Exception as e:
-            print(
-                f"Failed to create agency object for name {real_estate_info.agency.name}. Error: {e}."
+    new_agency_ids = insert_agencies(new_agencies)
+    if len(new_agency_ids) < len(new_agencies):
+        # created by another crawl after the first query
+        stored_agency_ids.update(
+            get_agency_ids_by_profile_urls(
+                [
+                    agency["profile_url"]
+                    for agency in new_agencies
+                    if agency["profile_url"] not in new_agency_ids
+                ]
             )
-            return None
+        )
+
+    agency_cache.set_many(stored_agency_ids)
+    # the page transaction may still be rolled back
+    on_commit(lambda: agency_cache.set_many(new_agency_ids))
+    agency_id_by_url.update(stored_agency_ids)
+    agency_id_by_url.update(new_agency_ids)
+
+    return agency_id_by_url
 
+
+def build_real_estate_fields(real_estate_info: WebsiteISCRealEstateInfo) -> Dict[str, Any]:
+    """Fields of insert_real_estates, except the agency, with their content hash"""
     property_type = extract_property_type_from_url(real_estate_info.url)
     transaction_type = extract_transaction_type_from_url(real_estate_info.url)
     price = convert_values_to_float(real_estate_info.price)
@@ -213,42 +316,278 @@ def create_real_estate_object(
     if len(garage_slots) == 0:
         garage_slots = 0
 
-    try:
-        insert_real_estate(
-            reference_code=real_estate_info.code,
-            property_type=property_type,
-            transaction_type=transaction_type,
-            city=real_estate_info.city,
-            neighborhood=real_estate_info.neighborhood,
-            bedroom_quantity=bedrooms,
-            suite_quantity=suites,
-            bathroom_quantity=0,
-            garage_slots_quantity=garage_slots,
-            price=price,
-            area=area,
-            area_total=area,
-            available=True,
-            agency=agency_obj.get("id"),
-            cond_price=0.0,
-            description="",
-            thumb_url=real_estate_info.thumb_urls,
-            url=real_estate_info.url,
-        )
+    # converted to the stored types, so the content hash matches the app one
+    fields = {
+        "reference_code": real_estate_info.code,
+        "property_type": property_type,
+        "transaction_type": transaction_type,
+        "city": real_estate_info.city,
+        "neighborhood": real_estate_info.neighborhood,
+        "bedroom_quantity": int(bedrooms),
+        "suite_quantity": int(suites),
+        "bathroom_quantity": 0,
+        "garage_slots_quantity": int(garage_slots),
+        "price": price,
+        "area": area,
+        "area_total": area,
+        "available": True,
+        "cond_price": 0.0,
+        "description": "",
+        "thumb_url": real_estate_info.thumb_urls,
+        "url": real_estate_info.url,
+    }
+    fields["content_hash"] = RealEstate.get_content_hash(fields)
+    return fields
+
+
+# TODO - improve error handling
+def build_real_estate_row(
+    real_estate_info: WebsiteISCRealEstateInfo,
+    agency_id_by_url: Dict[str, str],
+) -> Optional[Dict[str, Any]]:
+    """Fields of insert_real_estates, None when the agency is unknown"""
+    print(f"Creating real estate object for code {real_estate_info.code}")
+    agency_id = None
+    if real_estate_info.agency is not None:
+        agency_id = agency_id_by_url.get(real_estate_info.agency.profile_url)
+
+    if agency_id is None:
+        print(f"Failed to find agency of real estate code {real_estate_info.code}.")
         return None
+
+    return {**build_real_estate_fields(real_estate_info), "agency_id": agency_id}
+
+
+def build_staging_row(real_estate_info: WebsiteISCRealEstateInfo) -> Optional[tuple]:
+    """Row of STAGING_COLUMNS for the bulk load, None when it can not be stored"""
+    agency_info = real_estate_info.agency
+    if agency_info is None:
+        print(f"Failed to find agency of real estate code {real_estate_info.code}.")
+        return None
+
+    try:
+        fields = build_real_estate_fields(real_estate_info)
     except Exception as e:
         print(
-            f"Failed to create real estate object for code {real_estate_info.code}. Error: {e}."
+            f"Fail to build real estate object code {real_estate_info.code} - URL {real_estate_info.url}. Error: {e}."
         )
         return None
 
+    return (
+        real_estate_info.code,
+        fields["property_type"],
+        fields["transaction_type"],
+        fields["city"],
+        fields["neighborhood"],
+        fields["bedroom_quantity"],
+        fields["suite_quantity"],
+        fields["garage_slots_quantity"],
+        fields["price"],
+        fields["area"],
+        fields["thumb_url"],
+        fields["url"],
+        fields["content_hash"],
+        agency_info.name,
+        agency_info.logo_url,
+        agency_info.profile_url,
+    )
+
+
+def insert_real_estate_rows(conn, real_estate_rows: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Insert the new real estates of a page with a single query. When a row is
+    rejected they are inserted one by one, so one bad listing does not drop
+    the whole page.
+    """
+    try:
+        with savepoint(conn):
+            return insert_real_estates(real_estate_rows)
+    except Exception as e:
+        print(f"Failed to insert {len(real_estate_rows)} real estates at once. Error: {e}.")
+
+    real_estate_ids = {}
+    for real_estate_row in real_estate_rows:
+        try:
+            with savepoint(conn):
+                real_estate_ids.update(insert_real_estates([real_estate_row]))
+        except Exception as e:
+            print(
+                f"Failed to create real estate object for code {real_estate_row['reference_code']}. Error: {e}."
+            )
+
+    return real_estate_ids
+
+
+def store_real_estate_page(
+    conn,
+    search_id: str,
+    search_obj: Search,
+    real_estate_list: List[WebsiteISCRealEstateInfo],
+) -> List[str]:
+    """
+    Store the real estates of a result page and link them to the search, with
+    a fixed number of queries whatever the page size.
+    Returns the reference codes linked to the search.
+    """
+    real_estate_by_code = {}
+    for real_estate in real_estate_list:
+        real_estate_by_code.setdefault(real_estate.code, real_estate)
+
+    re_object_by_code = get_real_estates_by_reference_codes(list(real_estate_by_code))
+    changed_re_objects = []
+    re_updates = []
+    for code, re_object in re_object_by_code.items():
+        real_estate = real_estate_by_code[code]
+        try:
+            re_update = update_real_estate_object(re_object, real_estate, search_obj)
+        except Exception as e:
+            print(
+                f"Fail to update real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
+            )
+            continue
+
+        if re_update is None:
+            continue
+
+        changed_re_objects.append(re_object)
+        if len(re_update["update"]) > 0:
+            re_updates.append(re_update)
+
+    # unchanged real estates are not written
+    update_real_estates(changed_re_objects)
+    insert_real_estate_updates(re_updates)
+
+    real_estate_ids = {
+        code: re_object["id"] for code, re_object in re_object_by_code.items()
+    }
+
+    new_real_estate_list = [
+        real_estate
+        for code, real_estate in real_estate_by_code.items()
+        if code not in real_estate_ids
+    ]
+    # agencies of the whole page are resolved at once
+    agency_id_by_url = resolve_agencies(new_real_estate_list)
+
+    real_estate_rows = []
+    for real_estate in new_real_estate_list:
+        print(f"Reference code {real_estate.code} NOT found.")
+        real_estate_row = build_real_estate_row(real_estate, agency_id_by_url)
+        if real_estate_row is not None:
+            real_estate_rows.append(real_estate_row)
+
+    new_real_estate_ids = insert_real_estate_rows(conn, real_estate_rows)
+    missing_codes = [
+        real_estate_row["reference_code"]
+        for real_estate_row in real_estate_rows
+        if real_estate_row["reference_code"] not in new_real_estate_ids
+    ]
+    if len(missing_codes) > 0:
+        # created by another crawl after the first query
+        new_real_estate_ids.update(get_real_estate_ids_by_reference_codes(missing_codes))
+    real_estate_ids.update(new_real_estate_ids)
+
+    page_codes = [code for code in real_estate_by_code if code in real_estate_ids]
+    insert_search_results(search_id, [real_estate_ids[code] for code in page_codes])
+
+    return page_codes
+
 
 def update_real_estate_object(
-    re_object: dict,
+    re_object: Dict[str, Any],
     real_estate_info: WebsiteISCRealEstateInfo,
     search_obj: Search,
-):
-    print(f"Updating ID {re_object.get("id")} - Code {real_estate_info.code}")
-    pass
+) -> Optional[Dict[str, Any]]:
+    """
+    Copy the crawled fields to re_object, without saving it. Returns None when
+    the content hash did not change, otherwise the price and availability
+    changes, the update list is empty when only other fields changed.
+    """
+    fields = build_real_estate_fields(real_estate_info)
+    if fields["content_hash"] == re_object["content_hash"]:
+        return None
+
+    print(f"Updating ID {re_object['id']} - Code {real_estate_info.code}")
+    re_update = {"real_estate_id": re_object["id"], "update": []}
+    if fields["price"] != re_object["price"]:
+        re_update["update"].append("price")
+        re_update["old_price"] = re_object["price"]
+        re_update["new_price"] = fields["price"]
+
+    if fields["available"] != re_object["available"]:
+        re_update["update"].append("availability")
+        re_update["old_available"] = re_object["available"]
+        re_update["new_available"] = fields["available"]
+
+    for field in RealEstate.content_fields + ["content_hash"]:
+        re_object[field] = fields[field]
+
+    return re_update
+
+
+def load_crawl_checkpoint(search_id: str, filter_url: str) -> Dict[str, Any]:
+    """Checkpoint of an interrupted crawl of the same filter URL, or a new one"""
+    try:
+        checkpoint = get_crawl_checkpoint(search_id)
+    except ObjectNotFoundError:
+        checkpoint = None
+
+    if checkpoint is not None and checkpoint["filter_url"] != filter_url:
+        print(f"Discarding checkpoint of search {search_id}, filter URL changed")
+        checkpoint = None
+
+    if checkpoint is None:
+        checkpoint = {
+            "filter_url": filter_url,
+            "last_page": 0,
+            "total_pages": 0,
+            "reference_codes": [],
+        }
+
+    return checkpoint
+
+
+def bulk_load_crawler(search_id: str, crawler: WebcrawlerISCRealEstate):
+    """
+    Bulk load every real estate of the search with COPY, meant for city wide
+    and backfill crawls. Parsed listings stream into the database while pages
+    are crawled, an interrupted bulk load starts over instead of resuming.
+    """
+    skipped_pages = []
+    number_real_estate_found = 0
+
+    def staging_rows():
+        nonlocal number_real_estate_found
+        for page_content in crawler.crawl():
+            if page_content.fetch_status == FetchStatus.FAILED:
+                skipped_pages.append(page_content.page)
+                continue
+
+            if page_content.page == 1:
+                number_real_estate_found = page_content.total
+
+            for real_estate in page_content.real_estate_list:
+                yield build_staging_row(real_estate)
+
+    try:
+        # a connection of its own, so the rate limiter can query while COPY runs
+        with borrow_conn() as conn:
+            with conn, conn.cursor() as cur:
+                stats = bulk_load_real_estates(cur, search_id, staging_rows())
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(f"Failure while bulk loading ISC. Error: {e}. Traceback: {tb}.")
+        return
+
+    print(f"ISC bulk load stats: {stats.as_dict()}")
+    print(f"ISC HTTP session stats: {get_session_factory().get_stats()}")
+
+    with transaction():
+        set_search_number_real_estate_found(search_id, number_real_estate_found)
+        set_search_skipped_pages(search_id, skipped_pages)
+        set_search_query_status(search_id, Search.QueryStatus.FINISHED)
+
+    return search_id
 
 
 def crawler(request):
@@ -261,55 +600,82 @@ def crawler(request):
         print("Failed to create ISC filter")
         return "failed"
 
-    crawler = WebcrawlerISCRealEstate()
+    crawler = WebcrawlerISCRealEstate(
+        max_workers=ISC_CRAWLER_MAX_WORKERS,
+        parser=ISC_CRAWLER_PARSER,
+        shard_pages=ISC_CRAWLER_SHARD_PAGES,
+    )
     crawler.set_filter(isc_filter)
 
+    if request.args.get("bulk_load") == "true":
+        return bulk_load_crawler(search_id, crawler)
+
     search_obj = Search()
+    skipped_pages = []
+
+    checkpoint = load_crawl_checkpoint(search_id, crawler.url)
+    ingested_codes = set(checkpoint["reference_codes"])
+
+    def save_checkpoint(page_content, page_codes):
+        checkpoint["last_page"] = page_content.page
+        checkpoint["total_pages"] = page_content.total_pages
+        checkpoint["reference_codes"] += page_codes
+        save_crawl_checkpoint(search_id, **checkpoint)
+
+    page_contents = []
+    if checkpoint["last_page"] == 0:
+        page_contents = crawler.crawl()
+    elif checkpoint["last_page"] < checkpoint["total_pages"]:
+        print(
+            f"Resuming search {search_id} after page {checkpoint['last_page']} "
+            f"of {checkpoint['total_pages']}"
+        )
+        skipped_pages = get_search_skipped_pages(search_id)
+        page_contents = crawler.crawl(start_page=checkpoint["last_page"] + 1)
 
     try:
-        for page_content in crawler.crawl():
-            if page_content.page == 1:
-                set_search_number_real_estate_found(search_id, page_content.total)
-                set_search_query_status(search_id, Search.QueryStatus.PARTIAL)
-
-            real_estate_list = page_content.real_estate_list
-            for real_estate in real_estate_list:
-                print(real_estate.code)
-                try:
-                    real_estate_obj = get_real_estate_by_reference_code(
-                        reference_code=real_estate.code
-                    )
-                    update_real_estate_object(real_estate_obj, real_estate, search_obj)
-
-                except ObjectNotFoundError:
-                    print(f"Reference code {real_estate.code} NOT found.")
-                    real_estate_obj = create_real_estate_object(real_estate, search_obj)
-
-                except Exception as e:
-                    print(
-                        f"Fail to save real estate object code {real_estate.code} - URL {real_estate.url}. Error: {e}."
-                    )
-                    continue
+        for page_content in page_contents:
+            if page_content.fetch_status == FetchStatus.FAILED:
+                skipped_pages.append(page_content.page)
+                with transaction():
+                    set_search_skipped_pages(search_id, skipped_pages)
+                    save_checkpoint(page_content, [])
+                continue
 
-                try:
-                    # SearchResultRealEstate.objects.create(
-                    #    search=search_obj, real_estate=real_estate_obj
-                    # )
-                    # TODO - how to create search result real estate
-                    pass
+            # stored by the interrupted crawl being resumed
+            real_estate_list = [
+                real_estate
+                for real_estate in page_content.real_estate_list
+                if real_estate.code not in ingested_codes
+            ]
 
-                except Exception as e:
-                    print(
-                        f"Fail to create search result for real estate code {real_estate.code} - URL {real_estate.url}. Error: {e}."
-                    )
+            # a page and its checkpoint are written in a single transaction
+            with transaction() as conn:
+                if page_content.page == 1:
+                    set_search_number_real_estate_found(search_id, page_content.total)
+                    set_search_query_status(search_id, Search.QueryStatus.PARTIAL)
+
+                page_codes = store_real_estate_page(
+                    conn, search_id, search_obj, real_estate_list
+                )
+                save_checkpoint(page_content, page_codes)
+
+            ingested_codes.update(page_codes)
 
     except Exception as e:
         tb = traceback.format_exc()
         print(f"Failure while crawling ISC. Error: {e}. Traceback: {tb}.")
         return
 
+    # counters are cumulative for every crawl done by this process
+    if crawler.http_cache is not None:
+        print(f"ISC HTTP cache stats: {crawler.http_cache.stats.as_dict()}")
+    print(f"ISC HTTP session stats: {get_session_factory().get_stats()}")
+    print(f"ISC agency cache hits: {agency_cache.hits}, misses: {agency_cache.misses}")
+
     search_obj.query_status = Search.QueryStatus.FINISHED
-    # search_obj.save()
-    # TODO - how to update search obj
+    with transaction():
+        set_search_query_status(search_id, Search.QueryStatus.FINISHED)
+        delete_crawl_checkpoint(search_id)
 
     return search_id
@@ -1,6 +1,12 @@
+import hashlib
+import json
 import os
-from typing import Dict, Any, List
+import threading
+from typing import Callable, Dict, Any, List
 import psycopg2  # used inside the connector
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from contextlib import contextmanager
 from uuid import uuid4
 from datetime import datetime
@@ -13,20 +19,129 @@ POSTGRES_PORT = "5432"
 POSTGRES_NAME = os.environ.get("POSTGRES_NAME", "")
 POSTGRES_USER = os.environ.get("POSTGRES_USER", "")
 POSTGRES_PASS = os.environ.get("POSTGRES_PASS", "")
+# connections kept open while the instance is warm, the crawler threads may
+# use one each for the rate limiter
+POSTGRES_POOL_SIZE = int(os.environ.get("POSTGRES_POOL_SIZE", 8))
+
+# created on first use and reused by every invocation of a warm instance
+connection_pool = None
+connection_pool_lock = threading.Lock()
+# connection of the transaction opened by the current thread
+transaction_state = threading.local()
+
+
+def get_connection_pool() -> ThreadedConnectionPool:
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is None:
+            connection_pool = ThreadedConnectionPool(
+                1,
+                POSTGRES_POOL_SIZE,
+                host=POSTGRES_HOST,
+                port=POSTGRES_PORT,
+                dbname=POSTGRES_NAME,
+                user=POSTGRES_USER,
+                password=POSTGRES_PASS,
+            )
+        return connection_pool
+
+
+def close_connection_pool() -> None:
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is not None:
+            connection_pool.closeall()
+            connection_pool = None
+
 
 @contextmanager
-def get_conn():
-    conn = psycopg2.connect(
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT,
-        dbname=POSTGRES_NAME,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASS,
-    )
+def borrow_conn():
+    """Connection of the pool, closed instead of returned when it broke"""
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+
+    broken = False
     try:
         yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
     finally:
-        conn.close()
+        if not broken and not conn.closed:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        pool.putconn(conn, close=broken or bool(conn.closed))
+
+
+@contextmanager
+def transaction():
+    """
+    Run every query of the block in a single transaction of one connection.
+    Queries of get_conn inside the block use it and are committed at the end.
+    """
+    if getattr(transaction_state, "conn", None) is not None:
+        # nested blocks are part of the outer transaction
+        yield transaction_state.conn
+        return
+
+    with borrow_conn() as conn:
+        transaction_state.conn = conn
+        transaction_state.on_commit = []
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            callbacks = transaction_state.on_commit
+            transaction_state.conn = None
+            transaction_state.on_commit = []
+
+    for callback in callbacks:
+        callback()
+
+
+def on_commit(callback: Callable[[], None]) -> None:
+    """Run callback once the current transaction commits, or now without one"""
+    if getattr(transaction_state, "conn", None) is None:
+        callback()
+    else:
+        transaction_state.on_commit.append(callback)
+
+
+@contextmanager
+def savepoint(conn):
+    """Undo the queries of the block on error, keeping the outer transaction"""
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT crawler_savepoint")
+    try:
+        yield
+    except psycopg2.DatabaseError:
+        with conn.cursor() as cur:
+            cur.execute("ROLLBACK TO SAVEPOINT crawler_savepoint")
+        raise
+    with conn.cursor() as cur:
+        cur.execute("RELEASE SAVEPOINT crawler_savepoint")
+
+
+@contextmanager
+def get_conn():
+    """
+    Connection for the queries of a helper, committed once the block ends.
+    Inside transaction() it is the connection of the transaction instead.
+    """
+    conn = getattr(transaction_state, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    with borrow_conn() as conn:
+        yield conn
+        conn.commit()
 
 
 class Search:
@@ -37,6 +152,7 @@ class Search:
         STARTED = "started"
         PARTIAL = "partial"
         FINISHED = "finished"
+        FAILED = "failed"
 
     id: str
     filter: str
@@ -60,6 +176,29 @@ class RealEstate:
         BUY = "buy"
         RENT = "rent"
 
+    # fields compared to tell whether a crawled real estate changed, the same
+    # ones of the Django model so both compute the same content hash
+    content_fields = [
+        "property_type",
+        "transaction_type",
+        "city",
+        "neighborhood",
+        "bedroom_quantity",
+        "suite_quantity",
+        "garage_slots_quantity",
+        "price",
+        "area",
+        "area_total",
+        "available",
+        "thumb_url",
+        "url",
+    ]
+
+    @classmethod
+    def get_content_hash(cls, fields: Dict[str, Any]) -> str:
+        content = [fields[field] for field in cls.content_fields]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
 
 class ObjectNotFoundError(Exception):
     def __init__(self, errors):
@@ -228,7 +367,6 @@ def insert_real_estate(
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute(sql, payload)
         new_row = cur.fetchone()
-        conn.commit()
 
     return new_row
 
@@ -303,11 +441,199 @@ def insert_agency(
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute(sql, payload)
         new_row = cur.fetchone()
-        conn.commit()
 
     return new_row
 
 
+def get_agency_ids_by_profile_urls(profile_urls: List[str]) -> Dict[str, str]:
+    """Fetch the IDs of the agencies with the given profile urls"""
+    sql = """
+        SELECT reaa.profile_url, reaa.id
+        FROM real_estate_agency_agency reaa
+        WHERE reaa.profile_url = ANY(%s)
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (list(profile_urls),))
+
+        agency_ids = {}
+        for profile_url, agency_id in cur.fetchall():
+            agency_ids.setdefault(profile_url, agency_id)
+
+        return agency_ids
+
+
+def insert_agencies(agencies: List[Dict[str, str]]) -> Dict[str, str]:
+    """
+    Insert agencies with the fields of insert_agency in a single query.
+    Returns the IDs of the new agencies by profile url, agencies created in
+    the meantime by another crawl are skipped.
+    """
+    if len(agencies) == 0:
+        return {}
+
+    columns = [
+        "id", "name", "logo_url", "profile_url",
+        "creci", "city",
+        "address_street", "address_number",
+        "contact_number_1", "contact_number_2", "contact_whatsapp",
+    ]
+    rows = [
+        (str(uuid4()), *(agency.get(col, "") for col in columns[1:]))
+        for agency in agencies
+    ]
+
+    sql = f"""
+        INSERT INTO real_estate_agency_agency ({", ".join(columns)})
+        VALUES %s
+        ON CONFLICT (profile_url) DO NOTHING
+        RETURNING profile_url, id;
+    """
+
+    with get_conn() as conn, conn.cursor() as cur:
+        new_rows = execute_values(cur, sql, rows, fetch=True)
+
+    return dict(new_rows)
+
+
+def get_real_estate_ids_by_reference_codes(reference_codes: List[str]) -> Dict[str, str]:
+    """Fetch the IDs of the real estates with the given reference codes"""
+    sql = """
+        SELECT rer.reference_code, rer.id
+        FROM real_estate_realestate rer
+        WHERE rer.reference_code = ANY(%s)
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (list(reference_codes),))
+        return dict(cur.fetchall())
+
+
+def get_real_estates_by_reference_codes(
+    reference_codes: List[str],
+) -> Dict[str, Dict[str, Any]]:
+    """Fetch the ID, content hash, price and availability of the real estates"""
+    sql = """
+        SELECT rer.reference_code, rer.id, rer.content_hash, rer.price, rer.available
+        FROM real_estate_realestate rer
+        WHERE rer.reference_code = ANY(%s)
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (list(reference_codes),))
+        rows = cur.fetchall()
+
+    real_estates = {}
+    for reference_code, real_estate_id, content_hash, price, available in rows:
+        real_estates[reference_code] = {
+            "id": real_estate_id,
+            "reference_code": reference_code,
+            "content_hash": content_hash,
+            "price": price,
+            "available": available,
+        }
+    return real_estates
+
+
+def update_real_estates(real_estates: List[Dict[str, Any]]) -> None:
+    """Write the content fields and content hash of the real estates in a single query"""
+    if len(real_estates) == 0:
+        return
+
+    columns = ["id"] + RealEstate.content_fields + ["content_hash"]
+    rows = [tuple(real_estate[col] for col in columns) for real_estate in real_estates]
+    sql = f"""
+        UPDATE real_estate_realestate rer
+        SET    {", ".join(f"{col} = v.{col}" for col in columns[1:])},
+               updated_at = now()
+        FROM   (VALUES %s) v ({", ".join(columns)})
+        WHERE  rer.id = v.id::uuid
+    """
+    template = "(" + ", ".join(
+        "%s::text[]" if col == "thumb_url" else "%s" for col in columns
+    ) + ")"
+    with get_conn() as conn, conn.cursor() as cur:
+        execute_values(cur, sql, rows, template=template)
+
+
+def insert_real_estate_updates(real_estate_updates: List[Dict[str, Any]]) -> None:
+    """Insert the price and availability changes of real estates in a single query"""
+    if len(real_estate_updates) == 0:
+        return
+
+    columns = [
+        "id", "real_estate_id", "update", "created_at",
+        "old_price", "new_price", "old_available", "new_available",
+    ]
+    now = datetime.now()
+    rows = []
+    for real_estate_update in real_estate_updates:
+        row = {**real_estate_update, "id": str(uuid4()), "created_at": now}
+        rows.append(tuple(row.get(col) for col in columns))
+
+    sql = f"""
+        INSERT INTO real_estate_realestateupdate ({", ".join(columns)})
+        VALUES %s
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        execute_values(cur, sql, rows)
+
+
+def insert_real_estates(real_estates: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Insert real estates with the fields of insert_real_estate in a single
+    query. Returns the IDs of the new real estates by reference code, real
+    estates created in the meantime by another crawl are skipped.
+    """
+    if len(real_estates) == 0:
+        return {}
+
+    columns = [
+        "id", "reference_code", "property_type", "transaction_type",
+        "city", "neighborhood",
+        "bedroom_quantity", "suite_quantity", "bathroom_quantity",
+        "garage_slots_quantity",
+        "price", "area", "area_total", "available",
+        "agency_id", "cond_price",
+        "description", "thumb_url", "url", "content_hash", "created_at", "updated_at",
+    ]
+    now = datetime.now()
+    rows = []
+    for real_estate in real_estates:
+        row = {**real_estate, "id": str(uuid4()), "created_at": now, "updated_at": now}
+        rows.append(tuple(row[col] for col in columns))
+
+    sql = f"""
+        INSERT INTO real_estate_realestate ({", ".join(columns)})
+        VALUES %s
+        ON CONFLICT (reference_code) DO NOTHING
+        RETURNING reference_code, id;
+    """
+
+    with get_conn() as conn, conn.cursor() as cur:
+        new_rows = execute_values(cur, sql, rows, fetch=True)
+
+    return dict(new_rows)
+
+
+def insert_search_results(search_id: str, real_estate_ids: List[str]) -> None:
+    """Link the real estates to the search, links that exist are skipped"""
+    if len(real_estate_ids) == 0:
+        return
+
+    rows = [(str(uuid4()), search_id, real_estate_id) for real_estate_id in real_estate_ids]
+    sql = """
+        INSERT INTO search_searchresultrealestate (id, search_id, real_estate_id)
+        SELECT v.id::uuid, v.search_id::uuid, v.real_estate_id::uuid
+        FROM (VALUES %s) v (id, search_id, real_estate_id)
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM   search_searchresultrealestate ssrre
+            WHERE  ssrre.search_id = v.search_id::uuid
+            AND    ssrre.real_estate_id = v.real_estate_id::uuid
+        )
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        execute_values(cur, sql, rows)
+
+
 def set_search_number_real_estate_found(search_id: str, re_found: int) -> None:
     sql = """
         UPDATE search_search ss
@@ -318,7 +644,86 @@ def set_search_number_real_estate_found(search_id: str, re_found: int) -> None:
         cur.execute(sql, (re_found, search_id))
         if cur.rowcount == 0:
             raise ObjectNotFoundError(f"Search {search_id} not found")
-        conn.commit()
+
+
+def set_search_skipped_pages(search_id: str, skipped_pages: List[int]) -> None:
+    sql = """
+        UPDATE search_search ss
+        SET    skipped_pages = %s
+        WHERE  ss.id = %s
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (skipped_pages, search_id))
+        if cur.rowcount == 0:
+            raise ObjectNotFoundError(f"Search {search_id} not found")
+
+
+def get_search_skipped_pages(search_id: str) -> List[int]:
+    sql = """
+        SELECT ss.skipped_pages
+        FROM   search_search ss
+        WHERE  ss.id = %s
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (search_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise ObjectNotFoundError(f"Search {search_id} not found")
+        return row[0]
+
+
+def get_crawl_checkpoint(search_id: str) -> Dict[str, Any]:
+    """
+    Fetch the progress of an interrupted crawl of the search.
+    Raises ObjectNotFoundError if not found.
+    """
+    sql = """
+        SELECT filter_url, last_page, total_pages, reference_codes
+        FROM   search_searchcrawlcheckpoint sscc
+        WHERE  sscc.search_id = %s
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (search_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise ObjectNotFoundError(f"Checkpoint of search {search_id} not found")
+        cols = [c[0] for c in cur.description]
+        return dict(zip(cols, row))
+
+
+def save_crawl_checkpoint(
+    search_id: str,
+    filter_url: str,
+    last_page: int,
+    total_pages: int,
+    reference_codes: List[str],
+) -> None:
+    sql = """
+        INSERT INTO search_searchcrawlcheckpoint (
+            search_id, filter_url, last_page, total_pages, reference_codes,
+            updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (search_id) DO UPDATE
+        SET    filter_url = EXCLUDED.filter_url,
+               last_page = EXCLUDED.last_page,
+               total_pages = EXCLUDED.total_pages,
+               reference_codes = EXCLUDED.reference_codes,
+               updated_at = EXCLUDED.updated_at
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            sql, (search_id, filter_url, last_page, total_pages, reference_codes)
+        )
+
+
+def delete_crawl_checkpoint(search_id: str) -> None:
+    sql = """
+        DELETE FROM search_searchcrawlcheckpoint sscc
+        WHERE  sscc.search_id = %s
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(sql, (search_id,))
 
 
 def set_search_query_status(search_id: str, status: str) -> None:
@@ -331,4 +736,3 @@ def set_search_query_status(search_id: str, status: str) -> None:
         cur.execute(sql, (status, search_id))
         if cur.rowcount == 0:
             raise ObjectNotFoundError(f"Search {search_id} not found")
-        conn.commit()
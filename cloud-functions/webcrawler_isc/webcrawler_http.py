@@ -0,0 +1,940 @@
+#!/bin/env python3
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from typing import Optional, Dict, List, Tuple, Callable, ContextManager, Any
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+
+class HTTPRequestError(Exception):
+    """Request did not return the page, retryable is False when trying again will not help"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        self.retryable = retryable
+        super().__init__(message)
+
+
+class CircuitOpenError(HTTPRequestError):
+    def __init__(self, host: str):
+        super().__init__(f"circuit open for {host}", retryable=False)
+
+
+class FetchStatus:
+    """How a page was fetched"""
+
+    FETCHED = "fetched"
+    # fetched after one or more failed attempts
+    RETRIED = "retried"
+    FAILED = "failed"
+
+
+class FetchResult:
+    body: Optional[str] = None
+    status: str = FetchStatus.FAILED
+    attempts: int = 0
+    error: str = ""
+
+    def __init__(
+        self,
+        body: Optional[str],
+        status: str,
+        attempts: int,
+        error: str = "",
+    ):
+        self.body = body
+        self.status = status
+        self.attempts = attempts
+        self.error = error
+
+
+class HTTPCacheEntry:
+    url: str = ""
+    body: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float = 0.0
+
+    def __init__(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        stored_at: float,
+    ):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+
+class HTTPCacheStats:
+    """Counters of a HTTP cache, shared by all threads using it"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stores = 0
+        self.evictions = 0
+        # body bytes that did not have to be downloaded again
+        self.bytes_saved = 0
+        # time spent downloading on misses, used to estimate latency saved
+        self.miss_seconds = 0.0
+
+    def increment(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            requests_count = self.hits + self.misses + self.revalidations
+            avg_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": (
+                    (self.hits + self.revalidations) / requests_count
+                    if requests_count
+                    else 0.0
+                ),
+                "bytes_saved": self.bytes_saved,
+                "seconds_saved": round(avg_miss_seconds * self.hits, 3),
+            }
+
+
+class HTTPCache:
+    """
+    On disk cache of GET responses keyed by the full URL.
+    Bodies are stored gzip compressed, entries are fresh for `ttl` seconds and
+    revalidated with ETag/Last-Modified after that. Once the cache grows over
+    `max_size` bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str, ttl: int = 900, max_size: int = 512 * 1024**2):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = HTTPCacheStats()
+
+        self.size_lock = threading.Lock()
+        self.size = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base_path = os.path.join(self.directory, key[:2], key)
+        return f"{base_path}.gz", f"{base_path}.json"
+
+    def get(self, url: str) -> Optional[HTTPCacheEntry]:
+        body_path, meta_path = self.get_paths(url)
+
+        try:
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            with gzip.open(body_path, "rt", encoding="utf-8") as body_file:
+                body = body_file.read()
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("url") != url:
+            return None
+
+        # access time drives the LRU eviction
+        try:
+            os.utime(body_path)
+        except OSError:
+            pass
+
+        return HTTPCacheEntry(
+            url=url,
+            body=body,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            stored_at=meta.get("stored_at", 0.0),
+        )
+
+    def is_fresh(self, entry: HTTPCacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.ttl
+
+    def store(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ) -> HTTPCacheEntry:
+        entry = HTTPCacheEntry(
+            url=url,
+            body=body,
+            etag=etag,
+            last_modified=last_modified,
+            stored_at=time.time(),
+        )
+
+        body_path, _ = self.get_paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+        compressed_body = gzip.compress(body.encode("utf-8"))
+        self.write_atomic(body_path, compressed_body)
+        self.write_meta(entry)
+
+        self.stats.increment(stores=1)
+        self.add_size(len(compressed_body))
+
+        return entry
+
+    def refresh(
+        self,
+        entry: HTTPCacheEntry,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ):
+        """Mark entry as fresh again after the server answered 304"""
+        entry.stored_at = time.time()
+        entry.etag = etag or entry.etag
+        entry.last_modified = last_modified or entry.last_modified
+        self.write_meta(entry)
+
+    def write_meta(self, entry: HTTPCacheEntry):
+        _, meta_path = self.get_paths(entry.url)
+        meta = {
+            "url": entry.url,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "stored_at": entry.stored_at,
+        }
+        self.write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def write_atomic(self, path: str, content: bytes):
+        # concurrent crawls may write the same URL, readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def list_bodies(self) -> List[Tuple[float, int, str]]:
+        bodies = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if not file_name.endswith(".gz"):
+                    continue
+
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                bodies.append((stat.st_mtime, stat.st_size, path))
+
+        return bodies
+
+    def add_size(self, size: int):
+        with self.size_lock:
+            if self.size is None:
+                self.size = sum(body[1] for body in self.list_bodies())
+            else:
+                self.size += size
+
+            if self.size <= self.max_size:
+                return
+
+            self.evict()
+
+    def evict(self):
+        # other processes may share the directory, so work on what is on disk
+        bodies = sorted(self.list_bodies())
+        self.size = sum(body[1] for body in bodies)
+
+        # leave some room so eviction does not run on every store
+        target_size = self.max_size * 0.9
+        evictions = 0
+        for _, size, body_path in bodies:
+            if self.size <= target_size:
+                break
+
+            meta_path = body_path[: -len(".gz")] + ".json"
+            for path in (body_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+            self.size -= size
+            evictions += 1
+
+        self.stats.increment(evictions=evictions)
+
+    def fetch(
+        self,
+        session: requests.Session,
+        url: str,
+        headers: Dict,
+        timeout: int = 10,
+    ) -> str:
+        entry = self.get(url)
+
+        if entry is not None and self.is_fresh(entry):
+            self.stats.increment(hits=1, bytes_saved=len(entry.body))
+            return entry.body
+
+        request_headers = dict(headers)
+        if entry is not None:
+            if entry.etag:
+                request_headers["if-none-match"] = entry.etag
+            if entry.last_modified:
+                request_headers["if-modified-since"] = entry.last_modified
+
+        start = time.monotonic()
+        response = get_response(session, url, request_headers, timeout)
+        elapsed = time.monotonic() - start
+
+        if response.status_code == 304 and entry is not None:
+            self.refresh(
+                entry,
+                response.headers.get("etag"),
+                response.headers.get("last-modified"),
+            )
+            self.stats.increment(revalidations=1, bytes_saved=len(entry.body))
+            return entry.body
+
+        check_response(url, response)
+
+        self.stats.increment(misses=1, miss_seconds=elapsed)
+
+        if "no-store" not in response.headers.get("cache-control", ""):
+            try:
+                self.store(
+                    url,
+                    response.text,
+                    response.headers.get("etag"),
+                    response.headers.get("last-modified"),
+                )
+            except OSError as e:
+                print(f"Failed to store {url} in HTTP cache. Error: {e}")
+
+        return response.text
+
+
+class LocalTokenBucket:
+    """Token bucket kept in memory, shared by the threads of one process"""
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, burst: float) -> float:
+        """Take a token, returns 0 on success or the seconds to wait before trying again"""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(0.0, now - self.updated_at)
+            self.tokens = min(burst, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+            if self.blocked_until > now:
+                return self.blocked_until - now
+
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+
+            self.tokens -= 1
+            return 0.0
+
+    def adjust(self, factor: float, increase: float, block_seconds: float = 0.0):
+        """Set rate to rate * factor + increase and block new tokens for some seconds"""
+        with self.lock:
+            rate = self.rate * factor + increase
+            self.rate = max(self.min_rate, min(self.max_rate, rate))
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + block_seconds
+            )
+
+    def get_rate(self) -> float:
+        with self.lock:
+            return self.rate
+
+
+class PostgresTokenBucket:
+    """
+    Token bucket stored in the search_crawlerratelimit table, so every worker
+    crawling the same host spends from the same budget.
+    `connect` returns a context manager that yields a DB-API connection and
+    commits when it exits.
+    """
+
+    take_sql = """
+        WITH bucket AS (
+            SELECT
+                host,
+                LEAST(
+                    %(burst)s,
+                    tokens + GREATEST(
+                        0, EXTRACT(EPOCH FROM clock_timestamp() - updated_at)
+                    ) * rate
+                ) AS tokens,
+                rate,
+                GREATEST(
+                    0, EXTRACT(EPOCH FROM blocked_until - clock_timestamp())
+                ) AS blocked_seconds
+            FROM search_crawlerratelimit
+            WHERE host = %(host)s
+            FOR UPDATE
+        )
+        UPDATE search_crawlerratelimit AS rate_limit
+        SET
+            tokens = CASE
+                WHEN bucket.blocked_seconds = 0 AND bucket.tokens >= 1
+                THEN bucket.tokens - 1
+                ELSE bucket.tokens
+            END,
+            updated_at = clock_timestamp()
+        FROM bucket
+        WHERE rate_limit.host = bucket.host
+        RETURNING bucket.tokens, bucket.rate, bucket.blocked_seconds
+    """
+
+    adjust_sql = """
+        UPDATE search_crawlerratelimit
+        SET
+            rate = GREATEST(
+                %(min_rate)s, LEAST(%(max_rate)s, rate * %(factor)s + %(increase)s)
+            ),
+            blocked_until = GREATEST(
+                blocked_until,
+                clock_timestamp() + %(block_seconds)s * INTERVAL '1 second'
+            )
+        WHERE host = %(host)s
+    """
+
+    insert_sql = """
+        INSERT INTO search_crawlerratelimit (host, tokens, rate, updated_at, blocked_until)
+        VALUES (%(host)s, 1, %(rate)s, clock_timestamp(), clock_timestamp())
+        ON CONFLICT (host) DO NOTHING
+    """
+
+    def __init__(
+        self,
+        host: str,
+        connect: Callable[[], ContextManager[Any]],
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+    ):
+        self.host = host
+        self.connect = connect
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+
+        self.execute(self.insert_sql, {"host": host, "rate": rate})
+
+    def execute(self, sql: str, params: Dict) -> Optional[Tuple]:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchone() if cursor.description else None
+            finally:
+                cursor.close()
+
+    def take(self, burst: float) -> float:
+        row = self.execute(self.take_sql, {"host": self.host, "burst": burst})
+        if row is None:
+            return 0.0
+
+        tokens, rate, blocked_seconds = (float(value) for value in row)
+        if blocked_seconds > 0:
+            return blocked_seconds
+
+        if tokens < 1:
+            return (1 - tokens) / rate
+
+        return 0.0
+
+    def adjust(self, factor: float, increase: float, block_seconds: float = 0.0):
+        self.execute(
+            self.adjust_sql,
+            {
+                "host": self.host,
+                "min_rate": self.min_rate,
+                "max_rate": self.max_rate,
+                "factor": factor,
+                "increase": increase,
+                "block_seconds": block_seconds,
+            },
+        )
+
+    def get_rate(self) -> float:
+        row = self.execute(
+            "SELECT rate FROM search_crawlerratelimit WHERE host = %(host)s",
+            {"host": self.host},
+        )
+        return float(row[0]) if row else self.min_rate
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as a HTTP date"""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests to a host spend tokens from a bucket refilled at `rate` per second.
+    The rate grows additively while the host answers fast and is cut in half
+    when it gets slow or answers 429/5xx. Retry-After stops new requests for
+    the given time.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        burst: float = 2.0,
+        increase: float = 0.1,
+        decrease_factor: float = 0.5,
+        slow_response_seconds: float = 3.0,
+        latency_spike_factor: float = 3.0,
+        max_retry_after: float = 300.0,
+    ):
+        self.bucket = bucket
+        self.burst = burst
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.slow_response_seconds = slow_response_seconds
+        self.latency_spike_factor = latency_spike_factor
+        self.max_retry_after = max_retry_after
+
+        self.lock = threading.Lock()
+        # moving average of the response time of the host
+        self.latency = None
+        self.last_decrease = 0.0
+        self.waited_seconds = 0.0
+
+    def acquire(self):
+        """Block until a request to the host is allowed"""
+        while True:
+            wait = self.bucket.take(self.burst)
+            if wait <= 0:
+                return
+
+            with self.lock:
+                self.waited_seconds += wait
+            time.sleep(wait)
+
+    def is_slow(self, elapsed: float) -> bool:
+        with self.lock:
+            average = self.latency
+            if average is None:
+                self.latency = elapsed
+            else:
+                self.latency = 0.8 * average + 0.2 * elapsed
+
+        if elapsed >= self.slow_response_seconds:
+            return True
+
+        return average is not None and elapsed > average * self.latency_spike_factor
+
+    def record_response(
+        self,
+        status_code: Optional[int],
+        elapsed: float,
+        retry_after: Optional[str] = None,
+    ):
+        """Adapt the rate to a response, status_code is None when the request failed"""
+        block_seconds = parse_retry_after(retry_after) or 0.0
+        block_seconds = min(block_seconds, self.max_retry_after)
+
+        throttled = status_code is None or status_code == 429 or status_code >= 500
+        if not throttled and not self.is_slow(elapsed):
+            self.bucket.adjust(1.0, self.increase)
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            # responses of requests sent before the last decrease are already
+            # accounted for, cut the rate at most once per second
+            decrease = now - self.last_decrease >= 1.0
+            if decrease:
+                self.last_decrease = now
+
+        if decrease or block_seconds:
+            factor = self.decrease_factor if decrease else 1.0
+            self.bucket.adjust(factor, 0.0, block_seconds)
+
+
+rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+rate_limit_connection_factory = None
+
+
+def set_rate_limit_connection_factory(connect: Callable[[], ContextManager[Any]]):
+    """Connection used when ISC_RATE_LIMIT_BACKEND is postgres"""
+    global rate_limit_connection_factory
+    rate_limit_connection_factory = connect
+
+
+def get_rate_limiter(host: str) -> AdaptiveRateLimiter:
+    """Rate limiter of a host, shared by every crawler of the process"""
+    with rate_limiters_lock:
+        rate_limiter = rate_limiters.get(host)
+        if rate_limiter is not None:
+            return rate_limiter
+
+        rate = float(os.environ.get("ISC_RATE_LIMIT_RATE", 3.0))
+        min_rate = float(os.environ.get("ISC_RATE_LIMIT_MIN_RATE", 0.5))
+        max_rate = float(os.environ.get("ISC_RATE_LIMIT_MAX_RATE", 10.0))
+        backend = os.environ.get("ISC_RATE_LIMIT_BACKEND", "local")
+
+        if backend == "postgres" and rate_limit_connection_factory is not None:
+            bucket = PostgresTokenBucket(
+                host, rate_limit_connection_factory, rate, min_rate, max_rate
+            )
+        else:
+            bucket = LocalTokenBucket(rate, min_rate, max_rate)
+
+        rate_limiter = AdaptiveRateLimiter(
+            bucket,
+            burst=float(os.environ.get("ISC_RATE_LIMIT_BURST", 2.0)),
+        )
+        rate_limiters[host] = rate_limiter
+        return rate_limiter
+
+
+class CircuitBreaker:
+    """
+    Stop requests to a host after `failure_threshold` consecutive failures.
+    After `reset_seconds` one request is let through, the circuit closes
+    again if it succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+
+                self.state = self.HALF_OPEN
+                return True
+
+            # half open, a trial request is already in flight
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Opening circuit after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """Circuit breaker of a host, shared by every crawler of the process"""
+    with circuit_breakers_lock:
+        circuit_breaker = circuit_breakers.get(host)
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(
+                failure_threshold=int(
+                    os.environ.get("ISC_CIRCUIT_FAILURE_THRESHOLD", 5)
+                ),
+                reset_seconds=float(os.environ.get("ISC_CIRCUIT_RESET_SECONDS", 30)),
+            )
+            circuit_breakers[host] = circuit_breaker
+
+        return circuit_breaker
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def get_response(
+    session: requests.Session,
+    url: str,
+    headers: Dict,
+    timeout: int = 10,
+) -> requests.Response:
+    """Send a GET respecting rate limit and circuit breaker of the host"""
+    host = urlparse(url).netloc
+
+    circuit_breaker = get_circuit_breaker(host)
+    if not circuit_breaker.allow_request():
+        raise CircuitOpenError(host)
+
+    rate_limiter = get_rate_limiter(host)
+    rate_limiter.acquire()
+
+    start = time.monotonic()
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+    except Exception as e:
+        rate_limiter.record_response(None, time.monotonic() - start)
+        circuit_breaker.record_failure()
+        raise HTTPRequestError(f"Error to get {url}. Error: {e}")
+
+    rate_limiter.record_response(
+        response.status_code,
+        time.monotonic() - start,
+        response.headers.get("retry-after"),
+    )
+
+    if is_retryable_status(response.status_code):
+        circuit_breaker.record_failure()
+    else:
+        circuit_breaker.record_success()
+
+    return response
+
+
+def check_response(url: str, response: requests.Response):
+    if response.status_code != 200:
+        raise HTTPRequestError(
+            f"Get request to {url} not succeed. Status: {response.status_code}",
+            retryable=is_retryable_status(response.status_code),
+        )
+
+
+def get_backoff(attempt: int) -> float:
+    """Seconds to wait before the next attempt, exponential with full jitter"""
+    backoff = float(os.environ.get("ISC_HTTP_BACKOFF", 0.5))
+    max_backoff = float(os.environ.get("ISC_HTTP_MAX_BACKOFF", 10.0))
+    return random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+
+
+def fetch(
+    session: requests.Session,
+    url: str,
+    headers: Dict,
+    timeout: int = 10,
+    http_cache: Optional[HTTPCache] = None,
+    retries: Optional[int] = None,
+) -> FetchResult:
+    """GET used by the ISC webcrawlers, retrying timeouts, 429 and 5xx"""
+    if retries is None:
+        retries = int(os.environ.get("ISC_HTTP_RETRIES", 3))
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if http_cache is not None:
+                body = http_cache.fetch(session, url, headers, timeout)
+            else:
+                response = get_response(session, url, headers, timeout)
+                check_response(url, response)
+                body = response.text
+
+        except HTTPRequestError as e:
+            if not e.retryable or attempt > retries:
+                print(f"Failed to get {url} after {attempt} attempts. Error: {e}")
+                return FetchResult(None, FetchStatus.FAILED, attempt, str(e))
+
+            backoff = get_backoff(attempt)
+            print(f"Retrying {url} in {backoff:.2f}s. Error: {e}")
+            time.sleep(backoff)
+            continue
+
+        status = FetchStatus.FETCHED if attempt == 1 else FetchStatus.RETRIED
+        return FetchResult(body, status, attempt)
+
+
+def http_get(
+    session: requests.Session,
+    url: str,
+    headers: Dict,
+    timeout: int = 10,
+    http_cache: Optional[HTTPCache] = None,
+) -> Optional[str]:
+    """Body of the page or None when it could not be fetched"""
+    return fetch(session, url, headers, timeout=timeout, http_cache=http_cache).body
+
+
+default_http_cache = None
+default_http_cache_lock = threading.Lock()
+
+
+def get_default_http_cache() -> Optional[HTTPCache]:
+    """HTTP cache configured by environment, None when ISC_HTTP_CACHE_DIR is not set"""
+    global default_http_cache
+
+    directory = os.environ.get("ISC_HTTP_CACHE_DIR", "")
+    if not directory:
+        return None
+
+    with default_http_cache_lock:
+        if default_http_cache is None:
+            default_http_cache = HTTPCache(
+                directory=directory,
+                ttl=int(os.environ.get("ISC_HTTP_CACHE_TTL", 900)),
+                max_size=int(os.environ.get("ISC_HTTP_CACHE_MAX_SIZE", 512 * 1024**2)),
+            )
+
+    return default_http_cache
+
+
+class HTTPSessionStats:
+    """Requests, bytes on the wire and decoded bytes of the shared session"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def increment(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self, connections: int = 0) -> Dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": connections,
+                "connection_reuse_rate": (
+                    1 - connections / self.requests if self.requests else 0.0
+                ),
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded,
+                "compression_ratio": (
+                    self.bytes_decoded / self.bytes_received
+                    if self.bytes_received
+                    else 0.0
+                ),
+            }
+
+
+class HTTPSessionFactory:
+    """
+    Sessions for the crawlers, one per thread since requests.Session is not
+    thread safe. All of them share the same connection pool, so keep-alive
+    connections are reused by every crawl of the process.
+    """
+
+    def __init__(self, pool_size: int = 32):
+        # retries are done by fetch(), not by urllib3
+        self.adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=0
+        )
+        # gzip and deflate, br when brotli is installed
+        self.accept_encoding = make_headers(accept_encoding=True)["accept-encoding"]
+        self.stats = HTTPSessionStats()
+        self.local = threading.local()
+
+    def get_session(self) -> requests.Session:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            session.headers["accept-encoding"] = self.accept_encoding
+            session.hooks["response"].append(self.record_response)
+            self.local.session = session
+
+        return session
+
+    def record_response(self, response: requests.Response, *args, **kwargs):
+        # reading content here is free, responses are not streamed
+        bytes_decoded = len(response.content)
+        self.stats.increment(
+            requests=1,
+            bytes_received=response.raw.tell(),
+            bytes_decoded=bytes_decoded,
+        )
+
+    def count_connections(self) -> int:
+        """Connections opened by all pools, requests beyond it reused one"""
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def get_stats(self) -> Dict:
+        return self.stats.as_dict(connections=self.count_connections())
+
+
+default_session_factory = None
+default_session_factory_lock = threading.Lock()
+
+
+def get_session_factory() -> HTTPSessionFactory:
+    global default_session_factory
+
+    with default_session_factory_lock:
+        if default_session_factory is None:
+            default_session_factory = HTTPSessionFactory(
+                pool_size=int(os.environ.get("ISC_HTTP_POOL_SIZE", 32))
+            )
+
+    return default_session_factory
+
+
+def get_session() -> requests.Session:
+    """Session of the current thread, backed by the process connection pool"""
+    return get_session_factory().get_session()
@@ -1,14 +1,39 @@
 #!/bin/env python3
 
-import requests
 from bs4 import (
     BeautifulSoup,
     element,
 )
-from typing import Optional, List, Generator, Tuple, Union
-import time
+from lxml import etree, html as lxml_html
+from typing import Optional, List, Generator, Tuple, Union, Callable, Iterator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import itertools
+import math
 import re
 
+from webcrawler_http import (
+    FetchResult,
+    FetchStatus,
+    HTTPCache,
+    fetch,
+    get_default_http_cache,
+    get_session,
+    http_get,
+)
+
+ISC_REQUEST_HEADERS = {
+    "accept": "*/*",
+    "accept-language": "en-US,en;q=0.9,pt;q=0.8,pt-BR;q=0.7",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-origin",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
+    "x-requested-with": "XMLHttpRequest",
+}
+
 
 class WebsiteISCAgencyInfo:
     name: str = ""
@@ -79,6 +104,7 @@ class WebsiteISCFilter:
     max_price: str = ""
     min_area: str = ""
     max_area: str = ""
+    order: str = ""
 
     def __init__(
         self,
@@ -93,6 +119,7 @@ class WebsiteISCFilter:
         max_price: str,
         min_area: str,
         max_area: str,
+        order: str = "",
     ):
         self.property_type = property_type
         self.transaction_type = transaction_type
@@ -105,16 +132,57 @@ class WebsiteISCFilter:
         self.max_price = max_price
         self.min_area = min_area
         self.max_area = max_area
+        self.order = order
 
     def build_url_path(self) -> str:
         pass
 
+    def split(self, parts: int) -> List["WebsiteISCFilter"]:
+        """
+        Split the filter in up to `parts` filters by price range, or by area when
+        the price range is too narrow. Neighbor ranges share their limit so no
+        real estate falls between them, duplicates must be removed by code.
+        """
+        for min_field, max_field in [
+            ("min_price", "max_price"),
+            ("min_area", "max_area"),
+        ]:
+            min_value = int(getattr(self, min_field))
+            max_value = int(getattr(self, max_field))
+            if max_value - min_value < parts or parts < 2:
+                continue
+
+            limits = [
+                min_value + round(i * (max_value - min_value) / parts)
+                for i in range(parts + 1)
+            ]
+
+            filters = []
+            for shard_min, shard_max in zip(limits, limits[1:]):
+                shard_filter = copy.copy(self)
+                setattr(shard_filter, min_field, shard_min)
+                setattr(shard_filter, max_field, shard_max)
+                filters.append(shard_filter)
+
+            return filters
+
+        return [self]
+
+
+class WebsiteISCOrder:
+    """Orderings accepted by the result pages, empty keeps the site default"""
+
+    RELEVANCE = ""
+    NEWEST = "mais-recentes"
+
 
 class WebsiteISCPageContent:
     real_estate_list: List[WebsiteISCRealEstateInfo] = []
     total: int = 0
     page: int = 0
     total_pages: int = 0
+    fetch_status: str = FetchStatus.FETCHED
+    fetch_attempts: int = 1
 
     def __init__(
         self,
@@ -122,29 +190,123 @@ class WebsiteISCPageContent:
         total: int,
         page: int,
         total_pages: int,
+        fetch_status: str = FetchStatus.FETCHED,
+        fetch_attempts: int = 1,
     ):
         self.real_estate_list = real_estate_list
         self.total = total
         self.page = page
         self.total_pages = total_pages
+        self.fetch_status = fetch_status
+        self.fetch_attempts = fetch_attempts
+
+
+class WebsiteISCParser:
+    """Backends available to extract real estates from a result page"""
+
+    # lxml tree, every field of an article is read in one walk
+    SINGLE_PASS = "single_pass"
+    # BeautifulSoup tree, one find() per field
+    LEGACY = "legacy"
+
+
+class WebsiteISCParsedPage:
+    """Result page parsed once and shared by the pagination and listing extraction"""
+
+    def __init__(self, page: Optional[str], parser: str):
+        self.parser = parser
+        self.tree = None
+
+        if page is None:
+            return
+
+        try:
+            if parser == WebsiteISCParser.LEGACY:
+                self.tree = BeautifulSoup(page, "html.parser")
+            else:
+                self.tree = lxml_html.fromstring(page)
+        except Exception:
+            print("Failed to parsers page")
+
+    def release(self):
+        # real estate info only keeps plain strings, so the tree can go as soon
+        # as the listings are extracted instead of piling up on long crawls
+        if isinstance(self.tree, BeautifulSoup):
+            self.tree.decompose()
+
+        self.tree = None
+
+
+class WebsiteISCArticleState:
+    """Fields collected while walking a listing article in a single pass"""
+
+    def __init__(self):
+        self.imovel_data = None
+        self.carousel = None
+        self.extra = None
+        self.in_extra = False
+        self.extra_text = None
+        self.meta = {}
+        self.url = None
+        self.url_found = False
+        self.agency = None
+        self.agency_found = False
+        self.features = {}
+        self.image_urls = []
 
 
 class WebcrawlerISCRealEstate:
     base_url = "https://www.imoveis-sc.com.br"
 
-    def __init__(self):
-        self.headers = {
-            "accept": "*/*",
-            "accept-language": "en-US,en;q=0.9,pt;q=0.8,pt-BR;q=0.7",
-            "sec-ch-ua-platform": '"Windows"',
-            "sec-fetch-dest": "empty",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-site": "same-origin",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
-            "x-requested-with": "XMLHttpRequest",
-        }
-
-        self.session = requests.session()
+    # same articles the legacy parser finds with class_=re.compile(r"imovel")
+    listing_xpath = etree.XPath('//article[contains(@class, "imovel")]')
+    header_data_xpath = etree.XPath(
+        '//div[contains(concat(" ", normalize-space(@class), " "), " header-data ")]'
+    )
+    count_xpath = etree.XPath(
+        './/span[contains(concat(" ", normalize-space(@class), " "), " lista-imovel-count ")]'
+    )
+    navigation_xpath = etree.XPath(
+        '//div[contains(concat(" ", normalize-space(@class), " "), " navigation ")]'
+    )
+
+    # itemprop of meta tags inside imovel-data mapped to the info field
+    meta_fields = {
+        "model": "model",
+        "sku": "code",
+        "name": "summary",
+        "lowprice": "price",
+    }
+
+    # icon class inside the <li> that holds a feature mapped to the info field
+    feature_icons = {
+        "mdi-bed-king-outline": "bedrooms",
+        "mdi-shower": "suite",
+        "mdi-car": "garage_slots",
+        "mdi-arrow-expand": "space",
+    }
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        parser: str = WebsiteISCParser.SINGLE_PASS,
+        http_cache: Optional[HTTPCache] = None,
+        shard_pages: int = 0,
+    ):
+        # number of result pages fetched at the same time once the last page
+        # is known, 1 keeps the sequential crawl. The request rate is limited
+        # per host by the rate limiter in webcrawler_http
+        self.max_workers = max(1, max_workers)
+        self.parser = parser
+        self.http_cache = http_cache or get_default_http_cache()
+        # searches with more pages than this are split by price range and the
+        # ranges crawled at the same time, 0 disables it
+        self.shard_pages = shard_pages
+        # last page of a crawl stopped before the last result page, 0 crawls
+        # every page
+        self.end_page = 0
+
+        self.headers = ISC_REQUEST_HEADERS
 
     def set_filter(self, filter: WebsiteISCFilter):
         self.filter = filter
@@ -222,82 +384,385 @@ class WebcrawlerISCRealEstate:
             path += "vagas="
             path += tmp_path
 
+        if self.filter.order:
+            path += f"&ordenacao={self.filter.order}"
+
         self.url = f"{self.base_url}/{path}"
         print(f"Webcrawler url: {self.url}")
 
     def crawl(
         self,
+        is_known_page: Optional[Callable[[WebsiteISCPageContent], bool]] = None,
+        known_pages_to_stop: int = 2,
+        start_page: int = 1,
+        end_page: int = 0,
     ) -> Generator[WebsiteISCPageContent]:
-        self.page = 1
+        """
+        Yield every result page of the filter.
+        In incremental mode, when `is_known_page` is given, the crawl stops after
+        `known_pages_to_stop` consecutive pages where it returns True. It is
+        meant for filters ordered by newest, where the known listings are at
+        the end.
+        A crawl interrupted before is resumed with `start_page`, the pages
+        before it are not yielded. With `end_page` the crawl stops after that
+        page, no page after it is requested.
+        """
+        self.page = max(1, start_page)
+        self.end_page = end_page
         self.page_last = -1
         self.real_estate_count = -1
         self.real_estate_list = []
 
-        while True:
-            response = self.make_request()
+        if is_known_page is None:
+            if self.shard_pages > 0:
+                yield from self.crawl_sharded(self.page)
+            else:
+                yield from self.crawl_pages(self.max_workers)
+            return
 
-            # TODO - check if None is on response
+        # do not fetch pages far ahead of the point the crawl may stop
+        page_contents = self.crawl_pages(min(self.max_workers, known_pages_to_stop))
+        known_pages = 0
+        try:
+            for page_content in page_contents:
+                if page_content.fetch_status != FetchStatus.FAILED and is_known_page(
+                    page_content
+                ):
+                    known_pages += 1
+                else:
+                    known_pages = 0
+
+                yield page_content
+
+                if known_pages >= known_pages_to_stop:
+                    print(
+                        f"Stopping at page {page_content.page} of {self.page_last}, "
+                        f"last {known_pages} pages are already known"
+                    )
+                    break
+        finally:
+            page_contents.close()
+
+    def crawl_pages(self, max_workers: int) -> Generator[WebsiteISCPageContent]:
+        if max_workers > 1:
+            yield from self.crawl_concurrent(max_workers)
+            return
 
-            if self.page_last == -1 or self.real_estate_count == -1:
-                [self.real_estate_count, self.page_last] = (
-                    self.get_total_and_last_page_number(response)
-                )
+        while True:
+            fetch_result = self.make_request(page=self.page)
 
-            print(f"Querying page {self.page} of {self.page_last}")
+            yield self.build_page_content(self.page, fetch_result)
 
-            tmp_real_estate_list = self.extract_info(response)
+            # without the first page the number of pages is unknown
+            if self.page_last == -1:
+                break
 
-            if tmp_real_estate_list is None:
-                tmp_real_estate_list = []
+            self.page += 1
 
-            print(f"Page: {self.page} - Real estate count: {len(tmp_real_estate_list)}")
+            if self.page > self.get_end_page():
+                break
 
-            page_content = WebsiteISCPageContent(
-                real_estate_list=tmp_real_estate_list,
+    def crawl_concurrent(
+        self,
+        max_workers: int,
+    ) -> Generator[WebsiteISCPageContent]:
+        # the first page is needed to know how many pages the search has
+        fetch_result = self.make_request(page=self.page)
+        yield self.build_page_content(self.page, fetch_result)
+
+        yield from self.crawl_next_pages(max_workers)
+
+    def get_end_page(self) -> int:
+        """Last page to crawl, the last result page unless end_page is before it"""
+        if self.end_page > 0:
+            return min(self.end_page, self.page_last)
+        return self.page_last
+
+    def crawl_next_pages(self, max_workers: int) -> Generator[WebsiteISCPageContent]:
+        """Crawl the pages after the current one, once the last page is known"""
+        end_page = self.get_end_page()
+        if end_page <= self.page:
+            return
+
+        page_requests = ((self, page) for page in range(self.page + 1, end_page + 1))
+        for _, page, fetch_result in self.fetch_pages(page_requests, max_workers):
+            self.page = page
+            yield self.build_page_content(page, fetch_result)
+
+    def fetch_pages(
+        self,
+        page_requests: Iterator[Tuple["WebcrawlerISCRealEstate", int]],
+        max_workers: int,
+    ) -> Generator[Tuple["WebcrawlerISCRealEstate", int, FetchResult]]:
+        """Fetch (crawler, page) requests concurrently, results keep the request order"""
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # keep at most max_workers requests in flight, so a consumer that
+            # stops early does not trigger requests for the remaining pages
+            for crawler, page in page_requests:
+                pending.append(
+                    (crawler, page, executor.submit(crawler.make_request, page))
+                )
+                if len(pending) >= max_workers:
+                    break
+
+            try:
+                while pending:
+                    crawler, page, future = pending.popleft()
+                    fetch_result = future.result()
+
+                    next_request = next(page_requests, None)
+                    if next_request is not None:
+                        next_crawler, next_page = next_request
+                        pending.append(
+                            (
+                                next_crawler,
+                                next_page,
+                                executor.submit(next_crawler.make_request, next_page),
+                            )
+                        )
+
+                    yield crawler, page, fetch_result
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def crawl_sharded(self, start_page: int = 1) -> Generator[WebsiteISCPageContent]:
+        """
+        Crawl a search with many pages as several searches split by price range,
+        so all workers are used and no shard goes deeper than shard_pages.
+        Pages are numbered in the order they are yielded and real estates found
+        in more than one shard are yielded once.
+        The shards are planned again on resume, so page 1 of the search and
+        of every shard is fetched even when it is before `start_page`.
+        """
+        if start_page > 1:
+            # a search too small to be sharded resumes without fetching page 1
+            resumed_page = self.build_page_content(
+                start_page, self.make_request(page=start_page)
+            )
+            if (
+                resumed_page.fetch_status == FetchStatus.FAILED
+                or self.page_last <= self.shard_pages
+            ):
+                yield resumed_page
+                yield from self.crawl_next_pages(self.max_workers)
+                return
+
+        first_page = self.build_page_content(1, self.make_request(page=1))
+        if first_page.fetch_status == FetchStatus.FAILED:
+            yield first_page
+            return
+
+        shards = self.plan_shards(self, first_page)
+        print(f"Crawling {len(shards)} shards of up to {self.shard_pages} pages")
+
+        # a shard whose page 1 failed counts as one page
+        total_pages = sum(max(crawler.page_last, 1) for crawler, _ in shards)
+        if shards[0][0] is not self:
+            total_pages += 1
+
+        seen_codes = set()
+        page_number = 0
+
+        def renumber(page_content: WebsiteISCPageContent) -> WebsiteISCPageContent:
+            nonlocal page_number
+            page_number += 1
+
+            real_estate_list = []
+            for real_estate in page_content.real_estate_list:
+                if real_estate.code not in seen_codes:
+                    seen_codes.add(real_estate.code)
+                    real_estate_list.append(real_estate)
+
+            return WebsiteISCPageContent(
+                real_estate_list=real_estate_list,
                 total=self.real_estate_count,
-                page=self.page,
-                total_pages=self.page_last,
+                page=page_number,
+                total_pages=total_pages,
+                fetch_status=page_content.fetch_status,
+                fetch_attempts=page_content.fetch_attempts,
             )
 
-            yield page_content
+        # page 1 of the whole search goes first, it has the total of real estates
+        first_pages = [first_page] + [
+            shard_first_page
+            for crawler, shard_first_page in shards
+            if crawler is not self
+        ]
+        for page_content in first_pages:
+            if page_number + 1 >= start_page:
+                yield renumber(page_content)
+            else:
+                # finished by the crawl being resumed
+                page_number += 1
+                seen_codes.update(
+                    real_estate.code for real_estate in page_content.real_estate_list
+                )
 
-            self.page += 1
+        page_requests = (
+            (crawler, page)
+            for crawler, _ in shards
+            for page in range(2, crawler.page_last + 1)
+        )
+        skip_pages = max(start_page - 1 - page_number, 0)
+        page_requests = itertools.islice(page_requests, skip_pages, None)
+        page_number += skip_pages
+        for crawler, page, fetch_result in self.fetch_pages(
+            page_requests, self.max_workers
+        ):
+            crawler.page = page
+            yield renumber(crawler.build_page_content(page, fetch_result))
+
+    def plan_shards(
+        self,
+        crawler: "WebcrawlerISCRealEstate",
+        first_page: WebsiteISCPageContent,
+        depth: int = 0,
+    ) -> List[Tuple["WebcrawlerISCRealEstate", WebsiteISCPageContent]]:
+        """Split the search of crawler until every shard has up to shard_pages pages"""
+        # a price with many real estates can not be split, stop at some point
+        if (
+            first_page.fetch_status == FetchStatus.FAILED
+            or crawler.page_last <= self.shard_pages
+            or depth >= 4
+        ):
+            return [(crawler, first_page)]
+
+        parts = min(math.ceil(crawler.page_last / self.shard_pages), 16)
+        shard_filters = crawler.filter.split(parts)
+        if len(shard_filters) < 2:
+            return [(crawler, first_page)]
+
+        shard_crawlers = []
+        for shard_filter in shard_filters:
+            shard_crawler = WebcrawlerISCRealEstate(
+                parser=self.parser, http_cache=self.http_cache
+            )
+            shard_crawler.set_filter(shard_filter)
+            shard_crawler.page = 1
+            shard_crawler.page_last = -1
+            shard_crawler.real_estate_count = -1
+            shard_crawlers.append(shard_crawler)
+
+        # page 1 of every shard tells how many pages it has
+        shards = []
+        page_requests = iter([(shard_crawler, 1) for shard_crawler in shard_crawlers])
+        for shard_crawler, page, fetch_result in self.fetch_pages(
+            page_requests, self.max_workers
+        ):
+            shard_first_page = shard_crawler.build_page_content(page, fetch_result)
+            shards += self.plan_shards(shard_crawler, shard_first_page, depth + 1)
+
+        return shards
+
+    def build_page_content(
+        self,
+        page: int,
+        fetch_result: FetchResult,
+    ) -> WebsiteISCPageContent:
+        if fetch_result.status == FetchStatus.FAILED:
+            print(f"Skipping page {page}. Error: {fetch_result.error}")
+            return WebsiteISCPageContent(
+                real_estate_list=[],
+                total=max(self.real_estate_count, 0),
+                page=page,
+                total_pages=max(self.page_last, 0),
+                fetch_status=fetch_result.status,
+                fetch_attempts=fetch_result.attempts,
+            )
 
-            if self.page > self.page_last:
-                break
+        parsed_page = self.parse_page(fetch_result.body)
+
+        if self.page_last == -1 or self.real_estate_count == -1:
+            [self.real_estate_count, self.page_last] = (
+                self.get_total_and_last_page_number(parsed_page)
+            )
+
+        print(f"Querying page {page} of {self.page_last}")
+
+        tmp_real_estate_list = self.extract_info(parsed_page)
+        parsed_page.release()
 
-            time.sleep(0.3)
+        if tmp_real_estate_list is None:
+            tmp_real_estate_list = []
+
+        print(f"Page: {page} - Real estate count: {len(tmp_real_estate_list)}")
+
+        page_content = WebsiteISCPageContent(
+            real_estate_list=tmp_real_estate_list,
+            total=self.real_estate_count,
+            page=page,
+            total_pages=self.page_last,
+            fetch_status=fetch_result.status,
+            fetch_attempts=fetch_result.attempts,
+        )
+
+        return page_content
+
+    def parse_page(self, page: Optional[str]) -> WebsiteISCParsedPage:
+        return WebsiteISCParsedPage(page, self.parser)
 
     def get_total_and_last_page_number(
         self,
-        page_content: str = "",
+        page_content: Union[str, WebsiteISCParsedPage] = "",
     ) -> Tuple[int, int]:
         total_number_real_estate = 0
         total_number_pages = 0
 
-        soup = BeautifulSoup(
-            page_content,
-            "html.parser",
-        )
+        if isinstance(page_content, WebsiteISCParsedPage):
+            parsed_page = page_content
+        else:
+            parsed_page = self.parse_page(page_content)
+
+        if parsed_page.tree is None:
+            return [total_number_real_estate, 1]
+
+        if parsed_page.parser == WebsiteISCParser.LEGACY:
+            soup = parsed_page.tree
+
+            header_data = soup.find("div", class_="header-data")
+            count_span = None
+            if header_data:
+                count_span = header_data.find("span", class_="lista-imovel-count")
+            count_text = count_span.text if count_span else None
+
+            # get total number of pages
+            navigation_div = soup.find(
+                "div",
+                class_="navigation",
+            )
+            navigation_text = (
+                navigation_div.get_text(strip=True) if navigation_div else None
+            )
 
-        header_data = soup.find("div", class_="header-data")
-        if header_data:
-            count_span = header_data.find("span", class_="lista-imovel-count")
-            total_number_real_estate = int(count_span.text.strip()) if count_span else 0
         else:
-            total_number_real_estate = 0
+            root = parsed_page.tree
+
+            header_data = next(iter(self.header_data_xpath(root)), None)
+            count_span = None
+            if header_data is not None:
+                count_span = next(iter(self.count_xpath(header_data)), None)
+            count_text = count_span.text_content() if count_span is not None else None
+
+            # get total number of pages, text joined as get_text(strip=True) does
+            navigation_div = next(iter(self.navigation_xpath(root)), None)
+            navigation_text = None
+            if navigation_div is not None:
+                navigation_text = "".join(
+                    text.strip() for text in navigation_div.itertext()
+                )
 
-        # get total number of pages
-        navigation_div = soup.find(
-            "div",
-            class_="navigation",
-        )
+        if count_text is not None:
+            total_number_real_estate = int(count_text.strip())
+        else:
+            total_number_real_estate = 0
 
-        if navigation_div:
-            navigation_div = navigation_div.get_text(strip=True)
+        if navigation_text is not None:
             match = re.search(
                 r"de \d+",
-                navigation_div,
+                navigation_text,
             )
 
             if match:
@@ -312,32 +777,173 @@ class WebcrawlerISCRealEstate:
 
         return [total_number_real_estate, total_number_pages]
 
-    def make_request(self) -> Optional[str]:
+    def make_request(self, page: Optional[int] = None) -> FetchResult:
+        if page is None:
+            page = self.page
+
         url = self.url
-        if self.page > 1:
-            url += f"&page={self.page}"
+        if page > 1:
+            url += f"&page={page}"
 
-        try:
-            response = self.session.get(url, headers=self.headers, timeout=10)
-        except Exception as e:
-            print(f"Error to get {url}. Error: ", e)
+        return fetch(
+            get_session(), url, self.headers, timeout=10, http_cache=self.http_cache
+        )
+
+    def extract_info(
+        self,
+        page: Union[str, WebsiteISCParsedPage] = "",
+    ) -> List[WebsiteISCRealEstateInfo]:
+        if isinstance(page, WebsiteISCParsedPage):
+            parsed_page = page
+        else:
+            parsed_page = self.parse_page(page)
+
+        if parsed_page.tree is None:
             return None
 
-        if response.status_code != 200:
-            print(f"Get request not succeed. Reason: {response.text}")
+        if parsed_page.parser == WebsiteISCParser.LEGACY:
+            return self.extract_info_legacy(parsed_page.tree)
+
+        imoveis_tree = self.listing_xpath(parsed_page.tree)
+
+        if len(imoveis_tree) == 0:
             return None
 
-        return response.text
+        real_estate_list = []
+        for imovel_article in imoveis_tree:
+            real_estate_list.append(self.parse_article(imovel_article))
 
-    def extract_info(
+        return real_estate_list
+
+    def parse_article(
         self,
-        page: str = "",
-    ) -> List[WebsiteISCRealEstateInfo]:
-        soup = BeautifulSoup(
-            page,
-            "html.parser",
+        imovel_article: etree._Element,
+    ) -> WebsiteISCRealEstateInfo:
+        state = WebsiteISCArticleState()
+
+        # Visit every element of the article once, keeping the first match of
+        # each field as the legacy find() calls do. li_stack holds
+        # [li, first strong text, pending fields] for each open <li>.
+        in_data = False
+        in_carousel = False
+        li_stack = []
+
+        for event, el in etree.iterwalk(imovel_article, events=("start", "end")):
+            tag = el.tag
+            if not isinstance(tag, str):
+                # comments and processing instructions
+                continue
+
+            if event == "end":
+                if el is state.imovel_data:
+                    in_data = False
+                elif el is state.carousel:
+                    in_carousel = False
+
+                if el is state.extra:
+                    state.in_extra = False
+                    if state.extra_text is None:
+                        # imovel-extra without <strong>, legacy parser gives up too
+                        state.extra_text = ""
+
+                if li_stack and li_stack[-1][0] is el:
+                    _, strong_text, fields = li_stack.pop()
+                    for field in fields:
+                        state.features[field] = strong_text or ""
+
+                continue
+
+            classes = el.get("class", "").split()
+
+            if tag == "img":
+                if in_carousel:
+                    img_url = el.get("data-src")
+                    if img_url:
+                        state.image_urls.append(img_url)
+
+            elif tag == "div":
+                if in_data and state.extra is None and "imovel-extra" in classes:
+                    state.extra = el
+                    state.in_extra = True
+
+                if state.imovel_data is None and "imovel-data" in classes:
+                    state.imovel_data = el
+                    in_data = True
+
+                if state.carousel is None and "imovel-imagem" in el.get("class", ""):
+                    state.carousel = el
+                    in_carousel = True
+
+            elif not in_data:
+                continue
+
+            elif tag == "meta":
+                field = self.meta_fields.get(el.get("itemprop"))
+                if field is not None and field not in state.meta:
+                    state.meta[field] = el.get("content")
+
+            elif tag == "a":
+                if not state.url_found:
+                    state.url = el.get("href")
+                    state.url_found = True
+
+                if not state.agency_found and "imovel-anunciante" in classes:
+                    state.agency = self.get_agency_from_element(el)
+                    state.agency_found = True
+
+            elif tag == "strong":
+                text = None
+                if state.in_extra and state.extra_text is None:
+                    text = el.text_content()
+                    state.extra_text = text
+
+                for li_frame in li_stack:
+                    if li_frame[1] is None:
+                        if text is None:
+                            text = el.text_content()
+                        li_frame[1] = text
+
+            elif tag == "i":
+                for icon_class, field in self.feature_icons.items():
+                    if icon_class in classes and field not in state.features:
+                        # value is filled once the enclosing <li> is closed
+                        state.features[field] = ""
+                        if li_stack:
+                            li_stack[-1][2].append(field)
+
+            elif tag == "li":
+                li_stack.append([el, None, []])
+
+        neighborhood = ""
+        city = ""
+        if state.extra_text is not None:
+            extra_parts = state.extra_text.split(",")
+            city = extra_parts[0].strip()
+            if len(extra_parts) > 1:
+                neighborhood = extra_parts[1].strip()
+
+        imovel_info = WebsiteISCRealEstateInfo(
+            code=state.meta.get("code", ""),
+            model=state.meta.get("model", ""),
+            neighborhood=neighborhood,
+            city=city,
+            summary=state.meta.get("summary", ""),
+            url=state.url if state.url_found else "",
+            bedrooms=state.features.get("bedrooms", ""),
+            suite=state.features.get("suite", ""),
+            garage_slots=state.features.get("garage_slots", ""),
+            space=state.features.get("space", ""),
+            price=state.meta.get("price", ""),
+            agency=state.agency,
+            thumb_urls=state.image_urls,
         )
 
+        return imovel_info
+
+    def extract_info_legacy(
+        self,
+        soup: BeautifulSoup,
+    ) -> List[WebsiteISCRealEstateInfo]:
         # article sections contains description and carousel images
         imoveis_soup = soup.find_all(
             "article",
@@ -576,21 +1182,44 @@ class WebcrawlerISCRealEstate:
         agent_tag = snnipet.find("a", class_="imovel-anunciante")
 
         if agent_tag:
-            link = agent_tag.get("href")
-
-            title = agent_tag.get("title")
-            title = re.sub(r"\s*-\s*\d+(\.\d+)?$", "", title)
-
-            style = agent_tag.get("style", "")
-            match = re.search(r"url\((.*?)\)", style)
-            image_url = match.group(1) if match else None
-
-            agency = WebsiteISCAgencyInfo(title, link, image_url)
-            return agency
+            return self.get_agency_from_element(agent_tag)
 
         else:
             return None
 
+    def get_agency_from_element(
+        self,
+        agent_tag: Union[element.Tag, etree._Element],
+    ) -> WebsiteISCAgencyInfo:
+        link = agent_tag.get("href")
+
+        title = agent_tag.get("title")
+        title = re.sub(r"\s*-\s*\d+(\.\d+)?$", "", title)
+
+        style = agent_tag.get("style", "")
+        match = re.search(r"url\((.*?)\)", style)
+        image_url = match.group(1) if match else None
+
+        agency = WebsiteISCAgencyInfo(title, link, image_url)
+        return agency
+
+
+def parse_result_page(
+    parser: str,
+    page: int,
+    fetch_result: FetchResult,
+    real_estate_count: int,
+    page_last: int,
+) -> WebsiteISCPageContent:
+    """
+    Content of a fetched result page once the number of pages is known. A
+    module level function, so it can run in a worker process.
+    """
+    crawler = WebcrawlerISCRealEstate(parser=parser)
+    crawler.real_estate_count = real_estate_count
+    crawler.page_last = page_last
+    return crawler.build_page_content(page, fetch_result)
+
 
 class WebcrawlerISCAgencyDetailsInfo:
     creci: str = ""
@@ -602,19 +1231,10 @@ class WebcrawlerISCAgencyDetailsInfo:
 
 
 class WebcrawlerISCAgencyDetails:
-    def __init__(self):
-        self.headers = {
-            "accept": "*/*",
-            "accept-language": "en-US,en;q=0.9,pt;q=0.8,pt-BR;q=0.7",
-            "sec-ch-ua-platform": '"Windows"',
-            "sec-fetch-dest": "empty",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-site": "same-origin",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
-            "x-requested-with": "XMLHttpRequest",
-        }
-
-        self.session = requests.session()
+    def __init__(self, http_cache: Optional[HTTPCache] = None):
+        self.http_cache = http_cache or get_default_http_cache()
+
+        self.headers = ISC_REQUEST_HEADERS
 
     def crawl(self, url: str) -> WebcrawlerISCAgencyDetailsInfo:
         self.url = url
@@ -629,17 +1249,13 @@ class WebcrawlerISCAgencyDetails:
         return info
 
     def make_request(self) -> Union[str, None]:
-        try:
-            response = self.session.get(self.url, headers=self.headers, timeout=10)
-        except Exception as e:
-            print(f"Error to get {self.url}. Error: ", e)
-            return None
-
-        if response.status_code != 200:
-            print(f"Get request to {self.url} succeed. Reason: {response.text}")
-            return None
-
-        return response.text
+        return http_get(
+            get_session(),
+            self.url,
+            self.headers,
+            timeout=10,
+            http_cache=self.http_cache,
+        )
 
     def get_creci(self, page_soup) -> Union[str, None]:
 
@@ -684,19 +1300,10 @@ class WebcrawlerISCRealEstateDetailsInfo:
 
 class WebcrawlerISCRealEstateDetails:
 
-    def __init__(self):
-        self.headers = {
-            "accept": "*/*",
-            "accept-language": "en-US,en;q=0.9,pt;q=0.8,pt-BR;q=0.7",
-            "sec-ch-ua-platform": '"Windows"',
-            "sec-fetch-dest": "empty",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-site": "same-origin",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36",
-            "x-requested-with": "XMLHttpRequest",
-        }
-
-        self.session = requests.session()
+    def __init__(self, http_cache: Optional[HTTPCache] = None):
+        self.http_cache = http_cache or get_default_http_cache()
+
+        self.headers = ISC_REQUEST_HEADERS
 
     def crawl(self, url: str) -> WebcrawlerISCRealEstateDetailsInfo:
         self.url = url
@@ -712,17 +1319,13 @@ class WebcrawlerISCRealEstateDetails:
         return info
 
     def make_request(self) -> Union[str, None]:
-        try:
-            response = self.session.get(self.url, headers=self.headers, timeout=10)
-        except Exception as e:
-            print(f"Error to get {self.url}. Error: ", e)
-            return None
-
-        if response.status_code != 200:
-            print(f"Get request to {self.url} succeed. Reason: {response.text}")
-            return None
-
-        return response.text
+        return http_get(
+            get_session(),
+            self.url,
+            self.headers,
+            timeout=10,
+            http_cache=self.http_cache,
+        )
 
     def get_images(self, page_soup) -> List[str]:
 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+Measure the search results endpoint for a search with 20 results and one with
+20,000. Compares the previous listing, every result serialized with a query per
+real estate, with keyset pages of results, the first one and one deep in the
+list. Runs against a throwaway test database created from the Django settings
+of the app.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from real_estate.models import Agency, RealEstate  # noqa: E402
+from search import services  # noqa: E402
+from search.factories import SearchFactory  # noqa: E402
+from search.models import SearchResultRealEstate  # noqa: E402
+
+SEARCH_SIZES = [20, 20_000]
+PAGE_LIMIT = 20
+DEEP_PAGE = 500
+REPEAT = 5
+
+
+def create_search(size: int):
+    agency_obj = Agency.objects.create(
+        name=f"Agency {size}", profile_url=f"https://agency/{size}"
+    )
+    real_estates = RealEstate.objects.bulk_create(
+        [
+            RealEstate(
+                reference_code=f"S{size}-{i:05d}",
+                property_type=RealEstate.PropertyType.APARTMENT,
+                transaction_type=RealEstate.TransactionType.BUY,
+                city="Blumenau",
+                neighborhood="Centro",
+                bedroom_quantity=2,
+                suite_quantity=1,
+                bathroom_quantity=1,
+                garage_slots_quantity=1,
+                price=450000.0,
+                area=75.0,
+                area_total=75.0,
+                cond_price=0.0,
+                available=True,
+                agency=agency_obj,
+                url=f"https://www.imoveis-sc.com.br/S{size}-{i:05d}",
+                thumb_url=["https://cdn/1.jpg", "https://cdn/2.jpg"],
+            )
+            for i in range(size)
+        ],
+        batch_size=2000,
+    )
+
+    search_obj = SearchFactory()
+    # a page of a crawl per statement, like a crawl stores them
+    for start in range(0, size, PAGE_LIMIT):
+        SearchResultRealEstate.objects.bulk_create(
+            [
+                SearchResultRealEstate(search=search_obj, real_estate=real_estate)
+                for real_estate in real_estates[start : start + PAGE_LIMIT]
+            ]
+        )
+    connection.cursor().execute("ANALYZE")
+    return search_obj
+
+
+def list_every_result(search_obj) -> int:
+    """Previous listing, the real estate of every result is a query"""
+    data = []
+    for result in SearchResultRealEstate.objects.filter(search=search_obj):
+        data.append((result.real_estate.id, result.real_estate.price))
+    return len(data)
+
+
+def list_page(search_obj, cursor=None) -> int:
+    queryset = services.list_search_result(str(search_obj.id))
+    page = services.search_result_paginator.paginate(
+        queryset, {"limit": PAGE_LIMIT, "cursor": cursor}
+    )
+    return len(services.serialize_search_result(page)["data"])
+
+
+def get_deep_cursor(search_obj):
+    """Cursor of the page DEEP_PAGE, or of the last page of a small search"""
+    queryset = services.list_search_result(str(search_obj.id))
+    cursor = None
+    for _ in range(DEEP_PAGE - 1):
+        page = services.search_result_paginator.paginate(
+            queryset, {"limit": PAGE_LIMIT, "cursor": cursor, "total": False}
+        )
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    return cursor
+
+
+def measure(run) -> tuple:
+    elapsed = []
+    for _ in range(REPEAT):
+        queries = []
+        with connection.execute_wrapper(
+            lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+        ):
+            start = time.perf_counter()
+            items = run()
+            elapsed.append(time.perf_counter() - start)
+    return min(elapsed), len(queries), items
+
+
+if __name__ == "__main__":
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"{'results':>8} {'mode':>16} {'ms':>9} {'queries':>8} {'items':>6}")
+        for size in SEARCH_SIZES:
+            search_obj = create_search(size)
+            deep_cursor = get_deep_cursor(search_obj)
+            runs = [
+                ("every result", lambda: list_every_result(search_obj)),
+                ("first page", lambda: list_page(search_obj)),
+                ("deep page", lambda: list_page(search_obj, deep_cursor)),
+            ]
+            for name, run in runs:
+                elapsed, queries, items = measure(run)
+                print(
+                    f"{size:>8} {name:>16} {elapsed * 1000:>9.1f} "
+                    f"{queries:>8} {items:>6}"
+                )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
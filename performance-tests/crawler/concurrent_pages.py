@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+Measure wall-clock time of WebcrawlerISCRealEstate.crawl() against a local stub server.
+The stub server answers every result page after a fixed latency, so the numbers show
+how much of a crawl is spent waiting for the network as concurrency goes from 1 to 16.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from search.webcrawler_isc import (  # noqa: E402
+    WebsiteISCFilter,
+    WebcrawlerISCRealEstate,
+)
+
+NUM_PAGES = 40
+REAL_ESTATE_PER_PAGE = 20
+RESPONSE_LATENCY = 0.25
+CONCURRENCY_LIST = [1, 2, 4, 8, 16]
+
+ARTICLE_TEMPLATE = """
+<article class="imovel">
+    <div class="imovel-imagem carousel">
+        <img data-src="https://cdn.imoveis-sc.com.br/{code}/1.jpg">
+        <img data-src="https://cdn.imoveis-sc.com.br/{code}/2.jpg">
+    </div>
+    <div class="imovel-data">
+        <meta itemprop="model" content="Apartamento">
+        <meta itemprop="sku" content="{code}">
+        <meta itemprop="name" content="Apartamento com 2 quartos">
+        <meta itemprop="lowprice" content="450.000,00">
+        <h2><a href="https://www.imoveis-sc.com.br/blumenau/comprar/apartamento/centro/{code}">{code}</a></h2>
+        <div class="imovel-extra"><strong>Blumenau, Centro</strong></div>
+        <ul>
+            <li><i class="mdi mdi-bed-king-outline"></i><strong>2</strong> quartos</li>
+            <li><i class="mdi mdi-shower"></i><strong>1</strong> suíte</li>
+            <li><i class="mdi mdi-car"></i><strong>1</strong> vaga</li>
+            <li><i class="mdi mdi-arrow-expand"></i><strong>75</strong> m²</li>
+        </ul>
+        <a class="imovel-anunciante" href="https://www.imoveis-sc.com.br/imobiliaria/stub"
+           title="Imobiliaria Stub - 10" style="background-image: url(https://cdn/logo.png)"></a>
+    </div>
+</article>
+"""
+
+
+def build_page(page: int) -> bytes:
+    articles = "".join(
+        ARTICLE_TEMPLATE.format(code=f"STUB{page:03d}{i:02d}")
+        for i in range(REAL_ESTATE_PER_PAGE)
+    )
+    html = f"""
+    <html><body>
+        <div class="header-data">
+            <span class="lista-imovel-count">{NUM_PAGES * REAL_ESTATE_PER_PAGE}</span>
+        </div>
+        {articles}
+        <div class="navigation">Página {page} de {NUM_PAGES}</div>
+    </body></html>
+    """
+    return html.encode("utf-8")
+
+
+class StubISCHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        page = int(query.get("page", ["1"])[0])
+
+        time.sleep(RESPONSE_LATENCY)
+
+        body = build_page(page)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_crawl(base_url: str, max_workers: int) -> float:
+    isc_filter = WebsiteISCFilter(
+        property_type=["apartamento"],
+        transaction_type=["comprar"],
+        city="blumenau",
+        neighborhood=["centro"],
+        bedroom_quantity=["2"],
+        suite_quantity=["1"],
+        garage_slots_quantity=["1"],
+        min_price=100000,
+        max_price=900000,
+        min_area=30,
+        max_area=200,
+    )
+
+    crawler = WebcrawlerISCRealEstate(max_workers=max_workers)
+    crawler.base_url = base_url
+    crawler.set_filter(isc_filter)
+
+    start = time.perf_counter()
+    pages = [page_content.page for page_content in crawler.crawl()]
+    elapsed = time.perf_counter() - start
+
+    if pages != list(range(1, NUM_PAGES + 1)):
+        raise RuntimeError(f"Pages out of order: {pages}")
+
+    return elapsed
+
+
+if __name__ == "__main__":
+
+    # measure concurrency alone, the per host rate limiter would cap every run
+    os.environ.setdefault("ISC_RATE_LIMIT_RATE", "1000")
+    os.environ.setdefault("ISC_RATE_LIMIT_MAX_RATE", "1000")
+    os.environ.setdefault("ISC_RATE_LIMIT_BURST", "100")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubISCHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # the crawler prints every page, keep only the results table
+    results = []
+    for max_workers in CONCURRENCY_LIST:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed = run_crawl(base_url, max_workers)
+        results.append((max_workers, elapsed))
+
+    server.shutdown()
+
+    print(f"Pages: {NUM_PAGES} - Latency per page: {RESPONSE_LATENCY}s")
+    print(f"{'workers':>8} {'wall time (s)':>14} {'speedup':>8}")
+    baseline = results[0][1]
+    for max_workers, elapsed in results:
+        print(f"{max_workers:>8} {elapsed:>14.2f} {baseline / elapsed:>8.1f}x")
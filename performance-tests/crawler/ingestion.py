@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+Measure how many crawled listings per second crawl_isc_real_estate_search stores.
+Compares the previous ingestion, a few autocommitted queries per listing, with the
+page ingestion, a few queries and one transaction per result page, and the bulk
+load, every listing streamed with COPY and merged at once. Runs against a
+throwaway test database created from the Django settings of the app.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from real_estate.models import Agency, RealEstate  # noqa: E402
+from search.factories import SearchFactory  # noqa: E402
+from search.models import SearchResultRealEstate  # noqa: E402
+from search.bulk_load import bulk_load_real_estates  # noqa: E402
+from search.task import (  # noqa: E402
+    build_agency_object,
+    build_real_estate_object,
+    build_staging_row,
+    bulk_load_cursor,
+    store_real_estate_page,
+)
+from search.webcrawler_isc import (  # noqa: E402
+    WebsiteISCAgencyInfo,
+    WebsiteISCRealEstateInfo,
+)
+
+NUM_PAGES = 50
+REAL_ESTATE_PER_PAGE = 20
+NUM_AGENCIES = 5
+
+
+def build_pages(prefix: str):
+    pages = []
+    for page in range(NUM_PAGES):
+        real_estate_list = []
+        for i in range(REAL_ESTATE_PER_PAGE):
+            code = f"{prefix}{page:03d}{i:02d}"
+            agency = (
+                f"https://www.imoveis-sc.com.br/imobiliaria/{prefix}{i % NUM_AGENCIES}"
+            )
+            real_estate_list.append(
+                WebsiteISCRealEstateInfo(
+                    code=code,
+                    model="Apartamento",
+                    neighborhood="Centro",
+                    city="Blumenau",
+                    summary="",
+                    url=f"https://www.imoveis-sc.com.br/blumenau/comprar/apartamento/centro/{code}",
+                    bedrooms="2",
+                    suite="1",
+                    garage_slots="1",
+                    space="75",
+                    price="450.000,00",
+                    agency=WebsiteISCAgencyInfo(
+                        "Agency", agency, "https://cdn/logo.png"
+                    ),
+                    thumb_urls=[],
+                )
+            )
+        pages.append(real_estate_list)
+
+    return pages
+
+
+def store_per_listing(search_obj, real_estate_list) -> None:
+    """Ingestion before page batching, every query is autocommitted"""
+    for real_estate in real_estate_list:
+        try:
+            real_estate_obj = RealEstate.objects.get(reference_code=real_estate.code)
+        except RealEstate.DoesNotExist:
+            try:
+                agency_obj = Agency.objects.get(
+                    profile_url=real_estate.agency.profile_url
+                )
+            except Agency.DoesNotExist:
+                agency_obj = build_agency_object(real_estate)
+                agency_obj.save()
+
+            real_estate_obj = build_real_estate_object(real_estate, agency_obj.id)
+            real_estate_obj.save()
+
+        SearchResultRealEstate.objects.get_or_create(
+            search=search_obj, real_estate=real_estate_obj
+        )
+
+
+def store_per_page(search_obj, real_estate_list) -> None:
+    with transaction.atomic():
+        store_real_estate_page(search_obj, real_estate_list)
+
+
+def store_bulk(search_obj, pages) -> None:
+    rows = (
+        build_staging_row(real_estate)
+        for real_estate_list in pages
+        for real_estate in real_estate_list
+    )
+    with bulk_load_cursor() as cursor:
+        bulk_load_real_estates(cursor, search_obj.id, rows)
+
+
+def store_pages(store):
+    """Store function of a whole crawl, from one storing a page"""
+
+    def store_all(search_obj, pages):
+        for real_estate_list in pages:
+            store(search_obj, real_estate_list)
+
+    return store_all
+
+
+def run(name: str, store, prefix: str) -> None:
+    pages = build_pages(prefix)
+    listings = NUM_PAGES * REAL_ESTATE_PER_PAGE
+
+    # first crawl creates every listing, the second finds all of them stored
+    for crawl in ["new", "refresh"]:
+        search_obj = SearchFactory()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            store(search_obj, pages)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{name:12} {crawl:8} {elapsed:7.2f}s {listings / elapsed:9.1f} listings/s"
+        )
+
+
+if __name__ == "__main__":
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"{NUM_PAGES} pages of {REAL_ESTATE_PER_PAGE} listings")
+        run("per listing", store_pages(store_per_listing), "L")
+        run("per page", store_pages(store_per_page), "P")
+        run("bulk load", store_bulk, "B")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
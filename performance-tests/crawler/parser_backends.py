@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Compare the listing parser backends of WebcrawlerISCRealEstate on saved result pages.
+Pass the path of one or more saved pages, the fixture used by the tests is used by default.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from search.webcrawler_isc import (  # noqa: E402
+    WebcrawlerISCRealEstate,
+    WebsiteISCParser,
+)
+
+DEFAULT_PAGES = [
+    os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "app",
+        "search",
+        "tests",
+        "fixtures",
+        "isc_result_page.html",
+    )
+]
+MIN_DURATION = 3.0
+BACKENDS = [WebsiteISCParser.LEGACY, WebsiteISCParser.SINGLE_PASS]
+
+
+def benchmark_backend(parser: str, pages: list) -> float:
+    crawler = WebcrawlerISCRealEstate(parser=parser)
+
+    parsed_pages = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_DURATION:
+        for page in pages:
+            crawler.extract_info(page)
+            parsed_pages += 1
+
+    elapsed = time.perf_counter() - start
+
+    return parsed_pages / elapsed
+
+
+if __name__ == "__main__":
+
+    page_paths = sys.argv[1:] or DEFAULT_PAGES
+    pages = []
+    for page_path in page_paths:
+        with open(page_path, encoding="utf-8") as page_file:
+            pages.append(page_file.read())
+
+    print(f"Saved pages: {len(pages)}")
+    print(f"{'backend':>12} {'pages/s':>10}")
+
+    results = {}
+    for parser in BACKENDS:
+        results[parser] = benchmark_backend(parser, pages)
+        print(f"{parser:>12} {results[parser]:>10.1f}")
+
+    speedup = results[WebsiteISCParser.SINGLE_PASS] / results[WebsiteISCParser.LEGACY]
+    print(f"single pass speedup: {speedup:.1f}x")
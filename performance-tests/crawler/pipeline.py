@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+Measure a crawl that fetches, parses and stores result pages one after the other
+against the CrawlPipeline, where the three stages run at the same time. A local
+stub server answers every page after a fixed latency and storing a transaction
+of pages takes a fixed time plus a time per page, like a database would.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from search.pipeline import CrawlPipeline, get_parse_executor  # noqa: E402
+from search.webcrawler_isc import (  # noqa: E402
+    WebsiteISCFilter,
+    WebcrawlerISCRealEstate,
+)
+
+NUM_PAGES = 60
+REAL_ESTATE_PER_PAGE = 50
+RESPONSE_LATENCY = 0.1
+FETCH_WORKERS = 4
+# seconds to store a page and to commit a transaction of pages
+WRITE_SECONDS_PER_PAGE = 0.02
+WRITE_SECONDS_PER_TRANSACTION = 0.02
+
+ARTICLE_TEMPLATE = """
+<article class="imovel">
+    <div class="imovel-imagem carousel">
+        <img data-src="https://cdn.imoveis-sc.com.br/{code}/1.jpg">
+        <img data-src="https://cdn.imoveis-sc.com.br/{code}/2.jpg">
+    </div>
+    <div class="imovel-data">
+        <meta itemprop="model" content="Apartamento">
+        <meta itemprop="sku" content="{code}">
+        <meta itemprop="name" content="Apartamento com 2 quartos">
+        <meta itemprop="lowprice" content="450.000,00">
+        <h2><a href="https://www.imoveis-sc.com.br/blumenau/comprar/apartamento/centro/{code}">{code}</a></h2>
+        <div class="imovel-extra"><strong>Blumenau, Centro</strong></div>
+        <ul>
+            <li><i class="mdi mdi-bed-king-outline"></i><strong>2</strong> quartos</li>
+            <li><i class="mdi mdi-shower"></i><strong>1</strong> suíte</li>
+            <li><i class="mdi mdi-car"></i><strong>1</strong> vaga</li>
+            <li><i class="mdi mdi-arrow-expand"></i><strong>75</strong> m²</li>
+        </ul>
+        <a class="imovel-anunciante" href="https://www.imoveis-sc.com.br/imobiliaria/stub"
+           title="Imobiliaria Stub - 10" style="background-image: url(https://cdn/logo.png)"></a>
+    </div>
+</article>
+"""
+
+
+def build_page(page: int) -> bytes:
+    articles = "".join(
+        ARTICLE_TEMPLATE.format(code=f"STUB{page:03d}{i:02d}")
+        for i in range(REAL_ESTATE_PER_PAGE)
+    )
+    html = f"""
+    <html><body>
+        <div class="header-data">
+            <span class="lista-imovel-count">{NUM_PAGES * REAL_ESTATE_PER_PAGE}</span>
+        </div>
+        {articles}
+        <div class="navigation">Página {page} de {NUM_PAGES}</div>
+    </body></html>
+    """
+    return html.encode("utf-8")
+
+
+class StubISCHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        page = int(query.get("page", ["1"])[0])
+
+        time.sleep(RESPONSE_LATENCY)
+
+        body = build_page(page)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_crawler(base_url: str) -> WebcrawlerISCRealEstate:
+    isc_filter = WebsiteISCFilter(
+        property_type=["apartamento"],
+        transaction_type=["comprar"],
+        city="blumenau",
+        neighborhood=["centro"],
+        bedroom_quantity=["2"],
+        suite_quantity=["1"],
+        garage_slots_quantity=["1"],
+        min_price=100000,
+        max_price=900000,
+        min_area=30,
+        max_area=200,
+    )
+
+    crawler = WebcrawlerISCRealEstate(max_workers=FETCH_WORKERS)
+    crawler.base_url = base_url
+    crawler.set_filter(isc_filter)
+    return crawler
+
+
+def write_pages(page_contents: list, written_pages: list) -> None:
+    time.sleep(
+        WRITE_SECONDS_PER_TRANSACTION + WRITE_SECONDS_PER_PAGE * len(page_contents)
+    )
+    written_pages += [page_content.page for page_content in page_contents]
+
+
+def run_sequential(base_url: str):
+    crawler = build_crawler(base_url)
+    written_pages = []
+
+    start = time.perf_counter()
+    for page_content in crawler.crawl():
+        write_pages([page_content], written_pages)
+    elapsed = time.perf_counter() - start
+
+    check_pages(written_pages)
+    return elapsed, None
+
+
+def run_pipeline(base_url: str, parse_processes: int, write_batch_pages: int):
+    crawler = build_crawler(base_url)
+    written_pages = []
+    pipeline = CrawlPipeline(
+        crawler,
+        fetch_workers=FETCH_WORKERS,
+        parse_processes=parse_processes,
+        write_batch_pages=write_batch_pages,
+    )
+
+    # worker processes are started once per process, not per crawl
+    get_parse_executor(parse_processes).submit(abs, 0).result()
+
+    start = time.perf_counter()
+    pipeline.run(lambda page_contents: write_pages(page_contents, written_pages))
+    elapsed = time.perf_counter() - start
+
+    check_pages(written_pages)
+    return elapsed, pipeline.get_stats()
+
+
+@contextlib.contextmanager
+def silence_stdout():
+    """Send prints to devnull, including the ones of parse worker processes"""
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(stdout_fd, 1)
+            os.close(stdout_fd)
+
+
+def check_pages(written_pages: list) -> None:
+    if written_pages != list(range(1, NUM_PAGES + 1)):
+        raise RuntimeError(f"Pages out of order: {written_pages}")
+
+
+if __name__ == "__main__":
+
+    # measure the stages alone, the per host rate limiter would cap every run
+    os.environ.setdefault("ISC_RATE_LIMIT_RATE", "1000")
+    os.environ.setdefault("ISC_RATE_LIMIT_MAX_RATE", "1000")
+    os.environ.setdefault("ISC_RATE_LIMIT_BURST", "100")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubISCHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    runs = [
+        ("sequential", lambda: run_sequential(base_url)),
+        ("pipeline, parse in thread", lambda: run_pipeline(base_url, 0, 1)),
+        ("pipeline, 2 parse processes", lambda: run_pipeline(base_url, 2, 1)),
+        ("pipeline, 2 processes, batch 5", lambda: run_pipeline(base_url, 2, 5)),
+    ]
+
+    # the crawler prints every page, keep only the results table
+    results = []
+    for name, run in runs:
+        with silence_stdout():
+            elapsed, stats = run()
+        results.append((name, elapsed, stats))
+
+    server.shutdown()
+
+    print(
+        f"Pages: {NUM_PAGES} - Latency per page: {RESPONSE_LATENCY}s - "
+        f"Fetch workers: {FETCH_WORKERS}"
+    )
+    print(f"{'mode':>32} {'wall time (s)':>14} {'pages/s':>8}")
+    for name, elapsed, stats in results:
+        print(f"{name:>32} {elapsed:>14.2f} {NUM_PAGES / elapsed:>8.1f}")
+
+    print("\nStage stats of the last run")
+    for stage, stage_stats in results[-1][2].items():
+        print(f"{stage:>8} {stage_stats}")
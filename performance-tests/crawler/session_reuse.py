@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Compare a new requests session per search, as the crawlers used to do, with the shared
+pooled session from webcrawler_http. The stub server keeps connections alive and
+answers gzip when asked, so the numbers show connection setup and bytes per page.
+Pages served are the saved result page used by the crawler tests.
+"""
+
+import gzip
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from search.webcrawler_http import HTTPSessionFactory  # noqa: E402
+
+NUM_SEARCHES = 40
+PAGES_PER_SEARCH = 5
+# fixed cost of a new connection, like a TCP + TLS handshake to the portal
+CONNECTION_SETUP_LATENCY = 0.02
+PAGE_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "app",
+    "search",
+    "tests",
+    "fixtures",
+    "isc_result_page.html",
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written apart, avoid the delayed ACK wait of keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        time.sleep(CONNECTION_SETUP_LATENCY)
+        super().setup()
+
+    def do_GET(self):
+        body = self.server.page
+        compressed = "gzip" in self.headers.get("accept-encoding", "")
+        if compressed:
+            body = gzip.compress(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_new_session_per_search(url: str) -> (float, int):
+    bytes_received = 0
+    start = time.perf_counter()
+    for _ in range(NUM_SEARCHES):
+        session = requests.session()
+        for page in range(PAGES_PER_SEARCH):
+            # identity is what the crawlers sent, they never asked for compression
+            response = session.get(
+                f"{url}?page={page}", headers={"accept-encoding": "identity"}
+            )
+            bytes_received += response.raw.tell()
+        session.close()
+
+    return time.perf_counter() - start, bytes_received
+
+
+def run_shared_session(url: str) -> (float, dict):
+    session_factory = HTTPSessionFactory()
+    start = time.perf_counter()
+    for _ in range(NUM_SEARCHES):
+        for page in range(PAGES_PER_SEARCH):
+            session_factory.get_session().get(f"{url}?page={page}")
+
+    return time.perf_counter() - start, session_factory.get_stats()
+
+
+if __name__ == "__main__":
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    with open(PAGE_PATH, "rb") as page_file:
+        server.page = page_file.read()
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    new_session_time, new_session_bytes = run_new_session_per_search(url)
+    shared_time, shared_stats = run_shared_session(url)
+
+    server.shutdown()
+
+    print(
+        f"Searches: {NUM_SEARCHES} - Pages per search: {PAGES_PER_SEARCH} - "
+        f"Connection setup: {CONNECTION_SETUP_LATENCY}s"
+    )
+    print(f"{'':>22} {'wall time (s)':>14} {'connections':>12} {'KB received':>12}")
+    print(
+        f"{'session per search':>22} {new_session_time:>14.2f} {NUM_SEARCHES:>12} "
+        f"{new_session_bytes / 1024:>12.0f}"
+    )
+    print(
+        f"{'shared pooled session':>22} {shared_time:>14.2f} "
+        f"{shared_stats['connections']:>12} "
+        f"{shared_stats['bytes_received'] / 1024:>12.0f}"
+    )
+    print(f"Shared session stats: {shared_stats}")
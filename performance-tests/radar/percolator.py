@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""
+Measure how fast new listings are matched against the filters of 100k radars
+by the RadarPercolator, against checking every radar filter one by one. Radars
+and listings are random, spread over the cities and neighborhoods below. No
+database is used, filters and listings are never saved.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from radar.percolator import RadarPercolator  # noqa: E402
+from real_estate.models import RealEstate  # noqa: E402
+from search.models import Filter, normalize_place_name, quantity_options  # noqa: E402
+
+NUM_RADARS = 100_000
+NUM_LISTINGS = 20_000
+# listings checked against every radar one by one, it is slow
+NUM_LISTINGS_SCAN = 20
+NUM_CITIES = 30
+NEIGHBORHOODS_PER_CITY = 40
+
+PROPERTY_TYPES = list(RealEstate.PropertyType.values)
+TRANSACTION_TYPES = list(RealEstate.TransactionType.values)
+
+
+def random_quantities(rng: random.Random) -> list:
+    if rng.random() < 0.3:
+        return [0]
+    return rng.sample(range(1, 6), rng.randint(1, 3))
+
+
+def build_radar_filter(rng: random.Random) -> Filter:
+    city = rng.randrange(NUM_CITIES)
+    neighborhoods = []
+    if rng.random() < 0.8:
+        neighborhoods = [
+            f"Neighborhood {city}-{n}"
+            for n in rng.sample(range(NEIGHBORHOODS_PER_CITY), rng.randint(1, 4))
+        ]
+
+    min_price = rng.randrange(50_000, 1_500_000, 10_000)
+    min_area = rng.randrange(20, 200, 5)
+    return Filter(
+        property_type=rng.sample(PROPERTY_TYPES, rng.randint(1, 2)),
+        transaction_type=rng.sample(TRANSACTION_TYPES, rng.randint(1, 2)),
+        city=[f"City {city}"],
+        neighborhood=neighborhoods,
+        bedroom_quantity=random_quantities(rng),
+        suite_quantity=random_quantities(rng),
+        bathroom_quantity=[0],
+        garage_slots_quantity=random_quantities(rng),
+        min_price=min_price,
+        max_price=min_price + rng.randrange(50_000, 1_000_000, 10_000),
+        min_area=min_area,
+        max_area=min_area + rng.randrange(20, 200, 5),
+    )
+
+
+def build_listing(rng: random.Random) -> RealEstate:
+    city = rng.randrange(NUM_CITIES)
+    return RealEstate(
+        property_type=rng.choice(PROPERTY_TYPES),
+        transaction_type=rng.choice(TRANSACTION_TYPES),
+        city=f"city {city}",
+        neighborhood=f"neighborhood {city}-{rng.randrange(NEIGHBORHOODS_PER_CITY)}",
+        bedroom_quantity=rng.randint(0, 6),
+        suite_quantity=rng.randint(0, 3),
+        garage_slots_quantity=rng.randint(0, 4),
+        price=float(rng.randrange(50_000, 2_000_000, 1_000)),
+        area=float(rng.randrange(20, 400)),
+        available=True,
+    )
+
+
+def filter_finds(filter_obj: Filter, real_estate: RealEstate) -> bool:
+    """Straightforward check of a filter, what the percolator does for every radar"""
+    if normalize_place_name(real_estate.city) not in {
+        normalize_place_name(city) for city in filter_obj.city
+    }:
+        return False
+    if filter_obj.neighborhood and normalize_place_name(
+        real_estate.neighborhood
+    ) not in {normalize_place_name(name) for name in filter_obj.neighborhood}:
+        return False
+    if real_estate.property_type not in filter_obj.property_type:
+        return False
+    if real_estate.transaction_type not in filter_obj.transaction_type:
+        return False
+
+    for field in ["bedroom_quantity", "suite_quantity", "garage_slots_quantity"]:
+        options = quantity_options(getattr(filter_obj, field))
+        if options is not None and min(getattr(real_estate, field), 5) not in options:
+            return False
+
+    return (
+        filter_obj.min_price <= real_estate.price <= filter_obj.max_price
+        and filter_obj.min_area <= real_estate.area <= filter_obj.max_area
+    )
+
+
+if __name__ == "__main__":
+    rng = random.Random(42)
+    radar_filters = [(i, build_radar_filter(rng)) for i in range(NUM_RADARS)]
+    listings = [build_listing(rng) for _ in range(NUM_LISTINGS)]
+
+    start = time.perf_counter()
+    percolator = RadarPercolator(radar_filters)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = [percolator.match(listing) for listing in listings]
+    percolator_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_matches = [
+        [
+            radar_id
+            for radar_id, filter_obj in radar_filters
+            if filter_finds(filter_obj, listing)
+        ]
+        for listing in listings[:NUM_LISTINGS_SCAN]
+    ]
+    scan_seconds = time.perf_counter() - start
+
+    for listing_matches, listing_scan_matches in zip(matches, scan_matches):
+        if sorted(listing_matches) != listing_scan_matches:
+            raise RuntimeError("Percolator and scan found different radars")
+
+    percolator_us = percolator_seconds / NUM_LISTINGS * 1e6
+    scan_us = scan_seconds / NUM_LISTINGS_SCAN * 1e6
+    total_matches = sum(len(listing_matches) for listing_matches in matches)
+    print(
+        f"Radars: {NUM_RADARS} - Cities: {NUM_CITIES} - "
+        f"Neighborhoods per city: {NEIGHBORHOODS_PER_CITY}"
+    )
+    print(
+        f"Percolator built in {build_seconds:.2f}s, {len(percolator.buckets)} buckets"
+    )
+    print(f"Radars matched per listing: {total_matches / NUM_LISTINGS:.1f}")
+    print(f"{'mode':>24} {'listings':>9} {'us/listing':>11} {'listings/s':>11}")
+    print(
+        f"{'scan every radar':>24} {NUM_LISTINGS_SCAN:>9} {scan_us:>11.1f} "
+        f"{1e6 / scan_us:>11.0f}"
+    )
+    print(
+        f"{'percolator':>24} {NUM_LISTINGS:>9} {percolator_us:>11.1f} "
+        f"{1e6 / percolator_us:>11.0f}"
+    )